@@ -0,0 +1,3 @@
+# =========================================================
+# Streamlitページ間で共有する共通モジュール
+# =========================================================
@@ -0,0 +1,327 @@
+# =========================================================
+# Cortex Agent APIクライアント（タイムアウト・リトライ・サーキットブレーカー）
+# =========================================================
+# - エラーをHTTPステータス・例外内容から分類（429 / タイムアウト / 5xx / 4xx など）
+# - 冪等な呼び出しのみ、ジッター付き指数バックオフでリトライ（Retry-Afterを優先）
+# - 連続失敗時はサーキットブレーカーで一定時間呼び出しを遮断し、負荷を抑える
+# - 呼び出しごとに所要時間・試行回数・エラー種別を記録する
+
+import json
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from common.agent_response import AgentEvent, iter_agent_events
+
+# エラー種別
+ERROR_THROTTLED = "throttled"
+ERROR_TIMEOUT = "timeout"
+ERROR_SERVER = "server_error"
+ERROR_AUTH = "auth_error"
+ERROR_BAD_REQUEST = "bad_request"
+ERROR_RESPONSE = "invalid_response"
+ERROR_CIRCUIT_OPEN = "circuit_open"
+ERROR_UNKNOWN = "unknown"
+
+RETRYABLE_ERRORS = {ERROR_THROTTLED, ERROR_TIMEOUT, ERROR_SERVER}
+
+ERROR_MESSAGES = {
+    ERROR_THROTTLED: "Cortex Agentが混雑しています（429）。しばらく待ってから再度お試しください。",
+    ERROR_TIMEOUT: "Cortex Agentの応答がタイムアウトしました。質問を短くするか、時間をおいて再度お試しください。",
+    ERROR_SERVER: "Cortex Agentでサーバーエラーが発生しました。時間をおいて再度お試しください。",
+    ERROR_AUTH: "Cortex Agentへのアクセス権限がありません。ロールとAgentの権限を確認してください。",
+    ERROR_BAD_REQUEST: "Cortex Agentへのリクエストが不正です。Agent名・ツール設定を確認してください。",
+    ERROR_RESPONSE: "Cortex Agentの応答を解析できませんでした。",
+    ERROR_CIRCUIT_OPEN: "Cortex Agentが不安定なため、一時的に呼び出しを停止しています。",
+    ERROR_UNKNOWN: "Cortex Agentの呼び出しに失敗しました。",
+}
+
+
+class AgentAPIError(Exception):
+    """分類済みのAgent API呼び出しエラー"""
+
+    def __init__(self, kind: str, message: str = "", status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message or kind)
+        self.kind = kind
+        self.status = status
+        self.retry_after = retry_after
+        self.detail = message
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind in RETRYABLE_ERRORS
+
+    def user_message(self) -> str:
+        message = ERROR_MESSAGES.get(self.kind, ERROR_MESSAGES[ERROR_UNKNOWN])
+        if self.kind == ERROR_CIRCUIT_OPEN and self.retry_after:
+            message += f"（約{int(self.retry_after)}秒後に再開）"
+        return message
+
+
+def _header(headers: Any, name: str) -> Optional[str]:
+    if not isinstance(headers, dict):
+        return None
+    for key, value in headers.items():
+        if str(key).lower() == name.lower():
+            return value
+    return None
+
+
+def _parse_retry_after(value: Any) -> Optional[float]:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_status(status: int, content: Any = None, headers: Any = None) -> AgentAPIError:
+    """HTTPステータスからエラーを分類"""
+    detail = str(content)[:500] if content else ""
+    if status == 429:
+        return AgentAPIError(ERROR_THROTTLED, detail, status, _parse_retry_after(_header(headers, "Retry-After")))
+    if status in (408, 504):
+        return AgentAPIError(ERROR_TIMEOUT, detail, status)
+    if status >= 500:
+        return AgentAPIError(ERROR_SERVER, detail, status, _parse_retry_after(_header(headers, "Retry-After")))
+    if status in (401, 403):
+        return AgentAPIError(ERROR_AUTH, detail, status)
+    if status >= 400:
+        return AgentAPIError(ERROR_BAD_REQUEST, detail, status)
+    return AgentAPIError(ERROR_UNKNOWN, detail, status)
+
+
+def classify_exception(exc: Exception) -> AgentAPIError:
+    """トランスポート例外を分類"""
+    if isinstance(exc, AgentAPIError):
+        return exc
+    text = str(exc).lower()
+    if isinstance(exc, TimeoutError) or "timeout" in text or "timed out" in text:
+        return AgentAPIError(ERROR_TIMEOUT, str(exc))
+    if "429" in text or "too many requests" in text:
+        return AgentAPIError(ERROR_THROTTLED, str(exc), 429)
+    return AgentAPIError(ERROR_UNKNOWN, str(exc))
+
+
+def classify_stream_error(data: Any) -> AgentAPIError:
+    """ストリーム中の error イベントを分類"""
+    data = data if isinstance(data, dict) else {"message": str(data)}
+    code = str(data.get("code", ""))
+    message = data.get("message", "")
+    if code.isdigit():
+        error = classify_status(int(code), message)
+        if error.kind != ERROR_UNKNOWN:
+            return error
+    return AgentAPIError(ERROR_RESPONSE, f"{code} {message}".strip())
+
+
+class CircuitBreaker:
+    """連続失敗でオープンし、一定時間後に1件だけ試行するサーキットブレーカー"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_sec: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_sec = reset_timeout_sec
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def remaining_open_sec(self) -> float:
+        return max(0.0, self.reset_timeout_sec - (time.monotonic() - self.opened_at))
+
+    def before_call(self):
+        """呼び出し可否を判定（不可の場合は ERROR_CIRCUIT_OPEN を送出）"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.remaining_open_sec() > 0:
+                    raise AgentAPIError(ERROR_CIRCUIT_OPEN, retry_after=self.remaining_open_sec())
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    raise AgentAPIError(ERROR_CIRCUIT_OPEN, retry_after=self.reset_timeout_sec)
+                self._probe_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: AgentAPIError):
+        # リクエスト不正・権限エラーはサービス劣化ではないため数えない
+        if not error.retryable:
+            with self._lock:
+                self._probe_in_flight = False
+                if self.state == self.HALF_OPEN:
+                    self.state = self.CLOSED
+            return
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+@dataclass
+class RetryPolicy:
+    """ジッター付き指数バックオフ"""
+    max_attempts: int = 3
+    base_delay_sec: float = 1.0
+    max_delay_sec: float = 10.0
+
+    def delay(self, attempt: int, error: AgentAPIError) -> float:
+        if error.retry_after is not None:
+            return min(error.retry_after, self.max_delay_sec)
+        # フルジッター: [0, base * 2^attempt] の一様乱数
+        return random.uniform(0, min(self.max_delay_sec, self.base_delay_sec * (2 ** attempt)))
+
+
+@dataclass
+class AgentCallRecord:
+    """1回のAgent呼び出しの計測結果"""
+    started_at: str
+    attempts: int = 0
+    latency_ms: float = 0.0
+    first_event_ms: Optional[float] = None
+    status: Optional[int] = None
+    error_kind: Optional[str] = None
+    error_detail: str = ""
+    events: int = 0
+
+
+@dataclass
+class AgentClient:
+    """Cortex Agent API (/api/v2/cortex/agent:run) のクライアント"""
+    transport: Callable[..., Any]
+    endpoint: str = "/api/v2/cortex/agent:run"
+    timeout_ms: int = 50000
+    retry_policy: RetryPolicy = field(default_factory=RetryPolicy)
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    history_size: int = 200
+    sleep: Callable[[float], None] = time.sleep
+    records: Deque[AgentCallRecord] = field(default_factory=deque)
+
+    def run(self, payload: Dict[str, Any], idempotent: bool = True, endpoint: Optional[str] = None) -> Iterator[AgentEvent]:
+        """Agentを呼び出し、イベントのイテレータを返す
+
+        失敗時は AgentAPIError を送出する。リトライは最初のイベントを受信する前に
+        限り行い、ストリームの途中で失敗した場合はそのままエラーとして扱う。
+        サーキットブレーカーへの成功の記録は応答を受信した時点で行う（呼び出し側がイベントを
+        最後まで読まずに中断しても、HALF_OPEN の試行中の状態が残らないようにする）。
+        """
+        record = AgentCallRecord(started_at=datetime.now().isoformat(timespec="seconds"))
+        self._append(record)
+        start = time.perf_counter()
+        max_attempts = self.retry_policy.max_attempts if idempotent else 1
+
+        last_error: Optional[AgentAPIError] = None
+        for attempt in range(max_attempts):
+            record.attempts = attempt + 1
+            try:
+                self.breaker.before_call()
+                response = self.transport(
+                    "POST", endpoint or self.endpoint, {}, {}, payload, {}, self.timeout_ms
+                )
+                events = self._check_response(response, record)
+                self.breaker.record_success()
+                return self._iter_with_metrics(events, record, start)
+            except Exception as exc:
+                error = classify_exception(exc)
+                if error.kind == ERROR_CIRCUIT_OPEN and last_error is not None:
+                    # リトライ中にブレーカーが開いた場合は元のエラーを返す
+                    error = last_error
+                elif error.kind != ERROR_CIRCUIT_OPEN:
+                    self.breaker.record_failure(error)
+                last_error = error
+                record.error_kind = error.kind
+                record.error_detail = error.detail[:200]
+                record.status = error.status or record.status
+                if not error.retryable or attempt + 1 >= max_attempts or self.breaker.state == CircuitBreaker.OPEN:
+                    record.latency_ms = (time.perf_counter() - start) * 1000
+                    raise error
+                self.sleep(self.retry_policy.delay(attempt, error))
+
+        raise AgentAPIError(ERROR_UNKNOWN)
+
+    def request(self, method: str, endpoint: str, payload: Optional[Dict[str, Any]] = None) -> Any:
+        """ストリームでない補助API（スレッド作成など）を呼び出してJSONを返す"""
+        self.breaker.before_call()
+        try:
+            response = self.transport(method, endpoint, {}, {}, payload or {}, {}, self.timeout_ms)
+        except Exception as exc:
+            error = classify_exception(exc)
+            self.breaker.record_failure(error)
+            raise error
+        if isinstance(response, dict) and "status" in response:
+            if response["status"] >= 300:
+                error = classify_status(response["status"], response.get("content"), response.get("headers"))
+                self.breaker.record_failure(error)
+                raise error
+            response = response.get("content")
+        self.breaker.record_success()
+        if isinstance(response, (str, bytes)):
+            try:
+                return json.loads(response)
+            except json.JSONDecodeError:
+                raise AgentAPIError(ERROR_RESPONSE, str(response)[:200])
+        return response
+
+    def _check_response(self, response: Any, record: AgentCallRecord) -> Iterator[AgentEvent]:
+        if not response:
+            raise AgentAPIError(ERROR_RESPONSE, "empty response")
+        if isinstance(response, dict) and "status" in response:
+            record.status = response["status"]
+            if response["status"] != 200:
+                raise classify_status(response["status"], response.get("content"), response.get("headers"))
+        return iter_agent_events(response)
+
+    def _iter_with_metrics(self, events: Iterator[AgentEvent], record: AgentCallRecord, start: float) -> Iterator[AgentEvent]:
+        try:
+            for event_type, data in events:
+                if record.first_event_ms is None:
+                    record.first_event_ms = (time.perf_counter() - start) * 1000
+                record.events += 1
+                if event_type == "error":
+                    raise classify_stream_error(data)
+                yield event_type, data
+        except Exception as exc:
+            error = classify_exception(exc)
+            self.breaker.record_failure(error)
+            record.error_kind = error.kind
+            record.error_detail = error.detail[:200]
+            raise error
+        else:
+            record.error_kind = None
+            record.error_detail = ""
+        finally:
+            record.latency_ms = (time.perf_counter() - start) * 1000
+
+    def _append(self, record: AgentCallRecord):
+        self.records.append(record)
+        while len(self.records) > self.history_size:
+            self.records.popleft()
+
+    def metrics_rows(self) -> List[Dict[str, Any]]:
+        """直近の呼び出し記録を表示用の行リストで取得（新しい順）"""
+        return [
+            {
+                "started_at": r.started_at,
+                "attempts": r.attempts,
+                "latency_ms": round(r.latency_ms, 1),
+                "first_event_ms": round(r.first_event_ms, 1) if r.first_event_ms is not None else None,
+                "status": r.status,
+                "error": r.error_kind or "",
+                "events": r.events,
+            }
+            for r in reversed(self.records)
+        ]
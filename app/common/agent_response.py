@@ -0,0 +1,165 @@
+# =========================================================
+# Cortex Agent レスポンスの解析
+# =========================================================
+# SiS の _snowflake.send_snow_api_request はストリーミングに対応しておらず、
+# /api/v2/cortex/agent:run の応答本文（Server-Sent Events）をすべて受信してから返す。
+# そのため最初のテキスト差分の時点で表示を始めることはできず（体感の待ち時間は短くならない）、
+# ここでは受信済みの本文をイベント単位に分けて、本文・引用・メタデータを組み立てるだけにする。
+# - iter_agent_events: 応答（イベントリスト / SSE文字列 / JSON）を (event_type, data) に正規化
+# - AgentResponse: イベントを順に適用し、本文・引用・スレッドのメタデータを保持
+
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+AgentEvent = Tuple[str, Any]
+
+
+def _decode_data(data: Any) -> Any:
+    if isinstance(data, str):
+        try:
+            return json.loads(data)
+        except (json.JSONDecodeError, TypeError):
+            return data
+    return data
+
+
+def _iter_event_list(events: Iterable[Any]) -> Iterator[AgentEvent]:
+    """パース済みイベント（dictのリスト）を正規化"""
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        data = _decode_data(event.get("data", {}))
+        if "session_id" in event and isinstance(data, dict):
+            data.setdefault("session_id", event["session_id"])
+        yield event.get("event", ""), data
+
+
+def parse_sse(text: str) -> List[AgentEvent]:
+    """受信済みのSSE本文をイベントのリストに分割"""
+    events: List[AgentEvent] = []
+    for block in text.replace("\r\n", "\n").split("\n\n"):
+        event_type = ""
+        data_lines = []
+        for line in block.split("\n"):
+            if not line or line.startswith(":"):
+                continue
+            name, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if name == "event":
+                event_type = value
+            elif name == "data":
+                data_lines.append(value)
+        if event_type or data_lines:
+            events.append((event_type or "message", _decode_data("\n".join(data_lines))))
+    return events
+
+
+def iter_agent_events(response: Any) -> Iterator[AgentEvent]:
+    """APIレスポンスを (event_type, data) のイテレータに変換"""
+    if response is None:
+        return
+    if isinstance(response, dict) and "status" in response and "content" in response:
+        response = response["content"]
+
+    if isinstance(response, list):
+        yield from _iter_event_list(response)
+    elif isinstance(response, (str, bytes)):
+        text = response.decode("utf-8", errors="replace") if isinstance(response, bytes) else response
+        stripped = text.lstrip()
+        if stripped.startswith("["):
+            try:
+                yield from _iter_event_list(json.loads(stripped))
+                return
+            except json.JSONDecodeError:
+                pass
+        elif stripped.startswith("{"):
+            try:
+                yield "message", json.loads(stripped)
+                return
+            except json.JSONDecodeError:
+                pass
+        yield from parse_sse(text)
+    elif isinstance(response, dict):
+        yield "message", response
+
+
+class AgentResponse:
+    """Agentイベントを順に適用して応答を組み立てる"""
+
+    def __init__(self):
+        self.text_parts: Dict[int, str] = {}
+        self.citations: List[Dict[str, Any]] = []
+        self.session_id: Optional[str] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.metadata: Dict[str, Any] = {}
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts[i] for i in sorted(self.text_parts))
+
+    @classmethod
+    def from_events(cls, events: Iterable[AgentEvent]) -> "AgentResponse":
+        response = cls()
+        for event_type, data in events:
+            response.apply(event_type, data)
+        return response
+
+    def apply(self, event_type: str, data: Any):
+        if isinstance(data, dict) and data.get("session_id"):
+            self.session_id = data["session_id"]
+
+        if event_type == "response.text.delta":
+            if isinstance(data, dict):
+                index = data.get("content_index", 0)
+                self.text_parts[index] = self.text_parts.get(index, "") + data.get("text", "")
+
+        elif event_type == "response.text":
+            if isinstance(data, dict) and "text" in data:
+                # 完了イベントは差分の累積より優先する
+                self.text_parts[data.get("content_index", 0)] = data["text"]
+
+        elif event_type == "response.text.annotation":
+            if isinstance(data, dict) and "annotation" in data:
+                annotation = data["annotation"]
+                if annotation.get("type") == "cortex_search_citation":
+                    self.citations.append({
+                        'doc_id': annotation.get('doc_id', ''),
+                        'doc_title': annotation.get('doc_title', ''),
+                        'text': annotation.get('text', ''),
+                        'index': annotation.get('index', 0),
+                        'search_result_id': annotation.get('search_result_id', '')
+                    })
+
+        elif event_type == "metadata":
+            if isinstance(data, dict):
+                self.metadata.update(data)
+                # スレッド利用時、次のターンの parent_message_id に使う
+                if data.get("role") == "assistant" and data.get("message_id") is not None:
+                    self.metadata["assistant_message_id"] = data["message_id"]
+                elif data.get("role") == "user" and data.get("message_id") is not None:
+                    self.metadata["user_message_id"] = data["message_id"]
+
+        elif event_type == "error":
+            self.error = data if isinstance(data, dict) else {"message": str(data)}
+
+        elif event_type == "response":
+            if isinstance(data, dict):
+                for content_item in data.get("content", []) or []:
+                    if isinstance(content_item, dict) and content_item.get("type") == "citations":
+                        self.citations.extend(content_item.get("citations", []))
+                self.citations.extend(data.get("citations", []) or [])
+
+        elif event_type == "message":
+            # 非ストリーミング形式（messageフィールド）のレスポンス
+            if isinstance(data, dict) and "message" in data:
+                message_content = data["message"]
+                content = message_content.get("content")
+                if isinstance(content, str):
+                    self.text_parts[0] = content
+                elif isinstance(content, list):
+                    self.text_parts[0] = "".join(
+                        item.get("text", "")
+                        for item in content
+                        if isinstance(item, dict) and item.get("type") == "text"
+                    )
+                self.citations = message_content.get("citations") or data.get("citations") or self.citations
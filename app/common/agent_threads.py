@@ -0,0 +1,86 @@
+# =========================================================
+# Cortex Agent の会話スレッド管理
+# =========================================================
+# (ユーザー, 対象ファイル) ごとにスレッドを1つ作成し、2ターン目以降は
+# thread_id / parent_message_id と新しいメッセージだけを送信する。
+# 会話履歴はAgent側のスレッドに保持されるため、ルールや過去の発言を毎回送らない。
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+THREADS_ENDPOINT = "/api/v2/cortex/threads"
+
+
+@dataclass
+class AgentThread:
+    """1つの会話スレッドの状態"""
+    thread_id: Optional[str]
+    parent_message_id: int = 0
+    turns: int = 0
+
+    @property
+    def is_new(self) -> bool:
+        return self.turns == 0
+
+
+class AgentThreadManager:
+    """(user, selected_file) をキーにスレッドを作成・再利用する"""
+
+    def __init__(self, client, origin_application: str = "pension_fund_esg"):
+        self.client = client
+        self.origin_application = origin_application
+        self._threads: Dict[Tuple[str, str], AgentThread] = {}
+
+    def get(self, user: str, selected_file: Optional[str]) -> AgentThread:
+        """スレッドを取得（未作成の場合はAPIで作成）
+
+        作成に失敗した場合は thread_id=None の単発呼び出し用のスレッドを返し、保存しない
+        （次回の送信で作成をやり直す）。
+        """
+        key = (user, selected_file or "")
+        thread = self._threads.get(key)
+        if thread is None:
+            thread = AgentThread(thread_id=self._create_thread())
+            if thread.thread_id:
+                self._threads[key] = thread
+        return thread
+
+    def reset(self, user: str, selected_file: Optional[str] = None):
+        """スレッドを破棄（次回の送信で新しいスレッドを作成）"""
+        if selected_file is None:
+            for key in [k for k in self._threads if k[0] == user]:
+                del self._threads[key]
+        else:
+            self._threads.pop((user, selected_file or ""), None)
+
+    def record_turn(self, thread: AgentThread, metadata: Dict[str, Any]):
+        """応答の metadata イベントから次の parent_message_id を更新
+
+        assistant_message_id を受信できなかった場合は次のメッセージの親が分からないため、
+        スレッドを破棄する（次回の送信は新しいスレッド、または対象レポートを付けた単発の呼び出しになる）。
+        """
+        assistant_message_id = metadata.get("assistant_message_id")
+        if assistant_message_id is None:
+            self._forget(thread)
+            return
+        thread.parent_message_id = assistant_message_id
+        thread.turns += 1
+
+    def _forget(self, thread: AgentThread):
+        for key in [k for k, v in self._threads.items() if v is thread]:
+            del self._threads[key]
+        thread.thread_id = None
+
+    def _create_thread(self) -> Optional[str]:
+        """スレッドを作成（スレッドAPIが使えない場合は None を返し、単発の呼び出しにする）"""
+        try:
+            result = self.client.request(
+                "POST",
+                THREADS_ENDPOINT,
+                {"origin_application": self.origin_application},
+            )
+        except Exception:
+            return None
+        if isinstance(result, dict):
+            result = result.get("thread_id")
+        return str(result) if result is not None else None
@@ -0,0 +1,225 @@
+# =========================================================
+# ドキュメントカタログ
+# =========================================================
+# ファイル一覧を統合チャンクテーブル（全チャンク）に対する SELECT DISTINCT で取得せず、
+# レポート取り込み時に更新する DOCUMENT_CATALOG テーブルから取得する。
+# - 1ファイル1行（ファイル名・ソース・ページ数・チャンク数・サイズ・内容のハッシュ・取り込み日時）
+# - 一覧は全セッション共有のキャッシュに保持し、TTL経過時は変更トークン
+#   （件数と最終取り込み日時）が変わった場合だけ読み直す
+# - 同じプロセス内での取り込みは即座にキャッシュを無効化する
+
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from common.query_layer import QueryLayer, Statement
+from common.resources import get_session
+from common.statements import DOCUMENT_CHUNKS_TABLE
+
+CATALOG_TABLE = "DOCUMENT_CATALOG"
+CATALOG_DATABASE = "DEMO_DB"
+CATALOG_SCHEMA = "DEMO_SUSTAINABILITY"
+CATALOG_STAGE = "DOCUMENT_STAGE"
+DEFAULT_CATALOG_TTL_SEC = 300
+
+# コレクション（DOCUMENT_CHUNKS の COLLECTION 列の値）
+COLLECTION_STEWARDSHIP = "stewardship"
+COLLECTION_GLOBAL = "global"
+
+CATALOG_COLUMNS = [
+    "FILE_NAME", "RELATIVE_PATH", "SOURCE", "PAGE_COUNT", "CHUNK_COUNT",
+    "SIZE_BYTES", "CONTENT_HASH", "INGESTED_AT",
+]
+
+
+def content_hash(data: bytes) -> str:
+    """ファイル内容のハッシュ（ステージのDIRECTORYのMD5列と同じ形式）"""
+    return hashlib.md5(data).hexdigest()
+
+
+CATALOG_STATEMENTS = [
+    Statement(
+        "catalog_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + CATALOG_TABLE + """ (
+            COLLECTION STRING,
+            FILE_NAME STRING,
+            RELATIVE_PATH STRING,
+            SOURCE STRING,
+            PAGE_COUNT INT,
+            CHUNK_COUNT INT,
+            SIZE_BYTES INT,
+            CONTENT_HASH STRING,
+            INGESTED_AT TIMESTAMP_NTZ
+        )
+        """,
+    ),
+    Statement(
+        "catalog_list",
+        """
+        SELECT FILE_NAME, RELATIVE_PATH, SOURCE, PAGE_COUNT, CHUNK_COUNT,
+               SIZE_BYTES, CONTENT_HASH, INGESTED_AT
+        FROM {db}.{schema}.""" + CATALOG_TABLE + """
+        WHERE COLLECTION = ?
+        ORDER BY SOURCE, FILE_NAME
+        """,
+    ),
+    Statement(
+        # 変更トークン（件数と最終取り込み日時）
+        "catalog_token",
+        """
+        SELECT COUNT(*) || ':' || COALESCE(TO_VARCHAR(MAX(INGESTED_AT), 'YYYY-MM-DD HH24:MI:SS.FF3'), '')
+        FROM {db}.{schema}.""" + CATALOG_TABLE + """
+        WHERE COLLECTION = ?
+        """,
+    ),
+    Statement(
+        # カタログにないファイルを統合チャンクテーブルから登録（初回・ノートブックで取り込んだ分）
+        # params: [collection, collection]
+        "catalog_backfill",
+        """
+        INSERT INTO {db}.{schema}.""" + CATALOG_TABLE + """
+        SELECT v.COLLECTION, v.FILE_NAME, ANY_VALUE(v.RELATIVE_PATH), ANY_VALUE(v.SOURCE),
+               COUNT(DISTINCT v.PAGE_INDEX), COUNT(*),
+               ANY_VALUE(d.SIZE), ANY_VALUE(d.MD5), CURRENT_TIMESTAMP()::TIMESTAMP_NTZ
+        FROM {db}.{schema}.{chunk_catalog} v
+        LEFT JOIN DIRECTORY(@{db}.{schema}.{stage}) d
+          ON d.RELATIVE_PATH = v.RELATIVE_PATH
+        WHERE v.COLLECTION = ?
+          AND NOT EXISTS (
+              SELECT 1 FROM {db}.{schema}.""" + CATALOG_TABLE + """ c
+              WHERE c.COLLECTION = ? AND c.FILE_NAME = v.FILE_NAME
+          )
+        GROUP BY v.COLLECTION, v.FILE_NAME
+        """,
+    ),
+    Statement(
+        # params: [collection, ソース, サイズ, ハッシュ, relative_path]
+        "catalog_upsert",
+        """
+        MERGE INTO {db}.{schema}.""" + CATALOG_TABLE + """ c
+        USING (
+            SELECT ? AS COLLECTION, ANY_VALUE(FILE_NAME) AS FILE_NAME, ANY_VALUE(RELATIVE_PATH) AS RELATIVE_PATH,
+                   ? AS SOURCE, COUNT(DISTINCT PAGE_INDEX) AS PAGE_COUNT, COUNT(*) AS CHUNK_COUNT,
+                   ? AS SIZE_BYTES, ? AS CONTENT_HASH
+            FROM {db}.{schema}.{chunk_catalog}
+            WHERE RELATIVE_PATH = ?
+            HAVING COUNT(*) > 0
+        ) s
+        ON c.COLLECTION = s.COLLECTION AND c.FILE_NAME = s.FILE_NAME
+        WHEN MATCHED THEN UPDATE SET
+            RELATIVE_PATH = s.RELATIVE_PATH, SOURCE = s.SOURCE, PAGE_COUNT = s.PAGE_COUNT,
+            CHUNK_COUNT = s.CHUNK_COUNT, SIZE_BYTES = s.SIZE_BYTES, CONTENT_HASH = s.CONTENT_HASH,
+            INGESTED_AT = CURRENT_TIMESTAMP()::TIMESTAMP_NTZ
+        WHEN NOT MATCHED THEN INSERT
+            (COLLECTION, FILE_NAME, RELATIVE_PATH, SOURCE, PAGE_COUNT, CHUNK_COUNT, SIZE_BYTES, CONTENT_HASH, INGESTED_AT)
+            VALUES (s.COLLECTION, s.FILE_NAME, s.RELATIVE_PATH, s.SOURCE, s.PAGE_COUNT, s.CHUNK_COUNT,
+                    s.SIZE_BYTES, s.CONTENT_HASH, CURRENT_TIMESTAMP()::TIMESTAMP_NTZ)
+        """,
+    ),
+]
+
+
+class DocumentCatalog:
+    """カタログの読み込み（TTL + 変更トークンでキャッシュ）と取り込み時の更新"""
+
+    def __init__(self, query_layer, ttl_sec: int = DEFAULT_CATALOG_TTL_SEC, clock: Callable[[], float] = time.time):
+        self.query_layer = query_layer
+        self.ttl_sec = ttl_sec
+        self.clock = clock
+        # collection -> (一覧, 変更トークン, 確認日時)
+        self._cache: Dict[str, Tuple[pd.DataFrame, str, float]] = {}
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self._backfilled = set()
+        self.loads = 0
+        self.token_checks = 0
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("catalog_create")
+            self._table_ready = True
+
+    def _token(self, collection: str) -> str:
+        self.token_checks += 1
+        return str(self.query_layer.scalar("catalog_token", [collection], default=""))
+
+    def _load(self, collection: str) -> pd.DataFrame:
+        self._ensure_table()
+        if collection not in self._backfilled:
+            # カタログが空のコレクションだけ統合チャンクテーブルから登録する（走査は初回のみ）
+            if self._token(collection).startswith("0:"):
+                self.query_layer.collect("catalog_backfill", [collection, collection])
+            self._backfilled.add(collection)
+        self.loads += 1
+        df = self.query_layer.to_pandas("catalog_list", [collection])
+        return df.reindex(columns=CATALOG_COLUMNS)
+
+    def files(self, collection: str, source: Optional[str] = None) -> pd.DataFrame:
+        """コレクションのファイル一覧（source を指定するとそのソースのみ）"""
+        with self._lock:
+            cached = self._cache.get(collection)
+            now = self.clock()
+            if cached is not None and now - cached[2] >= self.ttl_sec:
+                # TTL経過後は変更トークンだけ確認し、変わっていなければ一覧を再利用する
+                token = self._token(collection)
+                cached = (cached[0], cached[1], now) if token == cached[1] else None
+                if cached is not None:
+                    self._cache[collection] = cached
+            if cached is None:
+                df = self._load(collection)
+                cached = (df, self._token(collection), now)
+                self._cache[collection] = cached
+        df = cached[0]
+        if source is not None:
+            df = df[df["SOURCE"] == source]
+        return df.reset_index(drop=True)
+
+    def file_names(self, collection: str, source: Optional[str] = None):
+        return self.files(collection, source)["FILE_NAME"].tolist()
+
+    def record_ingestion(
+        self,
+        collection: str,
+        relative_path: str,
+        source: str,
+        size_bytes: Optional[int] = None,
+        content_hash: Optional[str] = None,
+    ):
+        """取り込んだファイルをカタログに登録・更新し、キャッシュを無効化"""
+        self._ensure_table()
+        self.query_layer.collect(
+            "catalog_upsert",
+            [collection, source, size_bytes, content_hash, relative_path],
+        )
+        self.invalidate(collection)
+
+    def invalidate(self, collection: Optional[str] = None):
+        with self._lock:
+            if collection is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(collection, None)
+
+    def cache_info(self) -> Dict[str, Any]:
+        return {
+            "collections": len(self._cache),
+            "loads": self.loads,
+            "token_checks": self.token_checks,
+        }
+
+
+@st.cache_resource
+def get_document_catalog() -> DocumentCatalog:
+    """全セッション・全ページで共有するドキュメントカタログ"""
+    identifiers = {
+        "db": CATALOG_DATABASE,
+        "schema": CATALOG_SCHEMA,
+        "stage": CATALOG_STAGE,
+        "chunk_catalog": DOCUMENT_CHUNKS_TABLE,
+    }
+    return DocumentCatalog(QueryLayer(get_session, CATALOG_STATEMENTS, identifiers))
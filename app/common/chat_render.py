@@ -0,0 +1,88 @@
+# =========================================================
+# チャット履歴・参照資料の描画
+# =========================================================
+# 再実行（rerun）ごとの描画量を会話の長さに依存させないための描画レイヤー。
+# - 履歴は直近の一定件数のみ描画し、古い履歴は「さらに表示」で段階的に表示
+# - 参照資料・チャンクの中身はトグルを開いたときだけ組み立てる
+#   （st.expander は閉じていても中身をすべて描画するため使わない）
+# - ターンごとの表示用データ（整形済みテキスト等）はターンIDをキーにメモ化
+
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import streamlit as st
+
+HISTORY_PAGE_SIZE = 10
+MAX_MEMOIZED_TURNS = 200
+
+
+def new_turn_id() -> str:
+    """履歴の各ターンに付与するID（ウィジェットキー・メモ化のキーに使う）"""
+    return uuid.uuid4().hex[:12]
+
+
+def turn_id(turn: Dict[str, Any], index: int) -> str:
+    """ターンIDを取得（IDのない古い形式の履歴は位置で代用）"""
+    return str(turn.get("id") or f"legacy-{index}")
+
+
+# =========================================================
+# 履歴のページング
+# =========================================================
+def history_window(history: Sequence[Any], state_key: str, page_size: int = HISTORY_PAGE_SIZE) -> int:
+    """描画を始める位置（= 非表示にする古い履歴の件数）を返す"""
+    visible = st.session_state.get(state_key, page_size)
+    return max(len(history) - visible, 0)
+
+
+def render_load_more(hidden: int, state_key: str, page_size: int = HISTORY_PAGE_SIZE):
+    """古い履歴を追加で表示するボタン"""
+    if hidden <= 0:
+        return
+
+    def _show_more():
+        st.session_state[state_key] = st.session_state.get(state_key, page_size) + page_size
+
+    # コールバックで件数を増やすため、st.rerun() せずに（フラグメント内ならその範囲だけ）再描画される
+    st.button(f"以前の履歴をさらに表示（残り{hidden}件）", key=f"{state_key}_load_more", on_click=_show_more)
+
+
+def reset_history_window(state_key: str):
+    """履歴のクリア時に表示件数を初期値に戻す"""
+    st.session_state.pop(state_key, None)
+
+
+# =========================================================
+# 遅延描画
+# =========================================================
+def lazy_section(label: str, key: str, render_fn: Callable[[], None]):
+    """トグルがオンのときだけ render_fn を呼んで中身を描画"""
+    if st.toggle(label, key=key, value=False):
+        with st.container(border=True):
+            render_fn()
+
+
+def memoized(turn_key: str, part: str, build_fn: Callable[[], Any]) -> Any:
+    """ターンの表示用データをセッション内でメモ化（件数上限付き）"""
+    cache: "OrderedDict[Tuple[str, str], Any]" = st.session_state.setdefault("_rendered_turns", OrderedDict())
+    key = (turn_key, part)
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = build_fn()
+    cache[key] = value
+    while len(cache) > MAX_MEMOIZED_TURNS:
+        cache.popitem(last=False)
+    return value
+
+
+def preview_rows(rows: Sequence[Dict[str, Any]], text_key: str, max_chars: int) -> List[Dict[str, Any]]:
+    """本文を表示用の長さに切り詰めた行のリスト"""
+    previews = []
+    for row in rows:
+        text = str(row.get(text_key) or "")
+        preview = dict(row)
+        preview["preview"] = text[:max_chars] + "..." if len(text) > max_chars else text
+        previews.append(preview)
+    return previews
@@ -0,0 +1,376 @@
+# =========================================================
+# 構造を考慮したチャンク分割
+# =========================================================
+# ノートブックのチャンク化は SPLIT_TEXT_RECURSIVE_CHARACTER(本文, 'markdown', 1000, 100) を
+# ページごとに適用しており、
+# - 表や見出しの区切りと無関係な位置で切れる
+# - ページ末尾の数行がそれだけで1チャンクになる
+# - 文字数で区切るため、英語のチャンクは日本語の約5倍のトークン数になる
+# といった問題がある。ここではページの本文（Markdown）を見出し・表・リスト・段落のブロックに分け、
+# - ブロックの境界でだけ区切り、ページをまたいで連結する
+# - トークン数（common.tokens.estimate_tokens）で下限・上限をそろえる
+# - 上限を超える表は行単位で分け、各チャンクに表の見出し行を付ける
+# - 各チャンクに見出しの階層（header_path）を記録する
+# 比較用に SPLIT_TEXT_RECURSIVE_CHARACTER のローカル相当（recursive_character_split）も置く。
+# 両者の比較は benchmarks/chunking_benchmark.py で行う。
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from common.tokens import estimate_tokens
+
+DEFAULT_MIN_TOKENS = 150
+DEFAULT_MAX_TOKENS = 450
+
+# 見出しとして扱う行（Markdownの # と、番号付きの短い行）
+_MD_HEADER = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_NUMBERED_HEADER = re.compile(r"^(?:（[0-9０-９]+）|\([0-9]+\)|第[0-9０-９一二三四五六七八九十]+[章節]|[0-9]+(?:\.[0-9]+)*\.?\s)\s*[^\d\s]")
+_NUMBERED_HEADER_MAX_CHARS = 50
+_SENTENCE_END = re.compile(r"[。．.!?！？:：]$")
+_LIST_ITEM = re.compile(r"^(?:[-*+•▪●○〇◆■□・]|[0-9]+[.)]|[①-⑳])\s*")
+_TABLE_SEPARATOR = re.compile(r"^\|?\s*:?-{3,}")
+_SENTENCE_SPLIT = re.compile(r"(?<=[。！？])|(?<=[.!?])\s+")
+
+# ページの先頭・末尾に繰り返し現れる行（ヘッダー・フッター）とみなす割合
+RUNNING_LINE_RATIO = 0.5
+
+
+@dataclass
+class Block:
+    """見出し・表・リスト・段落のいずれか1つ"""
+    kind: str
+    text: str
+    page_index: int
+    level: int = 0
+
+
+@dataclass
+class Chunk:
+    text: str
+    page_index: int
+    page_end: int
+    header_path: Tuple[str, ...] = ()
+    tokens: int = 0
+    chunk_index: int = 0
+    chunk_index_on_page: int = 0
+
+    def to_record(self) -> Dict:
+        return {
+            "chunk_text": self.text,
+            "page_index": self.page_index,
+            "page_end": self.page_end,
+            "header_path": list(self.header_path),
+            "tokens": self.tokens,
+            "chunk_index": self.chunk_index,
+            "chunk_index_on_page": self.chunk_index_on_page,
+        }
+
+
+# =========================================================
+# ブロックへの分解
+# =========================================================
+def _fold_digits(line: str) -> str:
+    return re.sub(r"[0-9０-９]+", "0", line.strip())
+
+
+def strip_running_lines(pages: Sequence[str], ratio: float = RUNNING_LINE_RATIO) -> List[str]:
+    """ページの先頭・末尾に繰り返し現れる行（ヘッダー・フッター・ページ番号）を取り除く"""
+    if len(pages) < 3:
+        return list(pages)
+    counts: Dict[str, int] = {}
+    for content in pages:
+        lines = [line for line in content.splitlines() if line.strip()]
+        for line in set(lines[:2] + lines[-2:]):
+            key = _fold_digits(line)
+            counts[key] = counts.get(key, 0) + 1
+    running = {key for key, count in counts.items() if count >= len(pages) * ratio}
+    if not running:
+        return list(pages)
+    stripped = []
+    for content in pages:
+        lines = content.splitlines()
+        edges = [i for i, line in enumerate(lines) if line.strip()]
+        edge_set = set(edges[:2] + edges[-2:])
+        stripped.append("\n".join(
+            line for i, line in enumerate(lines)
+            if not (i in edge_set and _fold_digits(line) in running)
+        ))
+    return stripped
+
+
+def _header(line: str) -> Optional[Tuple[int, str]]:
+    match = _MD_HEADER.match(line)
+    if match:
+        return len(match.group(1)), match.group(2)
+    if (
+        len(line) <= _NUMBERED_HEADER_MAX_CHARS
+        and _NUMBERED_HEADER.match(line)
+        and not _SENTENCE_END.search(line)
+    ):
+        # 番号付きの短い行（「（３）エンゲージメント」「2.1 Climate」など）は本文中の見出しとみなす
+        return 2 + line.split(" ")[0].count("."), line
+    return None
+
+
+def parse_blocks(content: str, page_index: int) -> List[Block]:
+    """ページの本文をブロックに分解"""
+    blocks: List[Block] = []
+    buffer: List[str] = []
+    kind = "paragraph"
+
+    def flush():
+        nonlocal buffer
+        text = "\n".join(buffer).strip()
+        if text:
+            blocks.append(Block(kind, text, page_index))
+        buffer = []
+
+    for raw in content.splitlines():
+        line = raw.strip()
+        if not line:
+            if kind != "table":
+                flush()
+            continue
+        if line.startswith("|"):
+            if kind != "table":
+                flush()
+                kind = "table"
+            buffer.append(line)
+            continue
+        if kind == "table":
+            flush()
+            kind = "paragraph"
+        header = _header(line)
+        if header:
+            flush()
+            blocks.append(Block("header", header[1], page_index, header[0]))
+            continue
+        if _LIST_ITEM.match(line):
+            flush()
+            kind = "list"
+        elif kind == "list" and buffer and _SENTENCE_END.search(buffer[-1]) and line[:1].isupper():
+            # 文で終わった項目の次の大文字で始まる行は、リストの後の段落
+            flush()
+            kind = "paragraph"
+        buffer.append(line)
+    flush()
+    return blocks
+
+
+# =========================================================
+# 上限を超えるブロックの分割
+# =========================================================
+def _split_table(text: str, max_tokens: int) -> List[str]:
+    """表を行単位で分割し、各部分に見出し行（と区切り行）を付ける"""
+    rows = text.splitlines()
+    head = rows[:2] if len(rows) > 1 and _TABLE_SEPARATOR.match(rows[1]) else rows[:1]
+    body = rows[len(head):]
+    head_tokens = estimate_tokens("\n".join(head))
+    parts, current, tokens = [], [], head_tokens
+    for row in body:
+        row_tokens = estimate_tokens(row)
+        if current and tokens + row_tokens > max_tokens:
+            parts.append("\n".join(head + current))
+            current, tokens = [], head_tokens
+        current.append(row)
+        tokens += row_tokens
+    if current:
+        parts.append("\n".join(head + current))
+    return parts or [text]
+
+
+def _hard_split(text: str, max_tokens: int) -> List[str]:
+    """文の区切りがない長いテキストを均等に分割"""
+    pieces = -(-estimate_tokens(text) // max_tokens)
+    size = -(-len(text) // pieces)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def _split_sentences(text: str, max_tokens: int) -> List[str]:
+    """段落を文の区切りで上限以下に分割"""
+    sentences = [s for s in _SENTENCE_SPLIT.split(text) if s and s.strip()]
+    parts, current, tokens = [], [], 0
+    for sentence in sentences:
+        sentence_tokens = estimate_tokens(sentence)
+        if sentence_tokens > max_tokens:
+            if current:
+                parts.append(" ".join(current))
+                current, tokens = [], 0
+            parts.extend(_hard_split(sentence, max_tokens))
+            continue
+        if current and tokens + sentence_tokens > max_tokens:
+            parts.append(" ".join(current))
+            current, tokens = [], 0
+        current.append(sentence.strip())
+        tokens += sentence_tokens
+    if current:
+        parts.append(" ".join(current))
+    return parts
+
+
+def _fit(block: Block, max_tokens: int) -> List[Block]:
+    if estimate_tokens(block.text) <= max_tokens:
+        return [block]
+    if block.kind == "table":
+        parts = _split_table(block.text, max_tokens)
+    else:
+        parts = _split_sentences(block.text, max_tokens)
+    return [Block(block.kind, part, block.page_index, block.level) for part in parts]
+
+
+# =========================================================
+# チャンクの組み立て
+# =========================================================
+@dataclass
+class _Draft:
+    blocks: List[Block] = field(default_factory=list)
+    header_path: Tuple[str, ...] = ()
+    tokens: int = 0
+
+    def add(self, block: Block, tokens: int):
+        self.blocks.append(block)
+        self.tokens += tokens
+
+    def chunk(self) -> Chunk:
+        return Chunk(
+            text="\n\n".join(b.text for b in self.blocks),
+            page_index=self.blocks[0].page_index,
+            page_end=self.blocks[-1].page_index,
+            header_path=self.header_path,
+            tokens=self.tokens,
+        )
+
+
+def chunk_pages(
+    pages: Sequence[str],
+    min_tokens: int = DEFAULT_MIN_TOKENS,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    strip_running: bool = True,
+) -> List[Chunk]:
+    """ページ本文の並び（ページ番号順）をチャンクに分割
+
+    - 見出しの位置で区切る（ただし下限に満たないチャンクは次の節と連結する）
+    - ページの区切りでは区切らない
+    - 上限を超えそうになったらブロックの境界で区切る
+    """
+    if strip_running:
+        pages = strip_running_lines(pages)
+    drafts: List[_Draft] = []
+    current = _Draft()
+    path: List[Tuple[int, str]] = []
+
+    def flush():
+        nonlocal current
+        if current.blocks:
+            drafts.append(current)
+        current = _Draft(header_path=tuple(text for _, text in path))
+
+    for page_index, content in enumerate(pages):
+        for block in parse_blocks(content, page_index):
+            if block.kind == "header":
+                if current.tokens >= min_tokens:
+                    flush()
+                while path and path[-1][0] >= block.level:
+                    path.pop()
+                path.append((block.level, block.text))
+                if not current.blocks:
+                    current.header_path = tuple(text for _, text in path)
+            for part in _fit(block, max_tokens):
+                tokens = estimate_tokens(part.text)
+                if current.blocks and current.tokens + tokens > max_tokens:
+                    # 見出しだけが残らないよう、末尾の見出しは次のチャンクに送る
+                    carried = []
+                    while current.blocks and current.blocks[-1].kind == "header":
+                        carried.insert(0, current.blocks.pop())
+                    current.tokens = sum(estimate_tokens(b.text) for b in current.blocks)
+                    flush()
+                    for header in carried:
+                        current.add(header, estimate_tokens(header.text))
+                current.add(part, tokens)
+    flush()
+
+    # 末尾の小さなチャンクは上限を超えない範囲で直前のチャンクに連結する
+    if len(drafts) > 1 and drafts[-1].tokens < min_tokens and drafts[-2].tokens + drafts[-1].tokens <= max_tokens:
+        last = drafts.pop()
+        for block in last.blocks:
+            drafts[-1].add(block, 0)
+        drafts[-1].tokens += last.tokens
+
+    chunks = [draft.chunk() for draft in drafts]
+    on_page: Dict[int, int] = {}
+    for i, chunk in enumerate(chunks):
+        chunk.chunk_index = i
+        chunk.chunk_index_on_page = on_page.get(chunk.page_index, 0)
+        on_page[chunk.page_index] = chunk.chunk_index_on_page + 1
+    return chunks
+
+
+# =========================================================
+# 比較用: SPLIT_TEXT_RECURSIVE_CHARACTER のローカル相当
+# =========================================================
+MARKDOWN_SEPARATORS = ["\n# ", "\n## ", "\n### ", "\n#### ", "\n\n", "\n", " ", ""]
+
+
+def _merge_splits(splits: List[str], separator: str, chunk_size: int, overlap: int) -> List[str]:
+    chunks, current, total = [], [], 0
+    for piece in splits:
+        length = len(piece) + (len(separator) if current else 0)
+        if current and total + length > chunk_size:
+            chunks.append(separator.join(current).strip())
+            # 末尾から overlap 文字分を次のチャンクに残す
+            while current and (total > overlap or total + length > chunk_size):
+                total -= len(current[0]) + (len(separator) if len(current) > 1 else 0)
+                current.pop(0)
+        current.append(piece)
+        total += len(piece) + (len(separator) if len(current) > 1 else 0)
+    if current:
+        chunks.append(separator.join(current).strip())
+    return [c for c in chunks if c]
+
+
+def recursive_character_split(
+    text: str,
+    chunk_size: int = 1000,
+    overlap: int = 100,
+    separators: Sequence[str] = MARKDOWN_SEPARATORS,
+) -> List[str]:
+    """区切り文字を優先度順に試して chunk_size 文字以下に分割（重なり overlap 文字）"""
+    separator = separators[-1]
+    rest: Sequence[str] = []
+    for i, candidate in enumerate(separators):
+        if candidate == "" or candidate in text:
+            separator, rest = candidate, separators[i + 1:]
+            break
+    splits = text.split(separator) if separator else list(text)
+    chunks, pending = [], []
+    for piece in splits:
+        if len(piece) <= chunk_size:
+            pending.append(piece)
+            continue
+        if pending:
+            chunks.extend(_merge_splits(pending, separator, chunk_size, overlap))
+            pending = []
+        if rest:
+            chunks.extend(recursive_character_split(piece, chunk_size, overlap, rest))
+        else:
+            chunks.append(piece)
+    if pending:
+        chunks.extend(_merge_splits(pending, separator, chunk_size, overlap))
+    return chunks
+
+
+def fixed_chunks(pages: Sequence[str], chunk_size: int = 1000, overlap: int = 100) -> List[Chunk]:
+    """現行の方式（ページごとに SPLIT_TEXT_RECURSIVE_CHARACTER(本文, 'markdown', 1000, 100)）"""
+    chunks = []
+    for page_index, content in enumerate(pages):
+        for i, text in enumerate(recursive_character_split(content, chunk_size, overlap)):
+            chunks.append(Chunk(
+                text=text,
+                page_index=page_index,
+                page_end=page_index,
+                tokens=estimate_tokens(text),
+                chunk_index=len(chunks),
+                chunk_index_on_page=i,
+            ))
+    return chunks
@@ -0,0 +1,214 @@
+# =========================================================
+# 引用（参照資料）の解決
+# =========================================================
+# 応答に含まれる引用をまとめて1回のクエリで解決する。
+# - chunk_id / (relative_path, 本文の先頭) からページ番号・chunk_idを取得
+# - 引用に含まれる relative_path（重複なし）のpresigned URLを同じクエリ内で
+#   集合として一括生成（ファイルごとの EXECUTE IMMEDIATE + RESULT_SCAN を行わない）
+# - URLは有効期限の少し前までキャッシュし、キャッシュ済みのパスは再生成しない
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from common.query_layer import Statement
+
+DEFAULT_URL_EXPIRATION_SEC = 3600
+DEFAULT_URL_REFRESH_MARGIN_SEC = 300
+# 引用本文との照合に使う先頭文字数（チャンク本文に含まれるかで判定する）
+MATCH_PREFIX_CHARS = 80
+
+CITATION_STATEMENTS = [
+    Statement(
+        # params: [引用のJSON配列, キャッシュ済みパスのJSON配列, URLの有効期限（秒）]
+        "citation_resolve",
+        """
+        WITH cited AS (
+            SELECT f.value:i::INT AS i,
+                   NULLIF(f.value:chunk_id::STRING, '') AS chunk_id,
+                   NULLIF(f.value:relative_path::STRING, '') AS cited_path,
+                   NULLIF(f.value:text::STRING, '') AS text_prefix
+            FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+        ),
+        matched AS (
+            SELECT c.i, v.CHUNK_ID, v.FILE_NAME, v.PAGE_INDEX,
+                   COALESCE(v.RELATIVE_PATH, c.cited_path) AS RELATIVE_PATH
+            FROM cited c
+            LEFT JOIN {db}.{schema}.{chunk_catalog} v
+              ON v.CHUNK_ID = c.chunk_id
+              OR (c.chunk_id IS NULL
+                  AND v.RELATIVE_PATH = c.cited_path
+                  AND c.text_prefix IS NOT NULL
+                  AND CONTAINS(v.CHUNK_TEXT, c.text_prefix))
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY c.i ORDER BY v.PAGE_INDEX NULLS LAST) = 1
+        ),
+        paths AS (
+            SELECT DISTINCT RELATIVE_PATH
+            FROM matched
+            WHERE RELATIVE_PATH IS NOT NULL
+              AND NOT ARRAY_CONTAINS(RELATIVE_PATH::VARIANT, PARSE_JSON(?))
+        ),
+        urls AS (
+            SELECT RELATIVE_PATH,
+                   GET_PRESIGNED_URL(@{db}.{schema}.{stage}, RELATIVE_PATH, ?) AS URL
+            FROM paths
+        )
+        SELECT m.i AS I, m.CHUNK_ID, m.FILE_NAME, m.PAGE_INDEX, m.RELATIVE_PATH, u.URL
+        FROM matched m
+        LEFT JOIN urls u ON u.RELATIVE_PATH = m.RELATIVE_PATH
+        ORDER BY m.i
+        """,
+    ),
+    Statement(
+        # params: [URLの有効期限（秒）, パスのJSON配列]
+        "presigned_urls",
+        """
+        SELECT p.value::STRING AS RELATIVE_PATH,
+               GET_PRESIGNED_URL(@{db}.{schema}.{stage}, p.value::STRING, ?) AS URL
+        FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) p
+        """,
+    ),
+]
+
+
+def citation_path(citation: Dict[str, Any]) -> str:
+    """引用の relative_path（Agentの引用では doc_title に入る）"""
+    return str(citation.get("relative_path") or citation.get("doc_title") or citation.get("title") or "")
+
+
+def display_title(citation: Dict[str, Any]) -> str:
+    """表示用のファイル名"""
+    title = citation.get("file_name") or citation_path(citation) or "N/A"
+    return str(title).split("/")[-1]
+
+
+class CitationResolver:
+    """引用のページ番号・chunk_id・presigned URLを一括で解決
+
+    URLキャッシュはインスタンスに保持するため、st.cache_resource で全セッション共有できる。
+    """
+
+    def __init__(
+        self,
+        url_expiration_sec: int = DEFAULT_URL_EXPIRATION_SEC,
+        refresh_margin_sec: int = DEFAULT_URL_REFRESH_MARGIN_SEC,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.url_expiration_sec = url_expiration_sec
+        self.refresh_margin_sec = refresh_margin_sec
+        self.clock = clock
+        self._urls: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.round_trips = 0
+        self.url_hits = 0
+        self.url_misses = 0
+
+    # -----------------------------------------------------
+    # URLキャッシュ
+    # -----------------------------------------------------
+    def _cached_url(self, path: str) -> Optional[str]:
+        with self._lock:
+            entry = self._urls.get(path)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            # 期限切れ間近のURLは再生成する
+            if self.clock() >= expires_at - self.refresh_margin_sec:
+                del self._urls[path]
+                return None
+            return url
+
+    def _store_url(self, path: str, url: str, issued_at: float):
+        with self._lock:
+            self._urls[path] = (url, issued_at + self.url_expiration_sec)
+
+    def urls(self, query_layer, paths: Sequence[str]) -> Dict[str, str]:
+        """パスごとのpresigned URL（未キャッシュ分を1回のクエリで生成）"""
+        result: Dict[str, str] = {}
+        missing = []
+        for path in dict.fromkeys(p for p in paths if p):
+            url = self._cached_url(path)
+            if url is None:
+                missing.append(path)
+            else:
+                result[path] = url
+        self.url_hits += len(result)
+        if missing:
+            self.url_misses += len(missing)
+            issued_at = self.clock()
+            rows = query_layer.collect(
+                "presigned_urls", [self.url_expiration_sec, json.dumps(missing, ensure_ascii=False)]
+            )
+            self.round_trips += 1
+            for row in rows:
+                if row["URL"]:
+                    self._store_url(row["RELATIVE_PATH"], row["URL"], issued_at)
+                    result[row["RELATIVE_PATH"]] = row["URL"]
+        return result
+
+    # -----------------------------------------------------
+    # 引用の解決
+    # -----------------------------------------------------
+    def resolve(self, query_layer, citations: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """引用のコピーに page_index / chunk_id / file_name / url を補完して返す"""
+        resolved = [dict(c) for c in citations]
+        if not resolved:
+            return resolved
+
+        requests = []
+        for i, citation in enumerate(resolved):
+            text = str(citation.get("text") or citation.get("content") or "").strip()
+            requests.append({
+                "i": i,
+                "chunk_id": citation.get("chunk_id") or "",
+                "relative_path": citation_path(citation),
+                "text": text[:MATCH_PREFIX_CHARS],
+            })
+        cached_paths = [r["relative_path"] for r in requests if self._cached_url(r["relative_path"])]
+
+        issued_at = self.clock()
+        rows = query_layer.collect(
+            "citation_resolve",
+            [
+                json.dumps(requests, ensure_ascii=False),
+                json.dumps(cached_paths, ensure_ascii=False),
+                self.url_expiration_sec,
+            ],
+        )
+        self.round_trips += 1
+
+        generated = set()
+        for row in rows:
+            citation = resolved[row["I"]]
+            path = row["RELATIVE_PATH"]
+            if row["URL"] and path not in generated:
+                self._store_url(path, row["URL"], issued_at)
+                generated.add(path)
+            for key, column in (("chunk_id", "CHUNK_ID"), ("file_name", "FILE_NAME"), ("page_index", "PAGE_INDEX")):
+                if row[column] is not None and not citation.get(key):
+                    citation[key] = row[column]
+            if path:
+                citation["relative_path"] = path
+                citation["url"] = row["URL"] or self._cached_url(path)
+        self.url_misses += len(generated)
+        self.url_hits += len(set(cached_paths))
+        return resolved
+
+    def refresh_urls(self, query_layer, citations: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """保存済みの引用のURLを有効なものに差し替える（通常はキャッシュから取得）"""
+        refreshed = [dict(c) for c in citations]
+        urls = self.urls(query_layer, [citation_path(c) for c in refreshed])
+        for citation in refreshed:
+            url = urls.get(citation_path(citation))
+            if url:
+                citation["url"] = url
+        return refreshed
+
+    def cache_info(self) -> Dict[str, Any]:
+        return {
+            "urls": len(self._urls),
+            "round_trips": self.round_trips,
+            "url_hits": self.url_hits,
+            "url_misses": self.url_misses,
+        }
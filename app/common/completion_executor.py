@@ -0,0 +1,327 @@
+# =========================================================
+# COMPLETE の期限・ヘッジ・フォールバック
+# =========================================================
+# COMPLETE / AI_COMPLETE は1回の呼び出しが遅延・スロットリングすると、RAGのターンや
+# 分析ページの処理がタイムアウトなしで止まる（クロスリージョン推論でさらに裾が伸びる）。
+# - 呼び出しは Snowpark の非同期ジョブ（collect_nowait）で実行し、期限を過ぎたらキャンセルする
+# - 直近のレイテンシの p90 を過ぎても応答がなければ、同じモデル（またはフォールバック先）に
+#   1件だけ重複の呼び出し（ヘッジ）を送り、先に返った正常な応答を採用して残りはキャンセルする
+# - エラー・空の応答の場合はフロー（RAG・分析など）ごとのフォールバック先のモデルで呼び直す
+# ヘッジは p90 を超えた呼び出し（約1割）にだけ送るため、平均の費用は倍にならない。
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence
+
+import streamlit as st
+
+# レイテンシの記録数とヘッジの判定に使うパーセンタイル
+LATENCY_WINDOW = 100
+HEDGE_PERCENTILE = 90
+# この件数に満たない間は FlowPolicy.initial_hedge_sec でヘッジする
+MIN_LATENCY_SAMPLES = 10
+POLL_INTERVAL_SEC = 0.05
+
+
+class CompletionTimeoutError(TimeoutError):
+    """期限までに正常な応答が得られなかった"""
+
+
+@dataclass
+class FlowPolicy:
+    """フローごとの期限・ヘッジ・フォールバックの設定"""
+    fallbacks: Sequence[str] = ()
+    timeout_sec: float = 90.0
+    initial_hedge_sec: float = 20.0
+    min_hedge_sec: float = 2.0
+    # True: ヘッジをフォールバック先の先頭のモデルに送る / False: 同じモデルに送る
+    hedge_to_fallback: bool = False
+    hedge: bool = True
+
+
+@dataclass
+class CompletionResult:
+    text: str
+    model: str
+    latency_ms: float
+    attempts: int = 1
+    hedged: bool = False
+    hedge_won: bool = False
+    fell_back: bool = False
+
+
+# =========================================================
+# 呼び出しの開始（非同期ジョブ）
+# =========================================================
+class _Pending:
+    """実行中の呼び出し（Snowpark AsyncJob またはスレッド）"""
+
+    def __init__(self, model: str, done: Callable[[], bool], result: Callable[[], str],
+                 cancel: Callable[[], None], hedge: bool = False):
+        self.model = model
+        self.done = done
+        self.result = result
+        self.cancel = cancel
+        self.hedge = hedge
+        self.started = time.perf_counter()
+
+
+def snowpark_starter(query_layer, statement: str) -> Callable[[str, str], _Pending]:
+    """クエリレイヤーのステートメント（params: [モデル, プロンプト]、1行1列目が応答）を非同期に実行する"""
+
+    def start(model: str, prompt: str) -> _Pending:
+        job = query_layer.dataframe(statement, [model, prompt]).collect_nowait()
+
+        def result() -> str:
+            rows = job.result()
+            return rows[0][0] if rows else ""
+
+        def cancel():
+            try:
+                job.cancel()
+            except Exception:
+                pass
+
+        return _Pending(model, job.is_done, result, cancel)
+
+    return start
+
+
+def thread_starter(complete_fn: Callable[[str, str], str]) -> Callable[[str, str], _Pending]:
+    """同期関数 complete_fn(model, prompt) をスレッドで実行する（キャンセルは結果を捨てるだけ）"""
+
+    def start(model: str, prompt: str) -> _Pending:
+        box: Dict[str, Any] = {}
+        finished = threading.Event()
+
+        def run():
+            try:
+                box["text"] = complete_fn(model, prompt)
+            except Exception as e:
+                box["error"] = e
+            finally:
+                finished.set()
+
+        threading.Thread(target=run, daemon=True, name="completion").start()
+
+        def result() -> str:
+            finished.wait()
+            if "error" in box:
+                raise box["error"]
+            return box["text"]
+
+        return _Pending(model, finished.is_set, result, lambda: None)
+
+    return start
+
+
+# =========================================================
+# レイテンシの記録（全セッション共有）
+# =========================================================
+class LatencyTracker:
+    """(フロー, モデル) ごとの直近のレイテンシ"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[tuple, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, flow: str, model: str, latency_sec: float):
+        with self._lock:
+            self._samples.setdefault((flow, model), deque(maxlen=self.window)).append(latency_sec)
+
+    def percentile(self, flow: str, model: str, q: float) -> Optional[float]:
+        """直近のレイテンシのパーセンタイル（記録が MIN_LATENCY_SAMPLES 件未満なら None）"""
+        with self._lock:
+            samples = sorted(self._samples.get((flow, model), ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        rank = max(1, -(-len(samples) * q // 100))
+        return samples[int(rank) - 1]
+
+
+@dataclass
+class FlowStats:
+    calls: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    fallbacks: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    latencies_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+
+# =========================================================
+# 実行
+# =========================================================
+class CompletionExecutor:
+    """期限・ヘッジ・フォールバック付きで COMPLETE を実行する
+
+    start_fn(model, prompt) は呼び出しを開始して _Pending を返す関数（snowpark_starter / thread_starter）。
+    """
+
+    def __init__(
+        self,
+        start_fn: Callable[[str, str], _Pending],
+        policies: Optional[Dict[str, FlowPolicy]] = None,
+        tracker: Optional[LatencyTracker] = None,
+        clock: Callable[[], float] = time.perf_counter,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.start_fn = start_fn
+        self.policies = policies or {}
+        self.tracker = tracker or LatencyTracker()
+        self.clock = clock
+        self.sleep = sleep
+        self.stats: Dict[str, FlowStats] = {}
+        self._lock = threading.Lock()
+
+    def policy(self, flow: str) -> FlowPolicy:
+        return self.policies.get(flow) or FlowPolicy()
+
+    def hedge_after_sec(self, flow: str, model: str) -> float:
+        """ヘッジを送るまでの待ち時間（直近の p90。記録が少ない間は初期値）"""
+        policy = self.policy(flow)
+        p90 = self.tracker.percentile(flow, model, HEDGE_PERCENTILE)
+        if p90 is None:
+            return policy.initial_hedge_sec
+        return max(policy.min_hedge_sec, p90)
+
+    def _stats(self, flow: str) -> FlowStats:
+        return self.stats.setdefault(flow, FlowStats())
+
+    def _start(self, model: str, prompt: str) -> _Pending:
+        call = self.start_fn(model, prompt)
+        # レイテンシは self.clock で測る（テストで時計を差し替えても呼び出しごとの時間が合うように）
+        call.started = self.clock()
+        return call
+
+    def complete(self, flow: str, model: str, prompt: str) -> CompletionResult:
+        """flow の設定で model を呼び出し、最初に返った正常な応答を返す
+
+        期限までに応答がなければ CompletionTimeoutError、すべてのモデルが失敗した場合は最後のエラーを送出する。
+        """
+        policy = self.policy(flow)
+        chain = [model] + [m for m in policy.fallbacks if m != model]
+        next_model = 1
+        started = self.clock()
+        hedge_at = started + self.hedge_after_sec(flow, model)
+        deadline = started + policy.timeout_sec
+        primary = self._start(model, prompt)
+        pending: List[_Pending] = [primary]
+        attempts, hedged, fell_back = 1, False, False
+        last_error: Optional[Exception] = None
+
+        def record_primary(now: float):
+            # ヘッジに負けた・期限切れの最初の呼び出しも、打ち切った時点までの時間を記録する
+            # （勝った呼び出しだけを記録すると p90 が下がり続け、ヘッジの割合が増える）
+            if primary in pending:
+                self.tracker.add(flow, model, now - started)
+
+        def finish(winner: _Pending, text: str) -> CompletionResult:
+            now = self.clock()
+            for other in pending:
+                if other is not winner:
+                    other.cancel()
+            latency_sec = now - started
+            if winner is not primary:
+                record_primary(now)
+            self.tracker.add(flow, winner.model, now - winner.started)
+            with self._lock:
+                stats = self._stats(flow)
+                stats.calls += 1
+                stats.latencies_ms.append(latency_sec * 1000)
+                stats.hedges += int(hedged)
+                stats.hedge_wins += int(winner.hedge)
+                stats.fallbacks += int(fell_back)
+            return CompletionResult(
+                text=text,
+                model=winner.model,
+                latency_ms=latency_sec * 1000,
+                attempts=attempts,
+                hedged=hedged,
+                hedge_won=winner.hedge,
+                fell_back=fell_back,
+            )
+
+        while True:
+            for call in list(pending):
+                if not call.done():
+                    continue
+                pending.remove(call)
+                try:
+                    text = call.result()
+                except Exception as e:
+                    last_error = e
+                    text = ""
+                if text and text.strip():
+                    pending.append(call)
+                    return finish(call, text)
+                # エラー・空の応答はフォールバック先で呼び直す（実行中の呼び出しがあればそちらも待つ）
+                if next_model < len(chain):
+                    pending.append(self._start(chain[next_model], prompt))
+                    next_model += 1
+                    attempts += 1
+                    fell_back = True
+
+            now = self.clock()
+            if not pending:
+                with self._lock:
+                    stats = self._stats(flow)
+                    stats.calls += 1
+                    stats.errors += 1
+                    stats.fallbacks += int(fell_back)
+                raise last_error or RuntimeError(f"{flow}: 応答が空です")
+            if now >= deadline:
+                record_primary(now)
+                for call in pending:
+                    call.cancel()
+                with self._lock:
+                    stats = self._stats(flow)
+                    stats.calls += 1
+                    stats.timeouts += 1
+                    stats.hedges += int(hedged)
+                raise CompletionTimeoutError(f"{flow}: {policy.timeout_sec:g}秒以内に応答がありませんでした")
+            if policy.hedge and not hedged and now >= hedge_at:
+                hedge_model = model
+                if policy.hedge_to_fallback and next_model < len(chain):
+                    hedge_model = chain[next_model]
+                    next_model += 1
+                call = self._start(hedge_model, prompt)
+                call.hedge = True
+                pending.append(call)
+                hedged = True
+                attempts += 1
+            self.sleep(POLL_INTERVAL_SEC)
+
+    def stats_rows(self) -> List[Dict[str, Any]]:
+        """フローごとの計測値（表示用）"""
+        rows = []
+        with self._lock:
+            items = [(flow, s, sorted(s.latencies_ms)) for flow, s in self.stats.items()]
+        for flow, s, latencies in items:
+            def pct(q):
+                if not latencies:
+                    return None
+                return round(latencies[max(1, -(-len(latencies) * q // 100)) - 1], 1)
+            rows.append({
+                "flow": flow,
+                "calls": s.calls,
+                "p50_ms": pct(50),
+                "p90_ms": pct(90),
+                "p99_ms": pct(99),
+                "hedges": s.hedges,
+                "hedge_wins": s.hedge_wins,
+                "fallbacks": s.fallbacks,
+                "timeouts": s.timeouts,
+                "errors": s.errors,
+            })
+        return rows
+
+
+@st.cache_resource
+def get_latency_tracker() -> LatencyTracker:
+    """全セッションで共有するレイテンシの記録（ヘッジの待ち時間を決める）"""
+    return LatencyTracker()
@@ -0,0 +1,292 @@
+# =========================================================
+# 重複チャンクの判定（SimHash）
+# =========================================================
+# レポートには表紙・目次・免責事項・ヘッダー/フッターなどの定型文が繰り返し現れ、
+# 同じ内容のチャンクが検索結果に「別の根拠」として何件も返ってプロンプトを圧迫する。
+# 取り込み時にチャンクごとの SimHash を計算し、
+# - 同じファイル内の先行チャンクとハミング距離が MAX_HAMMING_DISTANCE 以下のチャンクを重複とみなす
+# - ファイルをまたぐ重複は、短い定型文（BOILERPLATE_MAX_CHARS 以下）に限り
+#   既存の代表チャンク（同じコレクション・別ファイル）と照合する。本文のチャンクは別ファイルと
+#   重複していても残す（ファイルで絞り込んだ検索で、そのファイルの根拠が消えないようにする）
+# - 重複チャンクは DUPLICATE_OF に代表チャンクの CHUNK_ID を記録し、検索サービスの対象から外す
+#   （レポート本文の読み込み・引用の解決では従来どおりすべてのチャンクを使う）
+# 数値は比較の対象に含める（年度だけが違う表を重複とみなさない）。ページ番号だけの行は除いて比較する。
+# 候補の絞り込みは64ビットを16ビットずつ4つのバンドに分け、いずれかのバンドが一致するものに限る
+# （距離3以下なら鳩の巣原理で必ずいずれかのバンドが一致する）。
+
+import hashlib
+import json
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from common.query_layer import Statement
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+SHINGLE_CHARS = 4
+MAX_HAMMING_DISTANCE = 3
+# ファイルをまたいで重複とみなすチャンクの最大の長さ（比較用の文字列の文字数）
+BOILERPLATE_MAX_CHARS = 300
+# 署名・判定方法を変更したら更新する（古い版の判定結果は backfill でやり直す）
+DEDUP_VERSION = "d2"
+
+# ページ番号だけの行（「12」「- 12 -」「p.12」「Page 12 of 40」「12 / 40」など）
+_PAGE_NUMBER_LINE = re.compile(r"^[-–—\s]*(?:p\.?|page)?\s*\d+\s*(?:(?:/|of)\s*\d+)?[-–—\s]*$", re.IGNORECASE)
+
+_BAND_HEX = SIMHASH_BITS // 4 // SIMHASH_BANDS
+
+DEDUP_STATEMENTS = [
+    Statement(
+        # 取り込んだファイルのチャンク（チャンクテーブル）
+        "dedup_file_chunks",
+        """
+        SELECT chunk_id AS CHUNK_ID, chunk_text AS CHUNK_TEXT
+        FROM {db}.{schema}.{chunk_table}
+        WHERE relative_path = ?
+        ORDER BY page_index, chunk_index_on_page
+        """,
+    ),
+    Statement(
+        # 統合チャンクテーブルにあるファイルのチャンク（署名前のものを後から判定する）
+        "dedup_catalog_chunks",
+        """
+        SELECT CHUNK_ID, CHUNK_TEXT
+        FROM {db}.{schema}.{chunk_catalog}
+        WHERE RELATIVE_PATH = ?
+        ORDER BY PAGE_INDEX, CHUNK_INDEX_ON_PAGE, CHUNK_INDEX_IN_FILE
+        """,
+    ),
+    Statement(
+        # 古い版の判定結果を消して backfill の対象に戻す
+        # params: [collection, 現在の版]
+        "dedup_reset_outdated",
+        """
+        UPDATE {db}.{schema}.{chunk_catalog}
+        SET SIMHASH = NULL, DUPLICATE_OF = NULL
+        WHERE COLLECTION = ? AND SIMHASH IS NOT NULL
+          AND (DEDUP_VERSION IS NULL OR DEDUP_VERSION <> ?)
+        """,
+    ),
+    Statement(
+        "dedup_unsigned_files",
+        """
+        SELECT DISTINCT RELATIVE_PATH
+        FROM {db}.{schema}.{chunk_catalog}
+        WHERE COLLECTION = ? AND SIMHASH IS NULL
+        ORDER BY RELATIVE_PATH
+        """,
+    ),
+    Statement(
+        # 別ファイルの代表チャンクのうち、いずれかのバンドが一致するもの
+        # params: [collection, relative_path, バンド1〜4の値のJSON配列]
+        "dedup_candidates",
+        """
+        SELECT CHUNK_ID, SIMHASH
+        FROM {db}.{schema}.{chunk_catalog}
+        WHERE COLLECTION = ? AND RELATIVE_PATH <> ?
+          AND SIMHASH IS NOT NULL AND DUPLICATE_OF IS NULL
+          AND (
+              SUBSTR(SIMHASH, 1, 4) IN (SELECT f.value::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f)
+              OR SUBSTR(SIMHASH, 5, 4) IN (SELECT f.value::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f)
+              OR SUBSTR(SIMHASH, 9, 4) IN (SELECT f.value::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f)
+              OR SUBSTR(SIMHASH, 13, 4) IN (SELECT f.value::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f)
+          )
+        """,
+    ),
+    Statement(
+        # 署名前のチャンクに判定結果を反映
+        # params: [{chunk_id, simhash, duplicate_of, version} の配列のJSON, relative_path]
+        "dedup_apply",
+        """
+        MERGE INTO {db}.{schema}.{chunk_catalog} c
+        USING (
+            SELECT f.value:chunk_id::STRING AS CHUNK_ID,
+                   f.value:simhash::STRING AS SIMHASH,
+                   f.value:duplicate_of::STRING AS DUPLICATE_OF,
+                   f.value:version::STRING AS DEDUP_VERSION
+            FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+        ) s
+        ON c.CHUNK_ID = s.CHUNK_ID AND c.RELATIVE_PATH = ?
+        WHEN MATCHED THEN UPDATE SET SIMHASH = s.SIMHASH, DUPLICATE_OF = s.DUPLICATE_OF, DEDUP_VERSION = s.DEDUP_VERSION
+        """,
+    ),
+]
+
+
+# =========================================================
+# SimHash
+# =========================================================
+def normalize_text(text: str) -> str:
+    """表記ゆれ・ページ番号だけの行の違いを吸収した比較用の文字列（本文の数値はそのまま残す）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    lines = [line for line in text.splitlines() if not _PAGE_NUMBER_LINE.match(line)]
+    return re.sub(r"\s+", "", "\n".join(lines))
+
+
+def is_boilerplate(text: str) -> bool:
+    """ファイルをまたいで重複とみなしてよい短い定型文か"""
+    return len(normalize_text(text)) <= BOILERPLATE_MAX_CHARS
+
+
+def simhash(text: str) -> int:
+    """文字 n-gram（出現回数で重み付け）から64ビットの SimHash を計算"""
+    normalized = normalize_text(text)
+    if len(normalized) <= SHINGLE_CHARS:
+        shingles = Counter([normalized])
+    else:
+        shingles = Counter(
+            normalized[i:i + SHINGLE_CHARS] for i in range(len(normalized) - SHINGLE_CHARS + 1)
+        )
+    weights = [0] * SIMHASH_BITS
+    for shingle, count in shingles.items():
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def to_hex(value: int) -> str:
+    return f"{value:0{SIMHASH_BITS // 4}x}"
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def bands(signature: str) -> List[str]:
+    """署名（16進文字列）をバンドに分割"""
+    return [signature[i * _BAND_HEX:(i + 1) * _BAND_HEX] for i in range(SIMHASH_BANDS)]
+
+
+# =========================================================
+# 判定
+# =========================================================
+@dataclass
+class DedupResult:
+    """1ファイル分の判定結果"""
+    relative_path: str
+    signatures: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return len(self.signatures)
+
+    @property
+    def duplicates(self) -> int:
+        return sum(1 for s in self.signatures if s["duplicate_of"])
+
+    def to_json(self) -> str:
+        return json.dumps(self.signatures)
+
+
+class _BandIndex:
+    """代表チャンクの署名をバンドごとに引ける索引"""
+
+    def __init__(self):
+        self._bands: Dict[Tuple[int, str], List[Tuple[str, int]]] = defaultdict(list)
+
+    def add(self, chunk_id: str, signature: str):
+        value = int(signature, 16)
+        for i, band in enumerate(bands(signature)):
+            self._bands[(i, band)].append((chunk_id, value))
+
+    def nearest(self, signature: str, max_distance: int) -> Optional[str]:
+        value = int(signature, 16)
+        best: Optional[Tuple[int, str]] = None
+        for i, band in enumerate(bands(signature)):
+            for chunk_id, other in self._bands.get((i, band), ()):
+                distance = hamming_distance(value, other)
+                if distance <= max_distance and (best is None or distance < best[0]):
+                    best = (distance, chunk_id)
+        return best[1] if best else None
+
+
+def sign(chunks: Sequence[Tuple[str, str]]) -> List[Tuple[str, str, bool]]:
+    """(chunk_id, テキスト) の並びを (chunk_id, 署名, 短い定型文か) に変換"""
+    return [(chunk_id, to_hex(simhash(text)), is_boilerplate(text)) for chunk_id, text in chunks]
+
+
+def assign_duplicates(
+    signed: Sequence[Tuple[str, str, bool]],
+    canonical: Sequence[Tuple[str, str]] = (),
+    max_distance: int = MAX_HAMMING_DISTANCE,
+) -> List[Dict[str, Any]]:
+    """1ファイルの (chunk_id, 署名, 短い定型文か) の並びについて、重複先（代表チャンクのID）を決める
+
+    同じファイルの中では先に現れたチャンクを代表にする。canonical は別ファイルの既存の代表チャンクの
+    (chunk_id, 署名) で、短い定型文だけを照合する。
+    """
+    other_files = _BandIndex()
+    for chunk_id, signature in canonical:
+        other_files.add(chunk_id, signature)
+    same_file = _BandIndex()
+    results = []
+    for chunk_id, signature, boilerplate in signed:
+        duplicate_of = same_file.nearest(signature, max_distance)
+        if duplicate_of is None and boilerplate:
+            duplicate_of = other_files.nearest(signature, max_distance)
+        if duplicate_of is None:
+            same_file.add(chunk_id, signature)
+        results.append({
+            "chunk_id": chunk_id,
+            "simhash": signature,
+            "duplicate_of": duplicate_of,
+            "version": DEDUP_VERSION,
+        })
+    return results
+
+
+class ChunkDeduplicator:
+    """取り込むファイルのチャンクを既存の代表チャンクと照合する"""
+
+    def __init__(self, query_layer, max_distance: int = MAX_HAMMING_DISTANCE):
+        self.query_layer = query_layer
+        self.max_distance = max_distance
+        self._backfilled = set()
+
+    def _candidates(self, collection: str, relative_path: str, signatures: Sequence[str]) -> List[Tuple[str, str]]:
+        if not signatures:
+            return []
+        per_band = [sorted({bands(s)[i] for s in signatures}) for i in range(SIMHASH_BANDS)]
+        rows = self.query_layer.collect(
+            "dedup_candidates",
+            [collection, relative_path] + [json.dumps(values) for values in per_band],
+        )
+        return [(row["CHUNK_ID"], row["SIMHASH"]) for row in rows]
+
+    def _dedup(self, collection: str, relative_path: str, rows) -> DedupResult:
+        signed = sign([(row["CHUNK_ID"], row["CHUNK_TEXT"] or "") for row in rows])
+        # 別ファイルとの照合は短い定型文だけが対象
+        canonical = self._candidates(
+            collection, relative_path, [signature for _, signature, boilerplate in signed if boilerplate]
+        )
+        return DedupResult(relative_path, assign_duplicates(signed, canonical, self.max_distance))
+
+    def dedup_file(self, collection: str, relative_path: str) -> DedupResult:
+        """チャンクテーブルに格納したファイルのチャンクを判定（結果は publish_chunks に渡す）"""
+        self.backfill(collection)
+        rows = self.query_layer.collect("dedup_file_chunks", [relative_path])
+        return self._dedup(collection, relative_path, rows)
+
+    def backfill(self, collection: str) -> int:
+        """署名のないチャンク（ノートブックで作成した分・古い版で判定した分）をファイルごとに判定
+
+        コレクションごとに初回のみ実行する。
+        """
+        if collection in self._backfilled:
+            return 0
+        self.query_layer.collect("document_chunks_create")
+        self.query_layer.collect("document_chunks_add_dedup_columns")
+        self.query_layer.collect("dedup_reset_outdated", [collection, DEDUP_VERSION])
+        duplicates = 0
+        for row in self.query_layer.collect("dedup_unsigned_files", [collection]):
+            relative_path = row["RELATIVE_PATH"]
+            chunks = self.query_layer.collect("dedup_catalog_chunks", [relative_path])
+            result = self._dedup(collection, relative_path, chunks)
+            self.query_layer.collect("dedup_apply", [result.to_json(), relative_path])
+            duplicates += result.duplicates
+        self._backfilled.add(collection)
+        return duplicates
@@ -0,0 +1,263 @@
+# =========================================================
+# 原則別評価結果の永続ストア
+# =========================================================
+# 評価結果を (ファイル, 原則, 原則テキストのハッシュ, Agent仕様バージョン, コーパスバージョン)
+# をキーに保存し、入力が変わらない限り過去の結果を再利用する。
+# - SnowflakeEvaluationStore: Snowflakeテーブル（本番）
+# - SqliteEvaluationStore: ローカル検証用のSQLite版（同じインターフェース）
+
+import hashlib
+import json
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from common.query_layer import Statement
+
+EVALUATION_TABLE = "PRINCIPLE_EVALUATION_RESULTS"
+DEFAULT_ENGINE = "agent"
+
+
+def principle_text_hash(principle_data: Dict[str, Any]) -> str:
+    """原則のタイトル・本文から変更検知用のハッシュを作成"""
+    text = f"{principle_data.get('title', '')}\n{principle_data.get('description', '')}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(frozen=True)
+class EvaluationKey:
+    """評価結果の再利用可否を決めるキー"""
+    file_name: str
+    principle: str
+    principle_hash: str
+    agent_spec_version: str
+    corpus_version: str
+
+
+def is_storable(result: Dict[str, Any]) -> bool:
+    """エラー結果は保存しない"""
+    return not result.get("error_kind") and not str(result.get("response", "")).startswith("エラー")
+
+
+def _json_column(row: Dict[str, Any], name: str) -> List[Any]:
+    value = row.get(name) or "[]"
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or []
+
+
+def _row_to_result(row: Dict[str, Any]) -> Dict[str, Any]:
+    evaluated_at = row.get("EVALUATED_AT")
+    if isinstance(evaluated_at, datetime):
+        evaluated_at = evaluated_at.isoformat(timespec="seconds")
+    return {
+        "principle": row["PRINCIPLE"],
+        "title": row.get("TITLE", ""),
+        "query": row.get("QUERY", ""),
+        "response": row.get("RESPONSE", ""),
+        "citations": _json_column(row, "CITATIONS"),
+        "requirements": _json_column(row, "REQUIREMENTS"),
+        "engine": row.get("ENGINE") or DEFAULT_ENGINE,
+        "principle_hash": row.get("PRINCIPLE_HASH"),
+        "evaluated_at": evaluated_at,
+        "cached": True,
+    }
+
+
+# =========================================================
+# Snowflake版
+# =========================================================
+EVALUATION_STORE_STATEMENTS = [
+    Statement(
+        "evaluation_store_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + EVALUATION_TABLE + """ (
+            FILE_NAME STRING,
+            PRINCIPLE STRING,
+            PRINCIPLE_HASH STRING,
+            AGENT_SPEC_VERSION STRING,
+            CORPUS_VERSION STRING,
+            TITLE STRING,
+            QUERY STRING,
+            RESPONSE STRING,
+            CITATIONS VARIANT,
+            EVALUATED_AT TIMESTAMP_NTZ,
+            REQUIREMENTS VARIANT,
+            ENGINE STRING
+        )
+        """,
+    ),
+    Statement(
+        # 評価エンジン・要求事項の列を追加する前に作成されたテーブル用
+        "evaluation_store_add_requirements",
+        """
+        ALTER TABLE {db}.{schema}.""" + EVALUATION_TABLE + """ ADD COLUMN IF NOT EXISTS REQUIREMENTS VARIANT
+        """,
+    ),
+    Statement(
+        "evaluation_store_add_engine",
+        """
+        ALTER TABLE {db}.{schema}.""" + EVALUATION_TABLE + """ ADD COLUMN IF NOT EXISTS ENGINE STRING
+        """,
+    ),
+    Statement(
+        "evaluation_store_latest",
+        """
+        SELECT PRINCIPLE, PRINCIPLE_HASH, TITLE, QUERY, RESPONSE,
+               TO_JSON(CITATIONS) AS CITATIONS, TO_JSON(REQUIREMENTS) AS REQUIREMENTS, ENGINE, EVALUATED_AT
+        FROM {db}.{schema}.""" + EVALUATION_TABLE + """
+        WHERE FILE_NAME = ?
+        AND AGENT_SPEC_VERSION = ?
+        AND CORPUS_VERSION = ?
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY PRINCIPLE, PRINCIPLE_HASH ORDER BY EVALUATED_AT DESC
+        ) = 1
+        """,
+    ),
+    Statement(
+        "evaluation_store_insert",
+        """
+        INSERT INTO {db}.{schema}.""" + EVALUATION_TABLE + """
+        (FILE_NAME, PRINCIPLE, PRINCIPLE_HASH, AGENT_SPEC_VERSION, CORPUS_VERSION,
+         TITLE, QUERY, RESPONSE, CITATIONS, EVALUATED_AT, REQUIREMENTS, ENGINE)
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?, PARSE_JSON(?), CURRENT_TIMESTAMP()::TIMESTAMP_NTZ, PARSE_JSON(?), ?
+        """,
+    ),
+    Statement(
+        "corpus_version_for_file",
+        """
+        SELECT TO_VARCHAR(COUNT(*)) || '-' || TO_VARCHAR(HASH_AGG(CHUNK_ID, CHUNK_TEXT))
+        FROM {db}.{schema}.{chunk_catalog}
+        WHERE FILE_NAME = ?
+        """,
+    ),
+]
+
+
+class SnowflakeEvaluationStore:
+    """Snowflakeテーブルを使った評価結果ストア"""
+
+    def __init__(self, query_layer):
+        self.query_layer = query_layer
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("evaluation_store_create")
+            self.query_layer.collect("evaluation_store_add_requirements")
+            self.query_layer.collect("evaluation_store_add_engine")
+            self._table_ready = True
+
+    def corpus_version(self, file_name: str) -> str:
+        """対象ファイルのチャンク内容から算出したバージョン"""
+        return str(self.query_layer.scalar("corpus_version_for_file", [file_name], default=""))
+
+    def load_latest(self, file_name: str, agent_spec_version: str, corpus_version: str) -> Dict[str, Dict[str, Any]]:
+        """(原則, 原則ハッシュ) ごとの最新結果を取得"""
+        self._ensure_table()
+        rows = self.query_layer.collect(
+            "evaluation_store_latest", [file_name, agent_spec_version, corpus_version]
+        )
+        results = {}
+        for row in rows:
+            result = _row_to_result(row.as_dict())
+            results[(result["principle"], result["principle_hash"])] = result
+        return results
+
+    def save(self, key: EvaluationKey, result: Dict[str, Any]):
+        if not is_storable(result):
+            return
+        self._ensure_table()
+        self.query_layer.collect(
+            "evaluation_store_insert",
+            [
+                key.file_name, key.principle, key.principle_hash,
+                key.agent_spec_version, key.corpus_version,
+                result.get("title", ""), result.get("query", ""), result.get("response", ""),
+                json.dumps(result.get("citations", []), ensure_ascii=False),
+                json.dumps(result.get("requirements", []), ensure_ascii=False),
+                result.get("engine") or DEFAULT_ENGINE,
+            ],
+        )
+
+
+# =========================================================
+# SQLite版（ローカル検証用）
+# =========================================================
+class SqliteEvaluationStore:
+    """SQLiteを使った評価結果ストア（Snowflake版と同じインターフェース）"""
+
+    def __init__(self, path: str = ":memory:", corpus_versions: Optional[Dict[str, str]] = None):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._corpus_versions = corpus_versions or {}
+        with self._lock:
+            self._conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {EVALUATION_TABLE} (
+                    FILE_NAME TEXT, PRINCIPLE TEXT, PRINCIPLE_HASH TEXT,
+                    AGENT_SPEC_VERSION TEXT, CORPUS_VERSION TEXT,
+                    TITLE TEXT, QUERY TEXT, RESPONSE TEXT, CITATIONS TEXT, EVALUATED_AT TEXT,
+                    REQUIREMENTS TEXT, ENGINE TEXT
+                )
+                """
+            )
+
+    def corpus_version(self, file_name: str) -> str:
+        return self._corpus_versions.get(file_name, "")
+
+    def set_corpus_version(self, file_name: str, version: str):
+        self._corpus_versions[file_name] = version
+
+    def load_latest(self, file_name: str, agent_spec_version: str, corpus_version: str) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"""
+                SELECT * FROM {EVALUATION_TABLE}
+                WHERE FILE_NAME = ? AND AGENT_SPEC_VERSION = ? AND CORPUS_VERSION = ?
+                ORDER BY EVALUATED_AT ASC, rowid ASC
+                """,
+                (file_name, agent_spec_version, corpus_version),
+            ).fetchall()
+        results = {}
+        for row in rows:
+            result = _row_to_result(dict(row))
+            # 新しい行で上書きして最新のみ残す
+            results[(result["principle"], result["principle_hash"])] = result
+        return results
+
+    def save(self, key: EvaluationKey, result: Dict[str, Any]):
+        if not is_storable(result):
+            return
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO {EVALUATION_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key.file_name, key.principle, key.principle_hash,
+                    key.agent_spec_version, key.corpus_version,
+                    result.get("title", ""), result.get("query", ""), result.get("response", ""),
+                    json.dumps(result.get("citations", []), ensure_ascii=False),
+                    datetime.now().isoformat(timespec="seconds"),
+                    json.dumps(result.get("requirements", []), ensure_ascii=False),
+                    result.get("engine") or DEFAULT_ENGINE,
+                ),
+            )
+            self._conn.commit()
+
+
+def lookup(stored: Dict[Any, Dict[str, Any]], principle: str, principle_hash: str) -> Optional[Dict[str, Any]]:
+    """load_latest の結果から原則の有効な結果を取得"""
+    return stored.get((principle, principle_hash))
+
+
+def ordered_results(stored: Dict[Any, Dict[str, Any]], principles: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """原則の定義順に、現在の原則テキストと一致する結果だけを並べる"""
+    results = []
+    for key, principle in principles.items():
+        result = lookup(stored, key, principle_text_hash(principle))
+        if result is not None:
+            results.append(result)
+    return results
@@ -0,0 +1,311 @@
+# =========================================================
+# 高速評価エンジン（Cortex Search + COMPLETE）
+# =========================================================
+# Agentのオーケストレーション（計画→ツール呼び出し→応答）を経由せず、
+# 原則の ○ 項目ごとに対象ファイルに絞った検索とCOMPLETEを並列実行する。
+# 判定（✅/⚠️/❌）はLLMの出力からラベルだけを取り出し、表と総合評価は
+# コード側で決定的に組み立てる。
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.principles import Requirement, principle_requirements
+from common.search import format_context
+
+VERDICT_SUPPORTED = "対応している"
+VERDICT_PARTIAL = "部分的に対応"
+VERDICT_NONE = "情報なし"
+
+VERDICT_ICONS = {
+    VERDICT_SUPPORTED: "✅",
+    VERDICT_PARTIAL: "⚠️",
+    VERDICT_NONE: "❌",
+}
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_NUM_RESULTS = 5
+
+REQUIREMENT_PROMPT_TEMPLATE = """あなたは年金基金のスチュワードシップ評価担当者です。
+以下の【検索結果】は運用機関のサステナビリティレポート「{file_name}」からの抜粋です。
+【要求事項】に対する対応状況を【検索結果】のみに基づいて判定してください。
+
+【要求事項】
+{requirement}
+
+【検索結果】
+{context}
+
+【判定基準】
+- 対応している: 要求事項の趣旨に沿った取り組み・方針・姿勢が確認できる（具体的な数値や詳細がなくても可）
+- 部分的に対応: 一部の要素のみ対応、または間接的な言及にとどまる
+- 情報なし: 関連する記載が見つからない
+
+【出力形式】（この2行のみを出力すること）
+判定: 対応している / 部分的に対応 / 情報なし のいずれか1つ
+根拠: 取り組み内容・方針・姿勢の要約（2-3文程度）
+"""
+
+SearchFn = Callable[[str, Optional[str]], Tuple[str, List[Dict[str, Any]]]]
+CompleteFn = Callable[[str], str]
+
+_VERDICT_LINE = re.compile(r"判定\s*[:：]\s*(.+)")
+_RATIONALE_LINE = re.compile(r"根拠\s*[:：]\s*(.*)", re.DOTALL)
+
+
+def parse_verdict(text: str) -> Tuple[str, str]:
+    """LLMの出力から (判定ラベル, 根拠) を取り出す
+
+    判定行が見つからない・解釈できない場合は「部分的に対応」ではなく
+    「情報なし」に倒し、判定が過大にならないようにする。
+    """
+    text = (text or "").strip()
+    match = _VERDICT_LINE.search(text)
+    verdict_text = match.group(1) if match else text.splitlines()[0] if text else ""
+    verdict = match_verdict(verdict_text) or VERDICT_NONE
+
+    rationale_match = _RATIONALE_LINE.search(text)
+    rationale = rationale_match.group(1).strip() if rationale_match else text
+    return verdict, rationale
+
+
+def match_verdict(text: str) -> Optional[str]:
+    """文字列に含まれる判定ラベル（またはアイコン）を返す"""
+    # 「部分的に対応」は「対応」を含むため先に判定する
+    for label in (VERDICT_PARTIAL, VERDICT_NONE, VERDICT_SUPPORTED):
+        if label in text:
+            return label
+    for label, icon in VERDICT_ICONS.items():
+        if icon in text:
+            return label
+    return None
+
+
+def count_verdicts(markdown: str) -> Dict[str, int]:
+    """Agent形式の応答（**評価:** 行）から判定ごとの件数を数える"""
+    counts = {label: 0 for label in VERDICT_ICONS}
+    for line in (markdown or "").splitlines():
+        if "評価:" not in line and "評価：" not in line:
+            continue
+        verdict = match_verdict(line)
+        if verdict is not None:
+            counts[verdict] += 1
+    return counts
+
+
+@dataclass
+class RequirementEvaluation:
+    """○ 項目1件の評価結果"""
+    requirement: Requirement
+    verdict: str = VERDICT_NONE
+    rationale: str = ""
+    evidence: List[Dict[str, Any]] = field(default_factory=list)
+    search_ms: float = 0.0
+    complete_ms: float = 0.0
+    error: Optional[str] = None
+    prefetched: bool = False
+
+    @property
+    def icon(self) -> str:
+        return VERDICT_ICONS.get(self.verdict, "❌")
+
+
+def overall_comment(evaluations: Sequence[RequirementEvaluation]) -> str:
+    """判定の件数から総合評価コメントを決定的に作成"""
+    total = len(evaluations)
+    if total == 0:
+        return "評価対象の項目がありません。"
+    supported = sum(1 for e in evaluations if e.verdict == VERDICT_SUPPORTED)
+    partial = sum(1 for e in evaluations if e.verdict == VERDICT_PARTIAL)
+    missing = total - supported - partial
+    summary = f"全{total}項目中、対応している: {supported}件、部分的に対応: {partial}件、情報なし: {missing}件です。"
+    if supported == total:
+        return summary + "原則の全項目について、趣旨に沿った取り組みが確認できます。"
+    if missing == total:
+        return summary + "レポート内に本原則に関する記載は確認できませんでした。"
+    if supported + partial == total:
+        return summary + "全項目で関連する記載はありますが、一部は間接的な言及にとどまります。"
+    return summary + "一部の項目についてはレポート内で記載が確認できず、追加の確認が必要です。"
+
+
+def build_result(
+    principle_key: str,
+    principle_data: Dict[str, Any],
+    evaluations: Sequence[RequirementEvaluation],
+    elapsed_ms: float = 0.0,
+) -> Dict[str, Any]:
+    """項目ごとの評価からAgent版と同じ形式の評価結果を組み立てる"""
+    lines = ["## 評価結果", "", "### 原則の各項目に対する対応状況", ""]
+    citations: List[Dict[str, Any]] = []
+    for evaluation in evaluations:
+        lines.extend([
+            "---",
+            "",
+            f"**○ {evaluation.requirement.text}**",
+            "",
+            "**対応状況:**",
+            f"- {evaluation.rationale or '関連する記載は見つかりませんでした。'}",
+            "",
+            f"**評価:** {evaluation.icon} {evaluation.verdict}",
+            "",
+        ])
+        for row in evaluation.evidence:
+            citations.append({
+                'doc_title': row.get('relative_path') or row.get('file_name', ''),
+                'chunk_id': row.get('chunk_id', ''),
+                'text': row.get('chunk', ''),
+                'page_index': row.get('page_index', ''),
+                'requirement_id': evaluation.requirement.requirement_id,
+            })
+    lines.extend(["---", "", "### 総合評価", "", overall_comment(evaluations)])
+
+    return {
+        'principle': principle_key,
+        'title': principle_data['title'],
+        'query': "\n".join(e.requirement.query for e in evaluations),
+        'response': "\n".join(lines),
+        'citations': citations,
+        'requirements': requirement_rows(evaluations),
+        'engine': 'fast',
+        'elapsed_ms': round(elapsed_ms, 1),
+    }
+
+
+def requirement_rows(evaluations: Sequence[RequirementEvaluation]) -> List[Dict[str, Any]]:
+    """項目ごとの判定表（表示・エクスポート用）"""
+    return [
+        {
+            "項目": e.requirement.requirement_id,
+            "要求事項": e.requirement.text,
+            "評価": f"{e.icon} {e.verdict}",
+            "根拠": e.rationale,
+            "参照数": len(e.evidence),
+            "根拠の取得": "事前取得" if e.prefetched else "検索",
+            "検索_ms": round(e.search_ms, 1),
+            "生成_ms": round(e.complete_ms, 1),
+        }
+        for e in evaluations
+    ]
+
+
+class FastEvaluator:
+    """○ 項目単位で検索とCOMPLETEを並列実行する評価エンジン
+
+    search_fn(query, file_name) は (コンテキストテキスト, 行リスト) を、
+    complete_fn(prompt) は生成テキストを返す。どちらもStreamlitに依存しないため
+    ワーカースレッドから呼び出せる。
+    """
+
+    def __init__(
+        self,
+        search_fn: SearchFn,
+        complete_fn: CompleteFn,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        prompt_template: str = REQUIREMENT_PROMPT_TEMPLATE,
+    ):
+        self.search_fn = search_fn
+        self.complete_fn = complete_fn
+        self.max_workers = max_workers
+        self.prompt_template = prompt_template
+
+    def evaluate_requirement(
+        self,
+        requirement: Requirement,
+        file_name: Optional[str],
+        evidence_rows: Optional[List[Dict[str, Any]]] = None,
+    ) -> RequirementEvaluation:
+        evaluation = RequirementEvaluation(requirement=requirement)
+        try:
+            if evidence_rows:
+                # 事前取得済みの根拠があれば検索を省略する
+                context_text, rows = format_context(evidence_rows), evidence_rows
+                evaluation.prefetched = True
+            else:
+                start = time.perf_counter()
+                context_text, rows = self.search_fn(requirement.query, file_name)
+                evaluation.search_ms = (time.perf_counter() - start) * 1000
+            evaluation.evidence = rows
+
+            # 検索結果がなければLLMを呼ばずに「情報なし」とする
+            if not rows:
+                return evaluation
+
+            prompt = self.prompt_template.format(
+                file_name=file_name or "",
+                requirement=requirement.text,
+                context=context_text,
+            )
+            start = time.perf_counter()
+            output = self.complete_fn(prompt)
+            evaluation.complete_ms = (time.perf_counter() - start) * 1000
+            evaluation.verdict, evaluation.rationale = parse_verdict(output)
+        except Exception as e:
+            evaluation.error = str(e)
+            evaluation.rationale = f"評価に失敗しました: {str(e)}"
+        return evaluation
+
+    def evaluate_requirements(
+        self,
+        requirements: Sequence[Requirement],
+        file_name: Optional[str],
+        on_done: Optional[Callable[[int, int], None]] = None,
+        evidence: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ) -> List[RequirementEvaluation]:
+        """項目を並列に評価し、入力と同じ順序で返す"""
+        results: List[Optional[RequirementEvaluation]] = [None] * len(requirements)
+        if not requirements:
+            return []
+        evidence = evidence or {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(requirements))) as executor:
+            futures = {
+                executor.submit(
+                    self.evaluate_requirement,
+                    requirement,
+                    file_name,
+                    evidence.get(requirement.requirement_id),
+                ): i
+                for i, requirement in enumerate(requirements)
+            }
+            done = 0
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                done += 1
+                if on_done is not None:
+                    on_done(done, len(requirements))
+        return [r for r in results if r is not None]
+
+    def evaluate(
+        self,
+        principle_key: str,
+        principle_data: Dict[str, Any],
+        file_name: Optional[str],
+        evidence: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ) -> Dict[str, Any]:
+        """1つの原則を評価"""
+        return self.evaluate_many({principle_key: principle_data}, file_name, evidence=evidence)[0]
+
+    def evaluate_many(
+        self,
+        principles: Dict[str, Dict[str, Any]],
+        file_name: Optional[str],
+        on_done: Optional[Callable[[int, int], None]] = None,
+        evidence: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """複数の原則の全項目をまとめて並列評価し、原則ごとの結果を返す"""
+        start = time.perf_counter()
+        requirements: List[Requirement] = []
+        for key, principle in principles.items():
+            requirements.extend(principle_requirements(key, principle))
+        evaluations = self.evaluate_requirements(requirements, file_name, on_done, evidence)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        results = []
+        for key, principle in principles.items():
+            principle_evaluations = [e for e in evaluations if e.requirement.principle == key]
+            result = build_result(key, principle, principle_evaluations, elapsed_ms)
+            if any(e.error for e in principle_evaluations):
+                result['error_kind'] = 'partial_failure'
+            results.append(result)
+        return results
@@ -0,0 +1,480 @@
+# =========================================================
+# レポート取り込み（ページごとの経路判定・ページ範囲ごとの並列解析）
+# =========================================================
+# 大きなPDFを1回の AI_PARSE_DOCUMENT で解析すると、1ファイルで数分かかり、
+# 途中で失敗するとすべてやり直しになる。ここでは
+# - ページごとにテキスト層の量・画像の占有率を調べ、解析の経路を決める
+#   - text:   テキスト層が十分なページはローカルで抽出（AI_PARSE_DOCUMENT を使わない）
+#   - layout: 表組み・図の多いページは AI_PARSE_DOCUMENT（LAYOUT）
+#   - ocr:    テキスト層のないスキャンページは AI_PARSE_DOCUMENT（OCR）
+# - AI_PARSE_DOCUMENT に送るページは経路ごとにまとめ（テキスト層のページを挟んでいても同じシャードにする）、
+#   シャードごとにPDFを分割して並列に解析する。シャード内のページ番号は元のページ番号の対応表で戻す
+# - 解析したページはページ内容のハッシュをキーに解析キャッシュ（common.page_cache）へ保存し、
+#   再アップロード・別名の同一ファイル・改訂版では変わっていないページを再利用する
+# - 最後にページ番号を通し番号に直して1件のレポート（raw_text_dict:pages と同じ形）に結合する
+# 再実行時は解析済みのページがキャッシュから復元されるため、失敗したシャードのページだけを解析する。
+
+import io
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.catalog import content_hash
+from common.page_cache import TablePageCache, page_hash
+
+DEFAULT_PAGES_PER_SHARD = 20
+DEFAULT_MAX_WORKERS = 4
+# シャードはレポートのフォルダ（am_esg_report/ 等）の外に置き、ノートブックの LIKE 条件に含まれないようにする
+SHARD_STAGE_PREFIX = "_shards"
+
+ROUTE_TEXT = "text"
+ROUTE_LAYOUT = "layout"
+ROUTE_OCR = "ocr"
+ROUTE_CACHE = "cache"
+ROUTE_LABELS = {
+    ROUTE_TEXT: "テキスト層から抽出",
+    ROUTE_CACHE: "解析キャッシュから再利用",
+    ROUTE_LAYOUT: "AI_PARSE_DOCUMENT（LAYOUT）",
+    ROUTE_OCR: "AI_PARSE_DOCUMENT（OCR）",
+}
+PARSE_STATEMENTS = {
+    ROUTE_LAYOUT: "parse_shard_insert",
+    ROUTE_OCR: "parse_shard_insert_ocr",
+}
+
+# 経路判定のしきい値（変更したら ROUTING_VERSION を更新する）
+ROUTING_VERSION = "r1"
+MIN_TEXT_CHARS = 200          # これ未満のページはテキスト層が乏しい
+OCR_MAX_TEXT_CHARS = 20       # これ以下のページはスキャンページとみなす
+MAX_IMAGE_COVERAGE = 0.3      # 画像がページ面積のこれ以上を占めるページは図が多い
+MAX_SHORT_LINE_RATIO = 0.6    # 短い行の割合がこれ以上のページは表組みとみなす
+SHORT_LINE_CHARS = 12
+
+ProgressFn = Callable[[int, int], None]
+
+
+# =========================================================
+# ページの経路判定
+# =========================================================
+@dataclass(frozen=True)
+class PageProfile:
+    """1ページの特徴量と解析の経路（index は0始まり）"""
+    index: int
+    text_chars: int
+    image_coverage: float
+    short_line_ratio: float
+    route: str
+
+
+def _image_coverage(page) -> float:
+    """ページに描画される画像の面積の割合（コンテンツストリームの cm / Do から概算）"""
+    from pypdf.generic import ContentStream
+
+    try:
+        xobjects = page["/Resources"].get_object().get("/XObject")
+        if not xobjects:
+            return 0.0
+        xobjects = xobjects.get_object()
+        images = {
+            name for name, ref in xobjects.items()
+            if ref.get_object().get("/Subtype") == "/Image"
+        }
+        if not images:
+            return 0.0
+        contents = page.get_contents()
+        if contents is None:
+            return 0.0
+
+        width = float(page.mediabox.width) or 1.0
+        height = float(page.mediabox.height) or 1.0
+        matrix = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        stack = []
+        covered = 0.0
+        for operands, operator in ContentStream(contents, page.pdf).operations:
+            if operator == b"q":
+                stack.append(matrix)
+            elif operator == b"Q" and stack:
+                matrix = stack.pop()
+            elif operator == b"cm":
+                a, b, c, d, e, f = (float(x) for x in operands)
+                m = matrix
+                matrix = [
+                    a * m[0] + b * m[2], a * m[1] + b * m[3],
+                    c * m[0] + d * m[2], c * m[1] + d * m[3],
+                    e * m[0] + f * m[2] + m[4], e * m[1] + f * m[3] + m[5],
+                ]
+            elif operator == b"Do" and operands and operands[0] in images:
+                covered += abs(matrix[0] * matrix[3] - matrix[1] * matrix[2])
+        return min(covered / (width * height), 1.0)
+    except Exception:
+        # 解析できないページは画像なしとして扱う（テキスト量で判定する）
+        return 0.0
+
+
+def _short_line_ratio(text: str) -> float:
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+    return sum(1 for line in lines if len(line) <= SHORT_LINE_CHARS) / len(lines)
+
+
+def classify_page(index: int, text: str, image_coverage: float) -> PageProfile:
+    """テキスト層の量・画像の占有率・短い行の割合から経路を決める"""
+    text_chars = len(re.sub(r"\s", "", text))
+    short_line_ratio = _short_line_ratio(text)
+    if text_chars <= OCR_MAX_TEXT_CHARS:
+        route = ROUTE_OCR
+    elif (
+        text_chars < MIN_TEXT_CHARS
+        or image_coverage >= MAX_IMAGE_COVERAGE
+        or short_line_ratio >= MAX_SHORT_LINE_RATIO
+    ):
+        route = ROUTE_LAYOUT
+    else:
+        route = ROUTE_TEXT
+    return PageProfile(index, text_chars, image_coverage, short_line_ratio, route)
+
+
+def page_markdown(text: str) -> str:
+    """テキスト層の文字列を、チャンク化しやすい段落区切りのテキストに整える"""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    # 英単語の行末ハイフネーションを結合
+    text = re.sub(r"([A-Za-z])-\n([a-z])", r"\1\2", text)
+    lines = [line.rstrip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+# =========================================================
+# シャードの作成
+# =========================================================
+@dataclass(frozen=True)
+class Shard:
+    """AI_PARSE_DOCUMENT に送るページの集まり（page_start は0始まり、page_end は含まない）
+
+    page_indices はシャード内のページ順の元のページ番号（連続しているとは限らない）。
+    空の場合はファイル全体を1シャードとして解析する。
+    """
+    index: int
+    page_start: int
+    page_end: int
+    route: str
+    data: bytes
+    # シャード内のページ順のページハッシュ（解析キャッシュのキー）
+    page_hashes: Tuple[str, ...] = ()
+    page_indices: Tuple[int, ...] = ()
+
+    @property
+    def label(self) -> str:
+        if not self.page_indices:
+            return "全ページ"
+        return "p." + ",".join(
+            f"{start + 1}" if start == end else f"{start + 1}-{end + 1}"
+            for start, end in _ranges(self.page_indices)
+        )
+
+    def page_map(self) -> Optional[str]:
+        """シャード内のページ番号 → 元のページ番号の対応表（JSON配列。全ページの場合は None）"""
+        if not self.page_indices:
+            return None
+        return json.dumps(list(self.page_indices))
+
+
+def _ranges(indices: Sequence[int]) -> List[Tuple[int, int]]:
+    """昇順のページ番号を連続する範囲 (最初, 最後) に分ける"""
+    ranges: List[Tuple[int, int]] = []
+    for index in indices:
+        if ranges and ranges[-1][1] == index - 1:
+            ranges[-1] = (ranges[-1][0], index)
+        else:
+            ranges.append((index, index))
+    return ranges
+
+
+@dataclass
+class ParsePlan:
+    """1ファイルの解析計画（ローカル抽出・キャッシュから復元したページと、AI_PARSE_DOCUMENT に送るシャード）"""
+    local_pages: List[Dict[str, Any]]
+    shards: List[Shard]
+    routes: Dict[str, int]
+    page_count: int
+
+
+def _shard_pages(
+    profiles: Sequence[PageProfile], pages_per_shard: int, resolved: Optional[set] = None
+) -> List[Tuple[str, Tuple[int, ...]]]:
+    """AI_PARSE_DOCUMENT が必要なページを経路ごとに最大 pages_per_shard ページずつまとめる
+
+    テキスト層のページ・resolved のページは除く。間に挟まるページがあっても同じシャードにまとめ、
+    レイアウトとテキストのページが交互に並ぶレポートでも1ページずつのシャードにならないようにする。
+    """
+    resolved = resolved or set()
+    groups: List[Tuple[str, Tuple[int, ...]]] = []
+    for route in (ROUTE_LAYOUT, ROUTE_OCR):
+        indices = [p.index for p in profiles if p.route == route and p.index not in resolved]
+        for start in range(0, len(indices), pages_per_shard):
+            groups.append((route, tuple(indices[start:start + pages_per_shard])))
+    groups.sort(key=lambda group: group[1][0])
+    return groups
+
+
+def plan_parse(data: bytes, pages_per_shard: int = DEFAULT_PAGES_PER_SHARD, page_cache=None) -> ParsePlan:
+    """ページごとに経路を判定し、テキスト層の抽出・解析キャッシュの参照とシャードの分割を行う
+
+    pypdf がない場合・PDFを読めない場合は、ファイル全体を1シャード（LAYOUT）として扱う。
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+        reader = PdfReader(io.BytesIO(data))
+        pages = list(reader.pages)
+    except Exception:
+        return ParsePlan([], [Shard(1, 0, 0, ROUTE_LAYOUT, data)], {ROUTE_LAYOUT: 0}, 0)
+
+    profiles = []
+    local_pages = []
+    for index, page in enumerate(pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        profile = classify_page(index, text, _image_coverage(page))
+        profiles.append(profile)
+        if profile.route == ROUTE_TEXT:
+            local_pages.append({"index": index, "content": page_markdown(text)})
+
+    # AI_PARSE_DOCUMENT が必要なページは、解析キャッシュにあればそのまま使う
+    memo: Dict[Tuple[int, int], bytes] = {}
+    hashes = {
+        p.index: page_hash(pages[p.index], memo)
+        for p in profiles if p.route != ROUTE_TEXT
+    }
+    cached = page_cache.get_many(hashes.values()) if page_cache is not None and hashes else {}
+    resolved = set()
+    for index, key in hashes.items():
+        if key in cached:
+            local_pages.append({**cached[key], "index": index})
+            resolved.add(index)
+    local_pages.sort(key=lambda page: page["index"])
+
+    routes = {
+        route: sum(1 for p in profiles if p.route == route and p.index not in resolved)
+        for route in ROUTE_LABELS
+    }
+    routes[ROUTE_CACHE] = len(resolved)
+    groups = _shard_pages(profiles, pages_per_shard, resolved)
+
+    shards = []
+    for shard_index, (route, indices) in enumerate(groups, start=1):
+        if len(indices) == len(pages):
+            # 全ページを1回で解析する場合は元のファイルをそのまま使う
+            shard_data = data
+        else:
+            writer = PdfWriter()
+            for index in indices:
+                writer.add_page(pages[index])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            shard_data = buffer.getvalue()
+        page_hashes = tuple(hashes[index] for index in indices)
+        shards.append(Shard(shard_index, indices[0], indices[-1] + 1, route, shard_data, page_hashes, indices))
+    return ParsePlan(local_pages, shards, routes, len(pages))
+
+
+def stage_writer(get_session, stage: str) -> Callable[[str, bytes], None]:
+    """バイト列をステージの指定パスに保存する関数（一時ファイルを作らない）"""
+    def put(stage_path: str, data: bytes):
+        get_session().file.put_stream(
+            io.BytesIO(data),
+            f"@{stage}/{stage_path}",
+            auto_compress=False,
+            overwrite=True,
+        )
+    return put
+
+
+# =========================================================
+# 解析
+# =========================================================
+@dataclass
+class ParseReport:
+    """1ファイル分の解析結果（parsed はシャード数、reused は解析キャッシュから復元したページ数）"""
+    relative_path: str
+    content_hash: str
+    pages_per_shard: int
+    page_count: int = 0
+    routes: Dict[str, int] = field(default_factory=dict)
+    shards: int = 0
+    parsed: int = 0
+    reused: int = 0
+    failed: List[Tuple[str, str]] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def route_rows(self) -> List[Dict[str, Any]]:
+        """経路ごとのページ数（表示用）"""
+        return [
+            {"経路": ROUTE_LABELS[route], "ページ数": self.routes.get(route, 0)}
+            for route in ROUTE_LABELS
+        ]
+
+
+class ShardParseError(Exception):
+    """一部のシャードの解析に失敗（解析済みのページは解析キャッシュに残る）"""
+
+    def __init__(self, report: ParseReport):
+        self.report = report
+        details = "、".join(f"{label}: {error}" for label, error in report.failed)
+        super().__init__(
+            f"{len(report.failed)}/{report.shards}シャードの解析に失敗しました（再実行すると失敗したシャードのみ解析します）: {details}"
+        )
+
+
+class ShardedReportParser:
+    """ページごとに経路を振り分け、AI_PARSE_DOCUMENT が必要なページ範囲だけを並列に解析する"""
+
+    # ローカル抽出・キャッシュから復元したページはシャード番号0として保存する
+    LOCAL_SHARD_INDEX = 0
+
+    def __init__(
+        self,
+        query_layer,
+        put_fn: Callable[[str, bytes], None],
+        pages_per_shard: int = DEFAULT_PAGES_PER_SHARD,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        page_cache=None,
+    ):
+        self.query_layer = query_layer
+        self.put_fn = put_fn
+        self.pages_per_shard = pages_per_shard
+        self.max_workers = max_workers
+        self.page_cache = page_cache if page_cache is not None else TablePageCache(query_layer)
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("parse_shard_create")
+            self.query_layer.collect("parse_shard_add_route")
+            self.query_layer.collect("parse_shard_add_page_map")
+            self._table_ready = True
+
+    def _shard_path(self, relative_path: str, file_hash: str, shard: Shard) -> str:
+        return f"{SHARD_STAGE_PREFIX}/{relative_path}/{file_hash[:12]}_{shard.index:03d}.pdf"
+
+    def parse(self, relative_path: str, data: bytes, on_progress: Optional[ProgressFn] = None) -> ParseReport:
+        """解析キャッシュにないページだけを並列に解析して保存（失敗時は ShardParseError）"""
+        start = time.perf_counter()
+        self._ensure_table()
+        # 経路判定のしきい値が変わった場合も計画が変わるため、キーに含める
+        file_hash = f"{content_hash(data)}:{ROUTING_VERSION}"
+        report = ParseReport(relative_path, file_hash, self.pages_per_shard)
+
+        # 前回のシャードは削除し、解析済みのページは解析キャッシュから復元する
+        self.query_layer.collect("parse_shard_clear", [relative_path])
+        plan = plan_parse(data, self.pages_per_shard, self.page_cache)
+        report.page_count = plan.page_count
+        report.routes = plan.routes
+        report.reused = plan.routes.get(ROUTE_CACHE, 0)
+        report.shards = len(plan.shards) + (1 if plan.local_pages else 0)
+        if plan.local_pages:
+            self._save_local_pages(relative_path, file_hash, plan)
+            report.parsed += 1
+
+        completed = report.parsed
+        if on_progress:
+            on_progress(completed, report.shards)
+
+        if plan.shards:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(plan.shards))) as executor:
+                futures = {
+                    executor.submit(self._parse_shard, relative_path, file_hash, shard, shard.data is data): shard
+                    for shard in plan.shards
+                }
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        future.result()
+                        report.parsed += 1
+                    except Exception as e:
+                        report.failed.append((shard.label, str(e)))
+                    completed += 1
+                    if on_progress:
+                        on_progress(completed, report.shards)
+
+        report.elapsed_ms = (time.perf_counter() - start) * 1000
+        if not report.ok:
+            raise ShardParseError(report)
+        return report
+
+    def _save_local_pages(self, relative_path: str, file_hash: str, plan: ParsePlan):
+        # ページ番号はファイル全体の通し番号のまま保存する（PAGE_START = 0）
+        self.query_layer.collect(
+            "parse_shard_insert_local",
+            [
+                relative_path, file_hash, self.pages_per_shard, self.LOCAL_SHARD_INDEX,
+                0, plan.page_count, None,
+                json.dumps({"pages": plan.local_pages}, ensure_ascii=False), None,
+            ],
+        )
+
+    def _parse_shard(self, relative_path: str, file_hash: str, shard: Shard, whole_file: bool):
+        # 分割しなかったファイルはアップロード済みの元ファイルをそのまま解析する
+        if whole_file:
+            shard_path = relative_path
+        else:
+            shard_path = self._shard_path(relative_path, file_hash, shard)
+            self.put_fn(shard_path, shard.data)
+        self.query_layer.collect(
+            PARSE_STATEMENTS[shard.route],
+            [
+                relative_path, file_hash, self.pages_per_shard, shard.index,
+                shard.page_start, shard.page_end, shard_path, shard_path, shard.page_map(),
+            ],
+        )
+        self._cache_shard_pages(relative_path, file_hash, shard)
+
+    def _cache_shard_pages(self, relative_path: str, file_hash: str, shard: Shard):
+        """解析したシャードのページを解析キャッシュに保存（ページ番号はシャード内の番号）"""
+        if not shard.page_hashes:
+            return
+        rows = self.query_layer.collect(
+            "parse_shard_pages",
+            [relative_path, file_hash, self.pages_per_shard, shard.index],
+        )
+        entries = {}
+        for row in rows:
+            page = json.loads(row["PAGE"])
+            index = int(page.get("index", -1))
+            if 0 <= index < len(shard.page_hashes):
+                entries[shard.page_hashes[index]] = (shard.route, page)
+        self.page_cache.put_many(entries)
+
+    def stitch(self, report: ParseReport):
+        """シャードを結合してレポートテーブルに保存（既存の行は置き換える）"""
+        path = report.relative_path
+        self.query_layer.collect("delete_report_chunks", [path])
+        self.query_layer.collect("delete_report", [path])
+        self.query_layer.collect(
+            "insert_stitched_report",
+            [path, path, path, report.content_hash, report.pages_per_shard],
+        )
+
+
+# =========================================================
+# 統合チャンクテーブルへの反映
+# =========================================================
+def publish_chunks(query_layer, collection: str, source: str, relative_path: str, signatures: str = "[]"):
+    """チャンクテーブルに格納したファイルのチャンクを DOCUMENT_CHUNKS に反映（差分のみ）
+
+    新しいバージョンを追加してから古いバージョンを削除するため、反映中もファイルのチャンクは空にならない。
+    signatures は重複チャンクの判定結果（common.dedup.DedupResult.to_json()）。
+    """
+    query_layer.collect("document_chunks_create")
+    query_layer.collect("document_chunks_add_dedup_columns")
+    query_layer.collect("document_chunks_insert", [collection, source, signatures, relative_path])
+    query_layer.collect("document_chunks_prune", [relative_path, relative_path])
+    query_layer.collect("document_chunks_promote_orphans", [collection, collection])
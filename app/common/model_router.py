@@ -0,0 +1,271 @@
+# =========================================================
+# モデルルーティング（RAGの回答生成）
+# =========================================================
+# すべてのターンを選択中の大きなモデルで回答すると、数値・日付を引くだけの質問でも
+# 最も遅く高価なモデルの待ち時間と費用がかかる。ここでは質問の難しさをローカルで判定し、
+# - 短い事実確認（いつ・いくら・何%・誰 など）で、検索結果が質問の語をよく含む場合は軽量モデル
+# - 要約・比較・分析などの長文の依頼、長い質問、検索結果の確信度が低い場合は大きなモデル
+# に振り分ける。軽量モデルが「資料からは確認できませんでした」等と答えた場合は大きなモデルで答え直す。
+# ルートごとの呼び出し回数・レイテンシ・トークン数・推定費用を記録し、
+# すべて大きなモデルで回答した場合との差（削減額）を表示できるようにする。
+
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from common.tokens import estimate_tokens
+
+FAST_MODEL = "llama4-scout"
+
+ROUTE_FAST = "fast"
+ROUTE_ESCALATED = "escalated"
+ROUTE_LARGE = "large"
+ROUTE_LABELS = {
+    ROUTE_FAST: "軽量モデル",
+    ROUTE_ESCALATED: "軽量モデル → 大きなモデル（答え直し）",
+    ROUTE_LARGE: "大きなモデル",
+}
+
+# 100万トークンあたりのクレジット（目安。Snowflakeの料金表に合わせて更新する）
+MODEL_CREDITS_PER_MILLION_TOKENS = {
+    "claude-4-sonnet": 2.55,
+    "claude-sonnet-4-5": 2.55,
+    "claude-3-7-sonnet": 2.55,
+    "claude-3-5-sonnet": 2.55,
+    "llama4-maverick": 0.25,
+    "llama4-scout": 0.14,
+}
+DEFAULT_CREDITS_PER_MILLION_TOKENS = 2.55
+
+# 判定のしきい値
+MAX_FAST_QUERY_TOKENS = 60
+MIN_FAST_CONFIDENCE = 0.5
+CONFIDENCE_TOP_K = 3
+
+# 長文の回答が必要な依頼
+_LONG_FORM = re.compile(
+    r"要約|まとめ|比較|違い|分析|評価|説明|理由|なぜ|どのように|傾向|課題|提案|戦略|詳しく|一覧|すべて|全て|"
+    r"summari[sz]e|compare|comparison|differen|analy[sz]|evaluat|explain|why|how does|how do|trend|"
+    r"strateg|recommend|overview|list all|in detail",
+    re.IGNORECASE,
+)
+# 事実確認（値を1つ引けば答えられる）の質問
+_LOOKUP = re.compile(
+    r"いつ|何年|何月|いくら|何%|何％|何社|何人|何件|どれくらい|どのくらい|誰|どこ|何という|名称|目標値|割合|金額|"
+    r"when|what year|how much|how many|what percent|what share|who|where|which|what is the name",
+    re.IGNORECASE,
+)
+# 前のターンを参照する質問（履歴の読み解きが必要）
+_FOLLOW_UP = re.compile(r"^(それ|その|この|これ|あれ|上記|前の|先ほど)|^(it|that|this|those|these)\b", re.IGNORECASE)
+# 回答できなかったことを示す表現（回答全体が断りの場合だけ答え直す）
+_NOT_ANSWERED = re.compile(r"確認できません|見つかりません|記載がありません|わかりません|not (found|available|mentioned)", re.IGNORECASE)
+# 回答全体を断りとみなす最大の長さ（文字数）
+MAX_REFUSAL_CHARS = 120
+_FIRST_SENTENCE = re.compile(r"^[^。．.!！?？\n]*")
+
+_WORD = re.compile(r"[a-z0-9]{3,}|[0-9]+")
+_CJK_RUN = re.compile(r"[一-鿿ァ-ヿ]{2,}")
+_STOPWORDS = {
+    "the", "and", "for", "what", "which", "how", "does", "did", "are", "was", "with", "from", "that", "this",
+    "about", "when", "who", "where", "much", "many",
+}
+
+
+def _terms(text: str) -> set:
+    """確信度の計算に使う質問の語（英数字の単語と、漢字・カタカナの2-gram）"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    terms = {word for word in _WORD.findall(text) if word not in _STOPWORDS}
+    for run in _CJK_RUN.findall(text):
+        terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def retrieval_confidence(queries: Sequence[Optional[str]], rows: Sequence[Dict[str, Any]], top_k: int = CONFIDENCE_TOP_K) -> float:
+    """上位の検索結果が質問の語をどれだけ含むか（0〜1。英訳クエリがあれば高い方）"""
+    if not rows:
+        return 0.0
+    context = unicodedata.normalize("NFKC", " ".join(str(row.get("chunk", "")) for row in rows[:top_k])).lower()
+    best = 0.0
+    for query in queries:
+        terms = _terms(query or "")
+        if terms:
+            best = max(best, sum(1 for term in terms if term in context) / len(terms))
+    return round(best, 3)
+
+
+def model_cost(model: str, tokens: int) -> float:
+    """トークン数から推定クレジットを計算"""
+    rate = MODEL_CREDITS_PER_MILLION_TOKENS.get(model, DEFAULT_CREDITS_PER_MILLION_TOKENS)
+    return tokens * rate / 1_000_000
+
+
+# =========================================================
+# 判定
+# =========================================================
+@dataclass
+class RouteDecision:
+    route: str
+    model: str
+    reasons: List[str] = field(default_factory=list)
+    query_tokens: int = 0
+    confidence: float = 0.0
+
+
+def classify(
+    query: str,
+    rows: Sequence[Dict[str, Any]],
+    large_model: str,
+    fast_model: str = FAST_MODEL,
+    translated_query: Optional[str] = None,
+) -> RouteDecision:
+    """質問の長さ・種類・検索結果の確信度からルートを決める"""
+    query_tokens = estimate_tokens(query)
+    confidence = retrieval_confidence([query, translated_query], rows)
+    reasons = []
+    if _LONG_FORM.search(query):
+        reasons.append("長文の回答が必要な依頼")
+    if query_tokens > MAX_FAST_QUERY_TOKENS:
+        reasons.append(f"長い質問（約{query_tokens}トークン）")
+    if query.count("?") + query.count("？") > 1:
+        reasons.append("複数の質問")
+    if _FOLLOW_UP.search(query.strip()):
+        reasons.append("前のターンを参照する質問")
+    if confidence < MIN_FAST_CONFIDENCE:
+        reasons.append(f"検索結果の確信度が低い（{confidence:.2f}）")
+    if reasons:
+        return RouteDecision(ROUTE_LARGE, large_model, reasons, query_tokens, confidence)
+    reason = "事実確認の質問" if _LOOKUP.search(query) else "短い質問"
+    return RouteDecision(ROUTE_FAST, fast_model, [reason], query_tokens, confidence)
+
+
+def needs_escalation(answer: str) -> bool:
+    """軽量モデルの回答を大きなモデルで答え直すべきか（空・回答全体が断りの場合）
+
+    回答の途中で一部の項目が「記載がありません」とするだけの回答は答え直さない。
+    短い回答に断りの表現がある場合と、最初の文が断りの場合だけを対象にする。
+    """
+    answer = (answer or "").strip()
+    if not answer:
+        return True
+    if len(answer) <= MAX_REFUSAL_CHARS:
+        return bool(_NOT_ANSWERED.search(answer))
+    return bool(_NOT_ANSWERED.search(_FIRST_SENTENCE.match(answer).group(0)))
+
+
+# =========================================================
+# 実行と計測
+# =========================================================
+@dataclass
+class RoutedAnswer:
+    answer: str
+    decision: RouteDecision
+    route: str
+    model: str
+    latency_ms: float
+    cost: float
+
+
+@dataclass
+class RouteStats:
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    baseline_cost: float = 0.0
+
+
+class ModelRouter:
+    """ターンごとにモデルを選んで回答を生成し、ルートごとの計測値を記録する
+
+    complete_fn(model, prompt) は回答テキスト、または実際に使ったモデルを持つ結果
+    （text / model 属性。CompletionResult など）を返す関数。フォールバックで別のモデルが
+    回答した場合は、表示・費用の計算にそのモデルを使う。
+    """
+
+    def __init__(self, complete_fn: Callable[[str, str], str], fast_model: str = FAST_MODEL):
+        self.complete_fn = complete_fn
+        self.fast_model = fast_model
+        self.stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, model: str, prompt: str):
+        """(回答, 実際に回答したモデル, 所要時間ms)"""
+        started = time.perf_counter()
+        result = self.complete_fn(model, prompt)
+        latency_ms = (time.perf_counter() - started) * 1000
+        if isinstance(result, str):
+            return result, model, latency_ms
+        return result.text, result.model, latency_ms
+
+    def answer(
+        self,
+        query: str,
+        prompt: str,
+        rows: Sequence[Dict[str, Any]],
+        large_model: str,
+        translated_query: Optional[str] = None,
+    ) -> RoutedAnswer:
+        decision = classify(query, rows, large_model, self.fast_model, translated_query)
+        prompt_tokens = estimate_tokens(prompt)
+        answer, model, latency_ms = self._call(decision.model, prompt)
+        completion_tokens = estimate_tokens(answer)
+        cost = model_cost(model, prompt_tokens + completion_tokens)
+        route = decision.route
+        if route == ROUTE_FAST and needs_escalation(answer):
+            route = ROUTE_ESCALATED
+            answer, model, escalated_ms = self._call(large_model, prompt)
+            latency_ms += escalated_ms
+            completion_tokens += estimate_tokens(answer)
+            prompt_tokens *= 2
+            cost += model_cost(model, estimate_tokens(prompt) + estimate_tokens(answer))
+        # すべて大きなモデルで回答した場合の費用（回答の長さは同じとみなす）
+        baseline_cost = model_cost(large_model, estimate_tokens(prompt) + estimate_tokens(answer))
+        self._record(route, latency_ms, prompt_tokens, completion_tokens, cost, baseline_cost)
+        return RoutedAnswer(answer, decision, route, model, latency_ms, cost)
+
+    def _record(self, route: str, latency_ms: float, prompt_tokens: int, completion_tokens: int,
+                cost: float, baseline_cost: float):
+        with self._lock:
+            stats = self.stats.setdefault(route, RouteStats())
+            stats.calls += 1
+            stats.total_ms += latency_ms
+            stats.max_ms = max(stats.max_ms, latency_ms)
+            stats.prompt_tokens += prompt_tokens
+            stats.completion_tokens += completion_tokens
+            stats.cost += cost
+            stats.baseline_cost += baseline_cost
+
+    def stats_rows(self) -> List[Dict[str, Any]]:
+        """ルートごとの計測値（表示用）"""
+        with self._lock:
+            items = list(self.stats.items())
+        return [
+            {
+                "route": ROUTE_LABELS.get(route, route),
+                "calls": s.calls,
+                "avg_ms": round(s.total_ms / s.calls, 1) if s.calls else 0.0,
+                "max_ms": round(s.max_ms, 1),
+                "prompt_tokens": s.prompt_tokens,
+                "completion_tokens": s.completion_tokens,
+                "credits": round(s.cost, 6),
+                "baseline_credits": round(s.baseline_cost, 6),
+            }
+            for route, s in items
+        ]
+
+    def savings(self) -> Dict[str, float]:
+        """すべて大きなモデルで回答した場合と比べた推定クレジットの差"""
+        with self._lock:
+            cost = sum(s.cost for s in self.stats.values())
+            baseline = sum(s.baseline_cost for s in self.stats.values())
+        return {
+            "credits": round(cost, 6),
+            "baseline_credits": round(baseline, 6),
+            "saved_credits": round(baseline - cost, 6),
+            "saved_ratio": round((baseline - cost) / baseline, 3) if baseline else 0.0,
+        }
@@ -0,0 +1,151 @@
+# =========================================================
+# ページ単位の解析キャッシュ
+# =========================================================
+# AI_PARSE_DOCUMENT の解析結果をページ内容のハッシュをキーに保存し、
+# 同じページを再び解析しないようにする。
+# - 同じファイルの再アップロード、別名で登録された同一ファイル、一部のページだけ
+#   差し替えた改訂版は、変わっていないページの解析結果をそのまま再利用する
+# - ハッシュはページの描画内容（コンテンツストリーム・画像・フォント・用紙サイズ）から計算し、
+#   ファイル名やPDF全体のメタデータには依存しない
+# - Snowflake上ではテーブル（PAGE_PARSE_CACHE）に、ローカルでは SQLite に保存する
+
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+# (ハッシュ -> (経路, ページ)) の組
+CacheEntries = Dict[str, Tuple[str, Dict[str, Any]]]
+
+
+def _hash_object(obj, digest, memo: Dict[Tuple[int, int], bytes], depth: int = 0):
+    """PDFオブジェクトの内容をハッシュに加える（ストリームはデータ、辞書はキー順）
+
+    間接参照のオブジェクト（フォント・画像など複数ページで共有されるもの）は memo に
+    ハッシュを保持し、同じファイルの中では1回だけ読み込む。
+    """
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if depth > 8:
+        return
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            # 循環参照は空として扱う
+            memo[key] = b""
+            sub = hashlib.md5()
+            _hash_object(obj.get_object(), sub, memo, depth + 1)
+            memo[key] = sub.digest()
+        digest.update(memo[key])
+        return
+    if isinstance(obj, StreamObject):
+        digest.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        for name in sorted(obj.keys()):
+            # 親・注釈への参照は描画内容ではないため含めない
+            if name in ("/Parent", "/Annots", "/StructParents"):
+                continue
+            digest.update(name.encode("utf-8"))
+            _hash_object(obj[name], digest, memo, depth + 1)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            _hash_object(item, digest, memo, depth + 1)
+    elif not isinstance(obj, StreamObject):
+        digest.update(repr(obj).encode("utf-8"))
+
+
+def page_hash(page, memo: Optional[Dict[Tuple[int, int], bytes]] = None) -> str:
+    """ページの描画内容のハッシュ（pypdf の PageObject。memo は同じファイルのページ間で共有する）"""
+    memo = {} if memo is None else memo
+    digest = hashlib.md5()
+    digest.update(repr([float(v) for v in page.mediabox]).encode("utf-8"))
+    digest.update(str(page.get("/Rotate", 0)).encode("utf-8"))
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    if resources is not None:
+        _hash_object(resources, digest, memo)
+    return digest.hexdigest()
+
+
+# =========================================================
+# Snowflake（テーブル）
+# =========================================================
+class TablePageCache:
+    """PAGE_PARSE_CACHE テーブルに保存するキャッシュ（ステートメントは INGESTION_STATEMENTS）"""
+
+    def __init__(self, query_layer):
+        self.query_layer = query_layer
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("page_cache_create")
+            self._table_ready = True
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        hashes = sorted(set(hashes))
+        if not hashes:
+            return {}
+        self._ensure_table()
+        rows = self.query_layer.collect("page_cache_lookup", [json.dumps(hashes)])
+        return {row["PAGE_HASH"]: json.loads(row["PAGE"]) for row in rows}
+
+    def put_many(self, entries: CacheEntries):
+        if not entries:
+            return
+        self._ensure_table()
+        payload = [
+            {"hash": key, "route": route, "page": page}
+            for key, (route, page) in entries.items()
+        ]
+        self.query_layer.collect("page_cache_merge", [json.dumps(payload, ensure_ascii=False)])
+
+
+# =========================================================
+# ローカル（SQLite）
+# =========================================================
+class SqlitePageCache:
+    """Snowflakeに接続しない検証用のキャッシュ（既定はメモリ上）"""
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS page_parse_cache ("
+                "page_hash TEXT PRIMARY KEY, route TEXT, page TEXT, "
+                "cached_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+            )
+            self._conn.commit()
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        hashes = sorted(set(hashes))
+        if not hashes:
+            return {}
+        placeholders = ",".join("?" for _ in hashes)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT page_hash, page FROM page_parse_cache WHERE page_hash IN ({placeholders})",
+                hashes,
+            ).fetchall()
+        return {key: json.loads(page) for key, page in rows}
+
+    def put_many(self, entries: CacheEntries):
+        if not entries:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO page_parse_cache (page_hash, route, page) VALUES (?, ?, ?)",
+                [
+                    (key, route, json.dumps(page, ensure_ascii=False))
+                    for key, (route, page) in entries.items()
+                ],
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
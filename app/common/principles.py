@@ -0,0 +1,141 @@
+# =========================================================
+# GPIFのスチュワードシップ活動原則
+# =========================================================
+# 原則の定義と、各原則の ○ 項目（要求事項）の分解・検索クエリ化を行う。
+
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+GPIF_PRINCIPLES = {
+    "原則1": {
+        "title": "運用受託機関におけるコーポレート・ガバナンス体制",
+        "description": """○運用受託機関は、日本版スチュワードシップ・コードを受け入れること。
+○運用受託機関は、自らのコーポレート・ガバナンス体制を整えること。特に、運用機関としての独立性、透明性を高めるため、独立性の高い社外取締役を導入する等、監督の仕組みを整えること。
+○運用受託機関は、スチュワードシップ責任を実効的に果たすための組織・体制の構築、人材育成を行うこと。
+○運用受託機関は、役職員の報酬体系がどのように受益者の利益に合致しているか説明を行うこと。"""
+    },
+    "原則2": {
+        "title": "運用受託機関における利益相反管理",
+        "description": """○運用受託機関は、受益者の利益を第一として行動するために、適切に利益相反（企業グループに所属する場合には、グループ内における利益相反を含む。）を管理すること。管理に当たっては、利益相反の種類を資本関係、取引関係等に類型化した上で、管理方針を策定し、公表すること。
+○運用受託機関は、独立性の高い第三者委員会の設置等、利益相反を防止するための体制・仕組みを構築し、公表すること。第三者委員会の構成は、独立性、経験等も十分考慮して検討すること。
+○運用受託機関は、自社又は親会社、グループ会社等の利害関係先に対して議決権行使を行う場合、第三者委員会等による行使判断や妥当性の検討、議決権行使助言会社の推奨の適用等、恣意性を排除し、ガバナンスのベストプラクティスを追求する仕組みを整え、公表すること。"""
+    },
+    "原則3": {
+        "title": "エンゲージメントを含むスチュワードシップ活動方針",
+        "description": """○運用受託機関は、エンゲージメントを含むスチュワードシップ活動を実施するに当たり、スチュワードシップ活動方針を策定し、公表すること。
+○運用受託機関は、エンゲージメントを含むスチュワードシップ活動についてはショートターミズムに陥らないよう、長期の視点からリスク調整後のリターン向上に資する内容、質を重視して取り組むこと。また、実効的な活動が行えるよう、アクションプランの策定等も検討すること。
+○運用受託機関は、エンゲージメントを含むスチュワードシップ活動と運用の連携を図ること。
+○運用受託機関は、インデックス構成が投資パフォーマンスを大きく左右する要素であることを踏まえ、インデックス会社が実施するコンサルテーションの機会を活用する等、受益者の利益のため、積極的にエンゲージメントを行うこと。
+○運用受託機関は、市場全体の持続的成長の観点から、企業やインデックス会社にとどまらず関係者と幅広くエンゲージメントを行うこと。
+○運用受託機関は、コーポレート・ガバナンスに関する報告書、統合報告書等に記載の非財務情報も十分に活用し企業とエンゲージメントを行うこと。
+○運用受託機関は、各国のコーポレートガバナンス・コード又はそれに準ずるものの各原則において、企業が「実施しない理由」を説明している項目について、企業の考えを十分にヒアリングすること。
+○特に、株式のパッシブ運用を行う運用受託機関は、市場全体の持続的成長を目指す観点から、エンゲージメントの戦略を立案し、実効性のある取組みを実践すること。
+○運用受託機関は、エンゲージメント代行会社を利用する場合、採用に当たり、組織体制、人員等についてデューディリジェンスを実施するとともに、採用後にはサービス内容についてモニタリング・評価を継続的に行い、必要に応じてエンゲージメントを行うこと。"""
+    },
+    "原則4": {
+        "title": "投資におけるESGなどのサステナビリティの考慮",
+        "description": """○投資においてESG（環境・社会・ガバナンス）などのサステナビリティを適切に考慮することは、運用資産の長期的な投資収益拡大の観点から、企業価値の向上や投資先及び市場全体の持続的成長に資すると考えられることから、運用受託機関は、セクターにおける重要性、投資先の実情等を踏まえて、ESGなどのサステナビリティ課題に取り組むこと。
+○運用受託機関は、重大なESGなどのサステナビリティ課題について、投資家として考える目標を示し、積極的にエンゲージメントを行うこと。
+○運用受託機関は、PRI（責任投資原則）への署名を行うこと。また、ESGなどのサステナビリティに関する様々なイニシアティブに積極的に参加すること。"""
+    },
+    "原則5": {
+        "title": "議決権行使",
+        "description": """○運用受託機関は、議決権の行使について、GPIFから委託されたものであることを十分認識し、受託者責任の観点から専ら受益者の利益のために議決権を行使すること。
+○運用受託機関は、企業価値向上を促すエンゲージメントの一環として、別に定める議決権行使原則のとおり、議決権を行使すること。
+○運用受託機関は、議決権行使において議決権行使助言会社を利用する場合、採用に当たり、組織体制、人員等についてデューディリジェンスを実施するとともに、採用後にはその助言内容についてモニタリング・評価を継続的に行い、必要に応じてエンゲージメントを行うこと（利益相反管理を目的とする場合は除く。）。"""
+    }
+}
+
+
+# 検索クエリから除く定型句
+_QUERY_PREFIXES = ("特に、", "運用受託機関は、")
+_QUERY_SUFFIX_PATTERN = re.compile(r"(を行うこと|すること|こと)。?$")
+
+
+@dataclass(frozen=True)
+class Requirement:
+    """原則の ○ 項目1件"""
+    principle: str
+    index: int
+    text: str
+
+    @property
+    def requirement_id(self) -> str:
+        return f"{self.principle}-{self.index}"
+
+    @property
+    def query(self) -> str:
+        return requirement_query(self.text)
+
+
+def requirement_items(principle_data: Dict[str, Any]) -> List[str]:
+    """原則の説明文を ○ 項目ごとに分割"""
+    items = []
+    for line in principle_data.get("description", "").split("\n"):
+        line = line.strip()
+        if line.startswith("○"):
+            items.append(line[1:].strip())
+        elif line and items:
+            # 折り返された行は直前の項目に連結
+            items[-1] += line
+    return items
+
+
+def requirement_query(text: str) -> str:
+    """要求事項の文から検索用のクエリを作成（主語・文末の定型句を除く）"""
+    query = text.strip()
+    changed = True
+    while changed:
+        changed = False
+        for prefix in _QUERY_PREFIXES:
+            if query.startswith(prefix):
+                query = query[len(prefix):]
+                changed = True
+    # 最初の文（要求の主旨）のみを使う
+    query = _first_sentence(query)
+    return _QUERY_SUFFIX_PATTERN.sub("", query).strip()
+
+
+def _first_sentence(text: str) -> str:
+    """括弧内の句点を除いて最初の文を取り出す"""
+    depth = 0
+    for i, ch in enumerate(text):
+        if ch in "（(「":
+            depth += 1
+        elif ch in "）)」":
+            depth = max(depth - 1, 0)
+        elif ch == "。" and depth == 0:
+            return text[:i + 1]
+    return text
+
+
+def principle_requirements(principle_key: str, principle_data: Dict[str, Any]) -> List[Requirement]:
+    """1つの原則の要求事項リスト"""
+    return [
+        Requirement(principle=principle_key, index=i, text=text)
+        for i, text in enumerate(requirement_items(principle_data), start=1)
+    ]
+
+
+def all_requirements(principles: Dict[str, Dict[str, Any]] = None) -> List[Requirement]:
+    """全原則の要求事項を定義順に取得"""
+    principles = principles if principles is not None else GPIF_PRINCIPLES
+    requirements = []
+    for key, principle in principles.items():
+        requirements.extend(principle_requirements(key, principle))
+    return requirements
+
+
+_PRINCIPLE_MENTION_PATTERN = re.compile(r"原則\s*([0-9０-９]+)")
+
+
+def mentioned_principles(text: str, principles: Dict[str, Dict[str, Any]] = None) -> List[str]:
+    """文中で言及されている原則のキー（例: 「原則3」）を出現順に取得"""
+    principles = principles if principles is not None else GPIF_PRINCIPLES
+    keys = []
+    for number in _PRINCIPLE_MENTION_PATTERN.findall(text or ""):
+        key = f"原則{int(number)}"
+        if key in principles and key not in keys:
+            keys.append(key)
+    return keys
@@ -0,0 +1,315 @@
+# =========================================================
+# 言語をまたぐ検索（クエリの英訳と結果の統合）
+# =========================================================
+# 質問は日本語でも、海外年金基金のレポート（CalPERS・CalSTRS・CPP・NBIM・TSP・Temasek など）は
+# 英語のため、日本語のクエリだけでは関連するチャンクが上位に来にくい。
+# - クエリの言語を判定し、日本語なら軽量モデルで英語の検索クエリに書き換える
+# - 元のクエリと英訳クエリの Cortex Search を並行して実行し、RRF（順位の逆数の和）で統合する
+# - 英訳はクエリのハッシュをキーにテーブル（QUERY_TRANSLATION_CACHE）とメモリに保存し、
+#   同じ質問・要求事項の2回目以降は COMPLETE を呼ばない
+# - 英訳の COMPLETE は CompletionExecutor の "translation" フローで実行し、短い期限
+#   （TRANSLATION_TIMEOUT_SEC）を過ぎたらキャンセルする
+# 英訳に失敗・期限切れの場合は元のクエリの検索結果だけを返す。
+
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import streamlit as st
+
+from common.completion_executor import (
+    CompletionExecutor,
+    CompletionTimeoutError,
+    FlowPolicy,
+    get_latency_tracker,
+    snowpark_starter,
+)
+from common.query_layer import QueryLayer, Statement
+from common.resources import get_session
+from common.search import format_context, query_cortex_search
+
+QUERY_TRANSLATION_TABLE = "QUERY_TRANSLATION_CACHE"
+QUERY_EXPANSION_DATABASE = "DEMO_DB"
+QUERY_EXPANSION_SCHEMA = "DEMO_SUSTAINABILITY"
+
+TRANSLATION_MODEL = "llama3.1-8b"
+# プロンプト・モデルを変更したら更新する（キャッシュのキーに含める）
+TRANSLATION_PROMPT_VERSION = "t1"
+TRANSLATION_MEMORY_SIZE = 1024
+# 英訳を待つ上限（元のクエリの検索は並行して進むため、待ちすぎるより英訳なしで返す）
+TRANSLATION_FLOW = "translation"
+TRANSLATION_TIMEOUT_SEC = 5.0
+TRANSLATION_POLICY = FlowPolicy(timeout_sec=TRANSLATION_TIMEOUT_SEC, initial_hedge_sec=2.0, min_hedge_sec=0.5)
+# RRF の定数（順位 r の結果に 1 / (RRF_K + r) を加点する）
+RRF_K = 60
+
+LANGUAGE_JA = "ja"
+LANGUAGE_EN = "en"
+LANGUAGE_OTHER = "other"
+
+_KANA = re.compile(r"[぀-ヿ]")
+_KANJI = re.compile(r"[㐀-䶿一-鿿]")
+_LATIN = re.compile(r"[A-Za-z]")
+# かなを含まない場合に日本語とみなす漢字の割合（英字との比）
+_KANJI_RATIO = 0.3
+
+TRANSLATION_PROMPT = """You rewrite Japanese search queries about pension fund sustainability reports into English.
+Output only one English search query. Keep proper nouns, fund names, numbers and years.
+Do not answer the question and do not add explanations.
+
+Japanese query: {query}
+English query:"""
+
+QUERY_EXPANSION_STATEMENTS = [
+    Statement(
+        "translation_cache_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + QUERY_TRANSLATION_TABLE + """ (
+            QUERY_HASH STRING,
+            SOURCE_LANGUAGE STRING,
+            TARGET_LANGUAGE STRING,
+            QUERY STRING,
+            TRANSLATION STRING,
+            MODEL STRING,
+            PROMPT_VERSION STRING,
+            CREATED_AT TIMESTAMP_NTZ
+        )
+        """,
+    ),
+    Statement(
+        "translation_cache_lookup",
+        """
+        SELECT TRANSLATION
+        FROM {db}.{schema}.""" + QUERY_TRANSLATION_TABLE + """
+        WHERE QUERY_HASH = ?
+        LIMIT 1
+        """,
+    ),
+    Statement(
+        "translation_complete",
+        """
+        SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS RESPONSE
+        """,
+    ),
+    Statement(
+        # params: [ハッシュ, 元の言語, 訳先の言語, クエリ, 訳, モデル, プロンプトの版]
+        "translation_cache_merge",
+        """
+        MERGE INTO {db}.{schema}.""" + QUERY_TRANSLATION_TABLE + """ c
+        USING (
+            SELECT ? AS QUERY_HASH, ? AS SOURCE_LANGUAGE, ? AS TARGET_LANGUAGE, ? AS QUERY,
+                   ? AS TRANSLATION, ? AS MODEL, ? AS PROMPT_VERSION
+        ) s
+        ON c.QUERY_HASH = s.QUERY_HASH
+        WHEN NOT MATCHED THEN INSERT
+            (QUERY_HASH, SOURCE_LANGUAGE, TARGET_LANGUAGE, QUERY, TRANSLATION, MODEL, PROMPT_VERSION, CREATED_AT)
+            VALUES (s.QUERY_HASH, s.SOURCE_LANGUAGE, s.TARGET_LANGUAGE, s.QUERY, s.TRANSLATION,
+                    s.MODEL, s.PROMPT_VERSION, CURRENT_TIMESTAMP()::TIMESTAMP_NTZ)
+        """,
+    ),
+]
+
+
+# =========================================================
+# 言語判定
+# =========================================================
+def detect_language(text: str) -> str:
+    """クエリの言語（かなを含む、または漢字の割合が高ければ日本語）"""
+    text = text or ""
+    if _KANA.search(text):
+        return LANGUAGE_JA
+    kanji = len(_KANJI.findall(text))
+    latin = len(_LATIN.findall(text))
+    if kanji and kanji >= (kanji + latin) * _KANJI_RATIO:
+        return LANGUAGE_JA
+    if latin:
+        return LANGUAGE_EN
+    return LANGUAGE_OTHER
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query or "")).strip()
+
+
+def _clean_translation(response: str) -> str:
+    """モデルの応答から英訳クエリの1行だけを取り出す"""
+    for line in (response or "").splitlines():
+        line = line.strip()
+        if line.lower().startswith("english query:"):
+            line = line.split(":", 1)[1]
+        line = line.strip().strip('"“”').strip()
+        if line:
+            return line
+    return ""
+
+
+# =========================================================
+# 英訳（テーブル + メモリのキャッシュ）
+# =========================================================
+class QueryTranslator:
+    """クエリを英語の検索クエリに書き換える（結果はキャッシュし、2回目以降はモデルを呼ばない）
+
+    executor を省略した場合は query_layer の translation_complete を TRANSLATION_POLICY で実行する。
+    """
+
+    def __init__(
+        self,
+        query_layer,
+        model: str = TRANSLATION_MODEL,
+        memory_size: int = TRANSLATION_MEMORY_SIZE,
+        executor: Optional[CompletionExecutor] = None,
+    ):
+        self.query_layer = query_layer
+        self.model = model
+        self.memory_size = memory_size
+        self.executor = executor or CompletionExecutor(
+            snowpark_starter(query_layer, "translation_complete"), {TRANSLATION_FLOW: TRANSLATION_POLICY}
+        )
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_ready = False
+        self.stats = {"memory_hits": 0, "table_hits": 0, "completions": 0, "timeouts": 0, "failures": 0}
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("translation_cache_create")
+            self._table_ready = True
+
+    def cache_key(self, query: str, target: str = LANGUAGE_EN) -> str:
+        key = f"{TRANSLATION_PROMPT_VERSION}:{self.model}:{target}:{normalize_query(query)}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    def _remember(self, key: str, translation: str):
+        with self._lock:
+            self._memory[key] = translation
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def cached(self, query: str) -> Optional[str]:
+        """メモリにある英訳（なければ None。テーブル・モデルは呼ばない）"""
+        with self._lock:
+            return self._memory.get(self.cache_key(query))
+
+    def translate(self, query: str) -> Optional[str]:
+        """英語の検索クエリ（失敗時は None）"""
+        query = normalize_query(query)
+        if not query:
+            return None
+        key = self.cache_key(query)
+        with self._lock:
+            translation = self._memory.get(key)
+            if translation is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return translation
+        try:
+            self._ensure_table()
+            translation = self.query_layer.scalar("translation_cache_lookup", [key])
+            if translation:
+                self._count("table_hits")
+            else:
+                prompt = TRANSLATION_PROMPT.format(query=query)
+                translation = _clean_translation(self.executor.complete(TRANSLATION_FLOW, self.model, prompt).text)
+                if not translation:
+                    self._count("failures")
+                    return None
+                self._count("completions")
+                self.query_layer.collect("translation_cache_merge", [
+                    key, LANGUAGE_JA, LANGUAGE_EN, query, translation, self.model, TRANSLATION_PROMPT_VERSION,
+                ])
+        except CompletionTimeoutError:
+            # 期限切れの英訳は待たずに元のクエリだけで検索する
+            self._count("timeouts")
+            return None
+        except Exception:
+            # 英訳できなくても元のクエリでの検索は行える
+            self._count("failures")
+            return None
+        self._remember(key, translation)
+        return translation
+
+
+# =========================================================
+# 検索結果の統合
+# =========================================================
+def _row_key(row: Dict[str, Any]) -> Tuple:
+    if row.get("chunk_id"):
+        return ("id", row["chunk_id"])
+    return ("text", row.get("file_name"), row.get("page_index"), row.get("chunk"))
+
+
+def fuse_results(result_lists: Sequence[List[Dict[str, Any]]], num_results: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """複数の検索結果を RRF で統合し、上位 num_results 件を返す（同じチャンクは1件にまとめる）"""
+    scores: Dict[Tuple, float] = {}
+    rows: Dict[Tuple, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, row in enumerate(results, start=1):
+            key = _row_key(row)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            rows.setdefault(key, row)
+    # 同点は先に渡した検索（元のクエリ）の順位を優先する
+    ordered = sorted(scores, key=lambda key: -scores[key])[:num_results]
+    return [dict(rows[key], idx=i) for i, key in enumerate(ordered, start=1)]
+
+
+class CrossLingualSearch:
+    """query_cortex_search の前段で、日本語のクエリを英訳クエリでも検索して統合する"""
+
+    def __init__(self, translator: QueryTranslator, max_workers: int = 8):
+        self.translator = translator
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cross_lingual")
+
+    def expands(self, query: str, service_config: Dict[str, Any]) -> bool:
+        return bool(service_config.get("cross_lingual")) and detect_language(query) == LANGUAGE_JA
+
+    def search(
+        self,
+        root,
+        query: str,
+        service_config: Dict[str, Any],
+        num_results: int = 5,
+        filter_obj: Optional[Dict[str, Any]] = None,
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """query_cortex_search と同じ形式で (コンテキストテキスト, 行リスト) を返す"""
+        if not self.expands(query, service_config):
+            return query_cortex_search(root, query, service_config, num_results, filter_obj)
+
+        # 元のクエリの検索は英訳を待たずに始める
+        original = self._executor.submit(query_cortex_search, root, query, service_config, num_results, filter_obj)
+        translation = self.translator.translate(query)
+        translated = None
+        if translation and normalize_query(translation) != normalize_query(query):
+            translated = self._executor.submit(
+                query_cortex_search, root, translation, service_config, num_results, filter_obj
+            )
+        _, rows = original.result()
+        if translated is None:
+            return format_context(rows), rows
+        try:
+            _, translated_rows = translated.result()
+        except Exception:
+            return format_context(rows), rows
+        fused = fuse_results([rows, translated_rows], num_results)
+        return format_context(fused), fused
+
+
+@st.cache_resource
+def get_cross_lingual_search() -> CrossLingualSearch:
+    """全セッション・全ページで共有する言語横断検索（英訳のメモリキャッシュを共有）"""
+    identifiers = {"db": QUERY_EXPANSION_DATABASE, "schema": QUERY_EXPANSION_SCHEMA}
+    query_layer = QueryLayer(get_session, QUERY_EXPANSION_STATEMENTS, identifiers)
+    executor = CompletionExecutor(
+        snowpark_starter(query_layer, "translation_complete"),
+        {TRANSLATION_FLOW: TRANSLATION_POLICY},
+        tracker=get_latency_tracker(),
+    )
+    return CrossLingualSearch(QueryTranslator(query_layer, executor=executor))
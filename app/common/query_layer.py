@@ -0,0 +1,187 @@
+# =========================================================
+# パラメータバインド方式のSQLクエリレイヤー
+# =========================================================
+# - ステートメントは名前付きで一度だけ定義し、セッションごとに準備する
+# - 値はすべて ? でバインドし、f-stringでのSQL組み立てを行わない
+# - ステートメントごとに実行回数・所要時間を記録する
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import streamlit as st
+
+
+@dataclass(frozen=True)
+class Statement:
+    """名前付きSQLステートメント
+
+    sql内の {db} などのプレースホルダは識別子（準備時に一度だけ置換）、
+    値は ? でバインドする。パラメータに list/tuple を渡すと、対応する ? が
+    要素数分のプレースホルダ（IN句用）に展開される。
+    """
+    name: str
+    sql: str
+
+
+@dataclass
+class StatementStats:
+    """ステートメント単位の実行統計"""
+    calls: int = 0
+    errors: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+def _expand_params(sql: str, params: Sequence[Any]) -> Tuple[str, List[Any]]:
+    """list/tupleのパラメータを IN句用の複数プレースホルダに展開"""
+    if not any(isinstance(p, (list, tuple)) for p in params):
+        return sql, list(params)
+
+    parts = []
+    flat_params: List[Any] = []
+    param_iter = iter(params)
+    in_quote = False
+    for ch in sql:
+        if ch == "'":
+            in_quote = not in_quote
+        if ch == "?" and not in_quote:
+            value = next(param_iter)
+            if isinstance(value, (list, tuple)):
+                if not value:
+                    # 空リストは常に偽となる条件にする
+                    parts.append("NULL")
+                    continue
+                parts.append(", ".join(["?"] * len(value)))
+                flat_params.extend(value)
+            else:
+                parts.append("?")
+                flat_params.append(value)
+            continue
+        parts.append(ch)
+    return "".join(parts), flat_params
+
+
+class QueryLayer:
+    """名前付き・バインド済みステートメントを実行するクエリレイヤー"""
+
+    def __init__(self, session, statements: Sequence[Statement], identifiers: Optional[Dict[str, str]] = None):
+        # セッションの代わりに取得関数を渡すと、最初のクエリ実行時まで取得を遅らせる
+        self._session = None if callable(session) else session
+        self._session_factory = session if callable(session) else None
+        self._prepared: Dict[str, str] = {}
+        self.stats: Dict[str, StatementStats] = {}
+        # 並列実行時も統計が欠けないようにする
+        self._stats_lock = threading.Lock()
+        self.register(statements, identifiers or {})
+
+    @property
+    def session(self):
+        """Snowparkセッション（取得関数が渡された場合は初回の参照時に取得）"""
+        if self._session is None:
+            self._session = self._session_factory()
+        return self._session
+
+    def register(self, statements: Sequence[Statement], identifiers: Dict[str, str]):
+        """ステートメントを識別子で展開して登録"""
+        for statement in statements:
+            self._prepared[statement.name] = statement.sql.format(**identifiers)
+            self.stats.setdefault(statement.name, StatementStats())
+
+    def has(self, name: str) -> bool:
+        return name in self._prepared
+
+    def sql_text(self, name: str) -> str:
+        """準備済みのSQL文字列を取得"""
+        return self._prepared[name]
+
+    def dataframe(self, name: str, params: Optional[Sequence[Any]] = None):
+        """Snowpark DataFrameを返す（遅延評価。計測は呼び出し側で行う）"""
+        sql, flat_params = _expand_params(self._prepared[name], params or [])
+        if flat_params:
+            return self.session.sql(sql, params=flat_params)
+        return self.session.sql(sql)
+
+    def collect(self, name: str, params: Optional[Sequence[Any]] = None) -> List[Any]:
+        """ステートメントを実行して行のリストを取得"""
+        return self._timed(name, lambda: self.dataframe(name, params).collect())
+
+    def to_pandas(self, name: str, params: Optional[Sequence[Any]] = None):
+        """ステートメントを実行してpandas DataFrameを取得"""
+        return self._timed(name, lambda: self.dataframe(name, params).to_pandas())
+
+    def scalar(self, name: str, params: Optional[Sequence[Any]] = None, default: Any = None) -> Any:
+        """1行1列目の値を取得"""
+        rows = self.collect(name, params)
+        return rows[0][0] if rows else default
+
+    def timed_iter(self, name: str, iterator: Iterator[Any]) -> Iterator[Any]:
+        """ストリーミング取得を1回の実行として計測"""
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield from iterator
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._record(name, (time.perf_counter() - start) * 1000, failed)
+
+    def _timed(self, name: str, fn):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return fn()
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._record(name, (time.perf_counter() - start) * 1000, failed)
+
+    def _record(self, name: str, elapsed_ms: float, failed: bool):
+        with self._stats_lock:
+            stats = self.stats.setdefault(name, StatementStats())
+            if failed:
+                stats.errors += 1
+            stats.calls += 1
+            stats.total_ms += elapsed_ms
+            stats.last_ms = elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+
+    def stats_rows(self) -> List[Dict[str, Any]]:
+        """実行済みステートメントの統計を表示用の行リストで取得"""
+        return [
+            {
+                "statement": name,
+                "calls": s.calls,
+                "errors": s.errors,
+                "avg_ms": round(s.avg_ms, 1),
+                "max_ms": round(s.max_ms, 1),
+                "last_ms": round(s.last_ms, 1),
+            }
+            for name, s in self.stats.items()
+            if s.calls > 0
+        ]
+
+
+def get_query_layer(session, statements: Sequence[Statement], identifiers: Dict[str, str], key: str = "query_layer") -> QueryLayer:
+    """Streamlitセッションごとに1つのクエリレイヤーを準備して再利用
+
+    session にはセッションを返す関数（common.resources.get_session）も渡せる。
+    """
+    layer = st.session_state.get(key)
+    if layer is None:
+        layer = QueryLayer(session, statements, identifiers)
+        st.session_state[key] = layer
+    else:
+        # ページごとに異なるステートメントを追加登録
+        missing = [s for s in statements if not layer.has(s.name)]
+        if missing:
+            layer.register(missing, identifiers)
+    return layer
@@ -0,0 +1,129 @@
+# =========================================================
+# レポート本文（チャンクテキスト）のローダー
+# =========================================================
+# - チャンクはArrowバッチ単位でページ順にストリーミング取得する
+# - (file_name, チャンクテーブルのバージョン, 件数上限) をキーとしたLRUキャッシュを持ち、
+#   同じレポートの2回目以降の読み込みではSnowflakeへのI/Oを行わない
+# - キャッシュ全体のサイズは max_cache_bytes で上限を設ける
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_MAX_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_VERSION_TTL_SEC = 300
+
+
+def _iter_text_batches(dataframe, column: str) -> Iterator[List[str]]:
+    """Snowpark DataFrameからテキスト列をバッチ単位で取得"""
+    if hasattr(dataframe, "to_arrow_batches"):
+        for table in dataframe.to_arrow_batches():
+            names = {name.upper(): name for name in table.column_names}
+            yield [t for t in table.column(names[column]).to_pylist() if t is not None]
+    else:
+        for batch in dataframe.to_pandas_batches():
+            yield [t for t in batch[column].tolist() if t is not None]
+
+
+class ReportTextLoader:
+    """チャンクテキストのストリーミング取得とLRUキャッシュ
+
+    I/Oは呼び出し側のクエリレイヤー経由で行うため、インスタンスは
+    st.cache_resource で全セッション共有できる。
+    """
+
+    def __init__(
+        self,
+        chunk_statement: str = "report_chunk_stream",
+        version_statement: str = "chunk_table_version",
+        version_params: Optional[Sequence[Any]] = None,
+        max_cache_bytes: int = DEFAULT_MAX_CACHE_BYTES,
+        version_ttl_sec: float = DEFAULT_VERSION_TTL_SEC,
+    ):
+        self.chunk_statement = chunk_statement
+        self.version_statement = version_statement
+        self.version_params = list(version_params or [])
+        self.max_cache_bytes = max_cache_bytes
+        self.version_ttl_sec = version_ttl_sec
+        self._cache: "OrderedDict[Tuple[str, str, Optional[int]], Tuple[List[str], int]]" = OrderedDict()
+        self._cache_bytes = 0
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # -----------------------------------------------------
+    # バージョン管理
+    # -----------------------------------------------------
+    def version(self, query_layer) -> str:
+        """チャンクテーブルのバージョン（TTL付きでキャッシュ）"""
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked_at > self.version_ttl_sec:
+            value = query_layer.scalar(self.version_statement, self.version_params, default=None)
+            self._version = str(value) if value is not None else ""
+            self._version_checked_at = now
+        return self._version
+
+    def invalidate_version(self):
+        """レポート追加後などにバージョンを再取得させる"""
+        self._version = None
+
+    # -----------------------------------------------------
+    # 取得
+    # -----------------------------------------------------
+    def iter_chunks(self, query_layer, file_name: str, limit: Optional[int] = None) -> Iterator[str]:
+        """チャンクテキストをページ順に1件ずつ返す"""
+        key = (file_name, self.version(query_layer), limit)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        if cached is not None:
+            yield from cached[0]
+            return
+
+        self.misses += 1
+        chunks: List[str] = []
+        size = 0
+        cacheable = True
+        dataframe = query_layer.dataframe(self.chunk_statement, [file_name, limit])
+        for batch in query_layer.timed_iter(self.chunk_statement, _iter_text_batches(dataframe, "CHUNK_TEXT")):
+            for text in batch:
+                if cacheable:
+                    chunks.append(text)
+                    size += len(text.encode("utf-8"))
+                    if size > self.max_cache_bytes:
+                        # 上限を超えるレポートはキャッシュせずストリーミングのみ
+                        cacheable = False
+                        chunks = []
+                yield text
+
+        if cacheable:
+            self._store(key, chunks, size)
+
+    def get_text(self, query_layer, file_name: str, limit: Optional[int] = None, separator: str = "\n\n") -> str:
+        """チャンクテキストを結合したレポート本文を取得"""
+        return separator.join(self.iter_chunks(query_layer, file_name, limit))
+
+    def _store(self, key, chunks: List[str], size: int):
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_bytes -= previous[1]
+            self._cache[key] = (chunks, size)
+            self._cache_bytes += size
+            while self._cache_bytes > self.max_cache_bytes and self._cache:
+                _, (_, evicted_size) = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted_size
+
+    def cache_info(self) -> dict:
+        return {
+            "entries": len(self._cache),
+            "bytes": self._cache_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,186 @@
+# =========================================================
+# 要求事項ごとの検索結果の事前取得（プリフェッチ）
+# =========================================================
+# 原則の ○ 項目（要求事項）ごとの検索を、レポート取り込み時に対象ファイルに
+# 絞って実行し、上位k件の chunk_id を (ファイル, 要求事項) ごとに保存する。
+# 評価・チャットでは保存済みの根拠チャンクから始めるため、検索の待ち時間がかからない。
+
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from common.principles import Requirement
+from common.query_layer import Statement
+
+EVIDENCE_TABLE = "REQUIREMENT_EVIDENCE"
+DEFAULT_TOP_K = 5
+DEFAULT_MAX_WORKERS = 8
+
+SearchFn = Callable[[str, Optional[str]], Tuple[str, List[Dict[str, Any]]]]
+Evidence = Dict[str, List[Dict[str, Any]]]
+
+
+def requirement_hash(requirement: Requirement) -> str:
+    """要求事項の文面のハッシュ（文面が変わった項目の根拠は使わない）"""
+    return hashlib.sha256(requirement.text.encode("utf-8")).hexdigest()[:16]
+
+
+EVIDENCE_STATEMENTS = [
+    Statement(
+        "requirement_evidence_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + EVIDENCE_TABLE + """ (
+            FILE_NAME STRING,
+            REQUIREMENT_ID STRING,
+            REQUIREMENT_HASH STRING,
+            QUERY STRING,
+            RANK INT,
+            CHUNK_ID STRING,
+            PREFETCHED_AT TIMESTAMP_NTZ
+        )
+        """,
+    ),
+    Statement(
+        "requirement_evidence_delete",
+        """
+        DELETE FROM {db}.{schema}.""" + EVIDENCE_TABLE + """
+        WHERE FILE_NAME = ?
+        """,
+    ),
+    Statement(
+        # 1ファイル分の全要求事項をJSON配列で受け取り、1回のINSERTで保存する
+        "requirement_evidence_insert",
+        """
+        INSERT INTO {db}.{schema}.""" + EVIDENCE_TABLE + """
+        (FILE_NAME, REQUIREMENT_ID, REQUIREMENT_HASH, QUERY, RANK, CHUNK_ID, PREFETCHED_AT)
+        SELECT ?,
+               f.value:requirement_id::STRING,
+               f.value:requirement_hash::STRING,
+               f.value:query::STRING,
+               f.value:rank::INT,
+               f.value:chunk_id::STRING,
+               CURRENT_TIMESTAMP()::TIMESTAMP_NTZ
+        FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+        """,
+    ),
+    Statement(
+        "requirement_evidence_load",
+        """
+        SELECT e.REQUIREMENT_ID, e.REQUIREMENT_HASH, e.RANK, e.CHUNK_ID,
+               v.FILE_NAME, v.RELATIVE_PATH, v.SCOPED_FILE_URL, v.PAGE_INDEX, v.CHUNK_TEXT
+        FROM {db}.{schema}.""" + EVIDENCE_TABLE + """ e
+        JOIN {db}.{schema}.{chunk_catalog} v
+          ON v.CHUNK_ID = e.CHUNK_ID
+        WHERE e.FILE_NAME = ?
+        ORDER BY e.REQUIREMENT_ID, e.RANK
+        """,
+    ),
+    Statement(
+        # 取り込み直後のチャンクを検索対象にするため、TARGET_LAGを待たずに更新する
+        "search_service_refresh",
+        """
+        ALTER CORTEX SEARCH SERVICE {db}.{schema}.{search_service} REFRESH
+        """,
+    ),
+]
+
+
+class RequirementPrefetcher:
+    """要求事項ごとの検索を対象ファイルに絞って並列実行"""
+
+    def __init__(self, search_fn: SearchFn, top_k: int = DEFAULT_TOP_K, max_workers: int = DEFAULT_MAX_WORKERS):
+        self.search_fn = search_fn
+        self.top_k = top_k
+        self.max_workers = max_workers
+
+    def prefetch(self, file_name: str, requirements: Sequence[Requirement]) -> Evidence:
+        """要求事項IDごとの検索結果（上位k件の行リスト）を取得"""
+        if not requirements:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(requirements))) as executor:
+            results = list(executor.map(lambda r: self.search_fn(r.query, file_name)[1], requirements))
+        return {
+            requirement.requirement_id: rows[:self.top_k]
+            for requirement, rows in zip(requirements, results)
+        }
+
+
+class EvidenceStore:
+    """事前取得した根拠チャンクの保存・読み込み"""
+
+    def __init__(self, query_layer):
+        self.query_layer = query_layer
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("requirement_evidence_create")
+            self._table_ready = True
+
+    def save(self, file_name: str, requirements: Sequence[Requirement], evidence: Evidence) -> int:
+        """ファイルの根拠を置き換えて保存し、保存した行数を返す"""
+        self._ensure_table()
+        records = []
+        for requirement in requirements:
+            for rank, row in enumerate(evidence.get(requirement.requirement_id, []), start=1):
+                if not row.get("chunk_id"):
+                    continue
+                records.append({
+                    "requirement_id": requirement.requirement_id,
+                    "requirement_hash": requirement_hash(requirement),
+                    "query": requirement.query,
+                    "rank": rank,
+                    "chunk_id": row["chunk_id"],
+                })
+        self.query_layer.collect("requirement_evidence_delete", [file_name])
+        if records:
+            self.query_layer.collect(
+                "requirement_evidence_insert",
+                [file_name, json.dumps(records, ensure_ascii=False)],
+            )
+        return len(records)
+
+    def load(self, file_name: str, requirements: Sequence[Requirement]) -> Evidence:
+        """保存済みの根拠を要求事項IDごとに取得（文面が変わった項目は除く）"""
+        self._ensure_table()
+        current_hashes = {r.requirement_id: requirement_hash(r) for r in requirements}
+        evidence: Evidence = {}
+        for row in self.query_layer.collect("requirement_evidence_load", [file_name]):
+            row = row.as_dict()
+            requirement_id = row["REQUIREMENT_ID"]
+            if current_hashes.get(requirement_id) != row["REQUIREMENT_HASH"]:
+                continue
+            rows = evidence.setdefault(requirement_id, [])
+            rows.append({
+                "idx": len(rows) + 1,
+                "chunk_id": row["CHUNK_ID"],
+                "file_name": row["FILE_NAME"],
+                "relative_path": row["RELATIVE_PATH"],
+                "file_url": row["SCOPED_FILE_URL"],
+                "page_index": row["PAGE_INDEX"] if row["PAGE_INDEX"] is not None else "",
+                "chunk": row["CHUNK_TEXT"],
+            })
+        return evidence
+
+
+def evidence_digest(
+    requirements: Sequence[Requirement],
+    evidence: Evidence,
+    per_requirement: int = 3,
+    max_chars: int = 300,
+) -> str:
+    """Agentへの質問に添える根拠の抜粋（要求事項ごとに上位数件）"""
+    lines = []
+    for requirement in requirements:
+        rows = evidence.get(requirement.requirement_id, [])[:per_requirement]
+        if not rows:
+            continue
+        lines.append(f"■ {requirement.requirement_id}: {requirement.query}")
+        for row in rows:
+            text = str(row.get("chunk", "")).replace("\n", " ")
+            if len(text) > max_chars:
+                text = text[:max_chars] + "..."
+            page = f"（p.{row['page_index']}）" if row.get("page_index") not in (None, "") else ""
+            lines.append(f"- {text}{page}")
+    return "\n".join(lines)
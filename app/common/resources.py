@@ -0,0 +1,61 @@
+# =========================================================
+# Snowflake接続ハンドルの遅延作成
+# =========================================================
+# ページ表示時（import時）には重いモジュールの読み込みや接続ハンドルの作成を行わず、
+# 初回に使う時点で作成して st.cache_resource で共有する。
+# - Snowparkセッション / snowflake.core.Root / _snowflake は初回利用時に取得
+# - CURRENT_DATABASE() 等の表示用の情報はバックグラウンドで取得し、描画を待たせない
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional, Tuple
+
+import streamlit as st
+
+
+@st.cache_resource
+def get_session():
+    """Snowparkセッション（初回利用時に取得）"""
+    from snowflake.snowpark.context import get_active_session
+    return get_active_session()
+
+
+@st.cache_resource
+def get_root():
+    """Snowflake Python API のルート（Cortex Search 等を使うときに作成）"""
+    from snowflake.core import Root
+    return Root(get_session())
+
+
+def send_snow_api_request(*args: Any, **kwargs: Any):
+    """_snowflake.send_snow_api_request（モジュールは初回の呼び出し時に読み込む）
+
+    ストリーミングには対応しておらず、応答本文をすべて受信してから返す。
+    """
+    import _snowflake
+    return _snowflake.send_snow_api_request(*args, **kwargs)
+
+
+# =========================================================
+# バックグラウンドでの取得
+# =========================================================
+@st.cache_resource
+def _background_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="resources")
+
+
+def _query_current_context() -> Tuple[str, str]:
+    row = get_session().sql("SELECT CURRENT_DATABASE(), CURRENT_SCHEMA()").collect()[0]
+    return row[0], row[1]
+
+
+@st.cache_resource
+def _current_context_future() -> Future:
+    return _background_executor().submit(_query_current_context)
+
+
+def current_context() -> Optional[Tuple[str, str]]:
+    """接続中の (データベース, スキーマ)。取得が終わっていなければ待たずに None を返す"""
+    future = _current_context_future()
+    if not future.done() or future.exception() is not None:
+        return None
+    return future.result()
@@ -0,0 +1,300 @@
+# =========================================================
+# 原則別評価のスコアカード
+# =========================================================
+# 評価結果（Agentの回答テキスト / 高速評価の結果）から ○ 項目ごとの判定を一度だけ
+# 取り出し、型付きの行として保存する。集計・運用機関の比較・エクスポートは
+# 保存済みの行に対してpandasのベクトル演算で行い、回答テキストは読み直さない。
+
+import io
+import json
+import re
+from dataclasses import asdict, dataclass
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from common.fast_evaluation import (
+    VERDICT_ICONS,
+    VERDICT_NONE,
+    VERDICT_PARTIAL,
+    VERDICT_SUPPORTED,
+    match_verdict,
+)
+from common.principles import Requirement
+from common.query_layer import Statement
+
+SCORECARD_TABLE = "PRINCIPLE_SCORECARD"
+
+VERDICT_SCORES = {
+    VERDICT_SUPPORTED: 1.0,
+    VERDICT_PARTIAL: 0.5,
+    VERDICT_NONE: 0.0,
+}
+VERDICT_ORDER = [VERDICT_SUPPORTED, VERDICT_PARTIAL, VERDICT_NONE]
+
+# 項目の文面が一致しない場合に、順番での対応付けに切り替える類似度
+_MATCH_THRESHOLD = 0.4
+_ITEM_PATTERN = re.compile(r"^\s*\**\s*○\s*(.+?)\**\s*$")
+_JSON_BLOCK_PATTERN = re.compile(r"```(?:json)?\s*(\[.*?\])\s*```", re.DOTALL)
+
+
+@dataclass
+class ScorecardRow:
+    """○ 項目1件の判定（型付きの行）"""
+    file_name: str
+    principle: str
+    requirement_id: str
+    requirement: str
+    verdict: str
+    score: float
+    engine: str
+    spec_version: str
+    evaluated_at: str
+
+
+# =========================================================
+# 判定の抽出
+# =========================================================
+def parse_markdown_verdicts(markdown: str) -> List[Dict[str, str]]:
+    """「**○ 要求事項**」〜「**評価:** ✅ ...」の組を順に取り出す"""
+    items: List[Dict[str, str]] = []
+    current: Optional[Dict[str, str]] = None
+    for line in (markdown or "").splitlines():
+        item_match = _ITEM_PATTERN.match(line)
+        if item_match:
+            current = {"item": item_match.group(1).strip(" *"), "verdict": ""}
+            items.append(current)
+            continue
+        if current is not None and not current["verdict"] and ("評価:" in line or "評価：" in line):
+            current["verdict"] = match_verdict(line) or ""
+    return [item for item in items if item["verdict"]]
+
+
+def parse_json_verdicts(text: str) -> List[Dict[str, str]]:
+    """JSON形式（[{"requirement": ..., "verdict": ...}]）で出力された判定を取り出す"""
+    match = _JSON_BLOCK_PATTERN.search(text or "")
+    if not match:
+        return []
+    try:
+        data = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return []
+    items = []
+    for entry in data if isinstance(data, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        verdict = match_verdict(str(entry.get("verdict", "")))
+        if verdict:
+            items.append({
+                "item": str(entry.get("requirement") or entry.get("item") or ""),
+                "verdict": verdict,
+                "requirement_id": str(entry.get("requirement_id") or ""),
+            })
+    return items
+
+
+def _similarity(a: str, b: str) -> float:
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def match_requirements(items: Sequence[Dict[str, str]], requirements: Sequence[Requirement]) -> Dict[str, str]:
+    """抽出した項目を要求事項IDに対応付けて {requirement_id: 判定} を返す
+
+    文面の類似度で対応付け、一致しない項目は出現順で割り当てる。
+    回答に含まれない要求事項は「情報なし」とする。
+    """
+    verdicts: Dict[str, str] = {}
+    unmatched = []
+    by_id = {r.requirement_id: r for r in requirements}
+    for item in items:
+        requirement_id = item.get("requirement_id")
+        if requirement_id in by_id and requirement_id not in verdicts:
+            verdicts[requirement_id] = item["verdict"]
+            continue
+        candidates = [r for r in requirements if r.requirement_id not in verdicts]
+        best = max(candidates, key=lambda r: _similarity(item["item"], r.text), default=None)
+        if best is not None and _similarity(item["item"], best.text) >= _MATCH_THRESHOLD:
+            verdicts[best.requirement_id] = item["verdict"]
+        else:
+            unmatched.append(item)
+
+    remaining = [r for r in requirements if r.requirement_id not in verdicts]
+    for requirement, item in zip(remaining, unmatched):
+        verdicts[requirement.requirement_id] = item["verdict"]
+    for requirement in requirements:
+        verdicts.setdefault(requirement.requirement_id, VERDICT_NONE)
+    return verdicts
+
+
+def build_scorecard_rows(
+    file_name: str,
+    result: Dict[str, Any],
+    requirements: Sequence[Requirement],
+    engine: str,
+    spec_version: str,
+) -> List[ScorecardRow]:
+    """1原則分の評価結果から型付きの行を作成"""
+    text = result.get("response", "")
+    items = parse_json_verdicts(text) or parse_markdown_verdicts(text)
+    verdicts = match_requirements(items, requirements)
+    return [
+        ScorecardRow(
+            file_name=file_name,
+            principle=requirement.principle,
+            requirement_id=requirement.requirement_id,
+            requirement=requirement.text,
+            verdict=verdicts[requirement.requirement_id],
+            score=VERDICT_SCORES[verdicts[requirement.requirement_id]],
+            engine=engine,
+            spec_version=spec_version,
+            evaluated_at=result.get("evaluated_at") or "",
+        )
+        for requirement in requirements
+    ]
+
+
+# =========================================================
+# 保存（Snowflake）
+# =========================================================
+SCORECARD_STATEMENTS = [
+    Statement(
+        "scorecard_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + SCORECARD_TABLE + """ (
+            FILE_NAME STRING,
+            PRINCIPLE STRING,
+            REQUIREMENT_ID STRING,
+            REQUIREMENT STRING,
+            VERDICT STRING,
+            SCORE FLOAT,
+            ENGINE STRING,
+            SPEC_VERSION STRING,
+            EVALUATED_AT TIMESTAMP_NTZ
+        )
+        """,
+    ),
+    Statement(
+        # 1原則分の行をJSON配列で受け取り、1回のINSERTで保存する
+        "scorecard_insert",
+        """
+        INSERT INTO {db}.{schema}.""" + SCORECARD_TABLE + """
+        SELECT f.value:file_name::STRING,
+               f.value:principle::STRING,
+               f.value:requirement_id::STRING,
+               f.value:requirement::STRING,
+               f.value:verdict::STRING,
+               f.value:score::FLOAT,
+               f.value:engine::STRING,
+               f.value:spec_version::STRING,
+               COALESCE(TRY_TO_TIMESTAMP_NTZ(f.value:evaluated_at::STRING), CURRENT_TIMESTAMP()::TIMESTAMP_NTZ)
+        FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+        """,
+    ),
+    Statement(
+        # 評価方式の仕様バージョンごとに、(ファイル, 項目) の最新の判定を取得
+        "scorecard_latest",
+        """
+        SELECT FILE_NAME, PRINCIPLE, REQUIREMENT_ID, REQUIREMENT, VERDICT, SCORE,
+               ENGINE, SPEC_VERSION, EVALUATED_AT
+        FROM {db}.{schema}.""" + SCORECARD_TABLE + """
+        WHERE SPEC_VERSION = ?
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY FILE_NAME, REQUIREMENT_ID ORDER BY EVALUATED_AT DESC
+        ) = 1
+        """,
+    ),
+]
+
+
+class ScorecardStore:
+    """スコアカード行の保存・読み込み"""
+
+    def __init__(self, query_layer):
+        self.query_layer = query_layer
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.query_layer.collect("scorecard_create")
+            self._table_ready = True
+
+    def save(self, rows: Sequence[ScorecardRow]):
+        if not rows:
+            return
+        self._ensure_table()
+        self.query_layer.collect(
+            "scorecard_insert",
+            [json.dumps([asdict(row) for row in rows], ensure_ascii=False)],
+        )
+
+    def load_latest(self, spec_version: str) -> pd.DataFrame:
+        """全運用機関の最新のスコアカードを取得"""
+        self._ensure_table()
+        df = self.query_layer.to_pandas("scorecard_latest", [spec_version])
+        df.columns = [c.lower() for c in df.columns]
+        return scorecard_frame(df)
+
+
+# =========================================================
+# 集計（pandas）
+# =========================================================
+SCORECARD_COLUMNS = [field for field in ScorecardRow.__dataclass_fields__]
+
+
+def scorecard_frame(rows: Any) -> pd.DataFrame:
+    """行（ScorecardRow / dict / DataFrame）を型付きのDataFrameに変換"""
+    if isinstance(rows, pd.DataFrame):
+        df = rows.copy()
+    else:
+        df = pd.DataFrame([asdict(r) if isinstance(r, ScorecardRow) else r for r in rows])
+    df = df.reindex(columns=SCORECARD_COLUMNS)
+    df["score"] = pd.to_numeric(df["score"], errors="coerce").astype("float64")
+    df["verdict"] = pd.Categorical(df["verdict"], categories=VERDICT_ORDER)
+    df["evaluated_at"] = pd.to_datetime(df["evaluated_at"], errors="coerce")
+    return df
+
+
+def summary_metrics(df: pd.DataFrame) -> Dict[str, Any]:
+    """対応度スコア（0〜100）と判定ごとの件数"""
+    counts = df["verdict"].value_counts().reindex(VERDICT_ORDER, fill_value=0)
+    return {
+        "score": float(df["score"].mean() * 100) if len(df) else 0.0,
+        "items": int(len(df)),
+        "counts": {label: int(counts[label]) for label in VERDICT_ORDER},
+    }
+
+
+def principle_scores(df: pd.DataFrame) -> pd.DataFrame:
+    """原則ごとの対応度スコアと判定の件数"""
+    if df.empty:
+        return pd.DataFrame()
+    counts = pd.crosstab(df["principle"], df["verdict"], dropna=False).reindex(columns=VERDICT_ORDER, fill_value=0)
+    counts.columns = [f"{VERDICT_ICONS[c]} {c}" for c in counts.columns]
+    scores = df.groupby("principle", observed=True)["score"].mean().mul(100).round(1).rename("対応度スコア")
+    return pd.concat([scores, counts], axis=1).reset_index().rename(columns={"principle": "原則"})
+
+
+def manager_comparison(df: pd.DataFrame) -> pd.DataFrame:
+    """運用機関（ファイル）× 原則の対応度スコア（0〜100）"""
+    if df.empty:
+        return pd.DataFrame()
+    matrix = df.pivot_table(index="file_name", columns="principle", values="score", aggfunc="mean").mul(100)
+    matrix["総合"] = df.groupby("file_name")["score"].mean().mul(100)
+    matrix = matrix.sort_values("総合", ascending=False).round(1)
+    matrix.index.name = "レポート"
+    matrix.columns.name = None
+    return matrix
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Excelで文字化けしないようBOM付きUTF-8で出力"""
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+def to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    out = df.copy()
+    out["verdict"] = out["verdict"].astype(str)
+    buffer = io.BytesIO()
+    out.to_parquet(buffer, index=False)
+    return buffer.getvalue()
@@ -0,0 +1,117 @@
+# =========================================================
+# Cortex Search の検索ユーティリティ
+# =========================================================
+# RAGページと高速評価で共通に使う検索処理。
+# 結果はLLMに渡すコンテキストテキストと、表示用の行リストに整形する。
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Cortex Search Services（固定リスト - 動的取得も可能）
+# cross_lingual: 日本語のクエリを英訳クエリでも検索する（common.query_expansion）
+SEARCH_SERVICES = [
+    {
+        "name": "スチュワードシップ評価用",
+        "fq_name": "DEMO_DB.DEMO_SUSTAINABILITY.SUSTAINABILITY_REPORT",
+        "db": "DEMO_DB",
+        "schema": "DEMO_SUSTAINABILITY",
+        "short_name": "SUSTAINABILITY_REPORT",
+        "catalog": "stewardship",
+        "cross_lingual": True,
+        "search_column": "chunk_text",
+        "columns": ["chunk_text", "file_name", "relative_path", "scoped_file_url", "page_index", "chunk_id"],
+    },
+    {
+        "name": "グローバル年金分析用",
+        "fq_name": "DEMO_DB.DEMO_SUSTAINABILITY.GLOBAL_PF_SUSTAINABILITY_REPORT",
+        "db": "DEMO_DB",
+        "schema": "DEMO_SUSTAINABILITY",
+        "short_name": "GLOBAL_PF_SUSTAINABILITY_REPORT",
+        "catalog": "global",
+        "cross_lingual": True,
+        "search_column": "chunk_text",
+        "columns": ["chunk_text", "file_name", "relative_path", "scoped_file_url", "page_index", "source_report", "chunk_id"],
+    },
+]
+
+
+def get_cortex_search_service(root, service_config: Dict[str, Any]):
+    """Cortex Search Serviceオブジェクトを取得"""
+    return root.databases[service_config["db"]].schemas[service_config["schema"]].cortex_search_services[service_config["short_name"]]
+
+
+def file_filter(file_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    """特定ファイルに限定する検索フィルタ"""
+    if not file_name:
+        return None
+    return {"@eq": {"file_name": file_name}}
+
+
+def files_filter(file_names: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """複数ファイルのいずれかに限定する検索フィルタ"""
+    names = [name for name in file_names if name]
+    if len(names) <= 1:
+        return file_filter(names[0] if names else None)
+    return {"@or": [file_filter(name) for name in names]}
+
+
+def _get_column(row: Dict[str, Any], *names: str) -> Any:
+    for name in names:
+        for candidate in (name, name.lower(), name.upper()):
+            value = row.get(candidate)
+            # page_index の 0 は値として扱う
+            if value is not None and value != "":
+                return value
+    return ""
+
+
+def query_cortex_search(
+    root,
+    query: str,
+    service_config: Dict[str, Any],
+    num_results: int = 5,
+    filter_obj: Optional[Dict[str, Any]] = None
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Cortex Searchを実行してコンテキストを取得"""
+
+    svc = get_cortex_search_service(root, service_config)
+    search_col = service_config.get("search_column", "chunk_text")
+    request_columns = service_config.get("columns", ["chunk_text", "file_name", "relative_path"])
+
+    # 検索実行
+    kwargs = {
+        "query": query,
+        "columns": request_columns,
+        "limit": num_results,
+    }
+    if filter_obj:
+        kwargs["filter"] = filter_obj
+
+    doc = svc.search(**kwargs)
+    results = doc.results
+
+    # コンテキスト構築
+    context_rows = []
+    for i, r in enumerate(results, start=1):
+        context_rows.append({
+            "idx": i,
+            "chunk_id": _get_column(r, "chunk_id"),
+            "file_name": _get_column(r, "file_name"),
+            "relative_path": _get_column(r, "relative_path"),
+            "file_url": _get_column(r, "scoped_file_url", "file_url"),
+            "page_index": _get_column(r, "page_index"),
+            "chunk": _get_column(r, search_col),
+        })
+
+    return format_context(context_rows), context_rows
+
+
+def format_context(context_rows: List[Dict[str, Any]]) -> str:
+    """検索結果の行リストからLLMに渡すコンテキストテキストを作成"""
+    context_lines = []
+    for i, row in enumerate(context_rows, start=1):
+        source_info = f"[ファイル: {row.get('file_name', '')}"
+        if row.get("page_index") not in (None, ""):
+            source_info += f", ページ: {row['page_index']}"
+        source_info += "]"
+        context_lines.append(f"--- ドキュメント {i} {source_info} ---\n{row.get('chunk', '')}\n")
+    return "\n".join(context_lines)
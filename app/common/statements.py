@@ -0,0 +1,308 @@
+# =========================================================
+# ページ間で共有するSQLステートメント定義
+# =========================================================
+# 識別子プレースホルダ:
+#   {db} / {schema} / {stage} / {report_table} / {chunk_table} / {chunk_catalog}
+
+from common.query_layer import Statement
+
+# ページ範囲ごとの解析結果
+PARSE_SHARD_TABLE = "REPORT_PARSE_SHARDS"
+# ページ内容のハッシュをキーにした解析結果のキャッシュ
+PAGE_CACHE_TABLE = "PAGE_PARSE_CACHE"
+# 全コレクションのチャンクを1つにまとめたテーブル（ページ・検索サービスはこのテーブルを参照する）
+DOCUMENT_CHUNKS_TABLE = "DOCUMENT_CHUNKS"
+
+# レポート追加（ステージ → ページごとに経路を判定 → テキスト層の抽出 / ページ範囲ごとに
+# AI_PARSE_DOCUMENT → 結合 → チャンク化）
+INGESTION_STATEMENTS = [
+    Statement(
+        "parse_shard_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + PARSE_SHARD_TABLE + """ (
+            RELATIVE_PATH STRING,
+            CONTENT_HASH STRING,
+            PAGES_PER_SHARD INT,
+            SHARD_INDEX INT,
+            PAGE_START INT,
+            PAGE_END INT,
+            SHARD_PATH STRING,
+            PARSED VARIANT,
+            PARSED_AT TIMESTAMP_NTZ,
+            ROUTE STRING,
+            PAGE_MAP VARIANT
+        )
+        """,
+    ),
+    Statement(
+        "parse_shard_add_route",
+        """
+        ALTER TABLE {db}.{schema}.""" + PARSE_SHARD_TABLE + """ ADD COLUMN IF NOT EXISTS ROUTE STRING
+        """,
+    ),
+    Statement(
+        # シャード内のページ番号 → 元のページ番号（連続しないページをまとめたシャード用。NULL は PAGE_START からの連番）
+        "parse_shard_add_page_map",
+        """
+        ALTER TABLE {db}.{schema}.""" + PARSE_SHARD_TABLE + """ ADD COLUMN IF NOT EXISTS PAGE_MAP VARIANT
+        """,
+    ),
+    Statement(
+        # 解析したシャードのページ（ページ単位の解析キャッシュに保存する）
+        "parse_shard_pages",
+        """
+        SELECT p.value AS PAGE
+        FROM {db}.{schema}.""" + PARSE_SHARD_TABLE + """ s,
+            LATERAL FLATTEN(input => s.PARSED:pages) p
+        WHERE s.RELATIVE_PATH = ? AND s.CONTENT_HASH = ? AND s.PAGES_PER_SHARD = ? AND s.SHARD_INDEX = ?
+        ORDER BY p.value:index::INT
+        """,
+    ),
+    Statement(
+        # 1シャードを解析して結果をそのまま保存する（結果はクライアントに転送しない）
+        # params: [relative_path, content_hash, pages_per_shard, shard_index, page_start, page_end, shard_path, shard_path, page_map JSON]
+        "parse_shard_insert",
+        """
+        INSERT INTO {db}.{schema}.""" + PARSE_SHARD_TABLE + """
+        (RELATIVE_PATH, CONTENT_HASH, PAGES_PER_SHARD, SHARD_INDEX, PAGE_START, PAGE_END, SHARD_PATH, PARSED, PARSED_AT, ROUTE, PAGE_MAP)
+        SELECT ?, ?, ?, ?, ?, ?, ?,
+            AI_PARSE_DOCUMENT(
+                TO_FILE('@{db}.{schema}.{stage}', ?),
+                {{'mode': 'LAYOUT', 'page_split': true}}
+            ),
+            CURRENT_TIMESTAMP()::TIMESTAMP_NTZ,
+            'layout',
+            PARSE_JSON(?)
+        """,
+    ),
+    Statement(
+        # スキャンページ（テキスト層なし）はOCRモードで解析する（params は parse_shard_insert と同じ）
+        "parse_shard_insert_ocr",
+        """
+        INSERT INTO {db}.{schema}.""" + PARSE_SHARD_TABLE + """
+        (RELATIVE_PATH, CONTENT_HASH, PAGES_PER_SHARD, SHARD_INDEX, PAGE_START, PAGE_END, SHARD_PATH, PARSED, PARSED_AT, ROUTE, PAGE_MAP)
+        SELECT ?, ?, ?, ?, ?, ?, ?,
+            AI_PARSE_DOCUMENT(
+                TO_FILE('@{db}.{schema}.{stage}', ?),
+                {{'mode': 'OCR', 'page_split': true}}
+            ),
+            CURRENT_TIMESTAMP()::TIMESTAMP_NTZ,
+            'ocr',
+            PARSE_JSON(?)
+        """,
+    ),
+    Statement(
+        # テキスト層から抽出したページ（pages 配列のJSON）をそのまま保存する
+        # params: [relative_path, content_hash, pages_per_shard, shard_index, page_start, page_end, shard_path, pages JSON, page_map JSON]
+        "parse_shard_insert_local",
+        """
+        INSERT INTO {db}.{schema}.""" + PARSE_SHARD_TABLE + """
+        (RELATIVE_PATH, CONTENT_HASH, PAGES_PER_SHARD, SHARD_INDEX, PAGE_START, PAGE_END, SHARD_PATH, PARSED, PARSED_AT, ROUTE, PAGE_MAP)
+        SELECT ?, ?, ?, ?, ?, ?, ?, PARSE_JSON(?), CURRENT_TIMESTAMP()::TIMESTAMP_NTZ, 'text', PARSE_JSON(?)
+        """,
+    ),
+    Statement(
+        # 解析済みのページはページ単位の解析キャッシュから復元するため、前回のシャードは削除する
+        "parse_shard_clear",
+        """
+        DELETE FROM {db}.{schema}.""" + PARSE_SHARD_TABLE + """
+        WHERE RELATIVE_PATH = ?
+        """,
+    ),
+    Statement(
+        "page_cache_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.""" + PAGE_CACHE_TABLE + """ (
+            PAGE_HASH STRING,
+            ROUTE STRING,
+            PAGE VARIANT,
+            CACHED_AT TIMESTAMP_NTZ
+        )
+        """,
+    ),
+    Statement(
+        # params: [ページハッシュの配列のJSON]
+        "page_cache_lookup",
+        """
+        SELECT PAGE_HASH, PAGE
+        FROM {db}.{schema}.""" + PAGE_CACHE_TABLE + """
+        WHERE PAGE_HASH IN (
+            SELECT f.value::STRING FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+        )
+        """,
+    ),
+    Statement(
+        # params: [{hash, route, page} の配列のJSON]（既に登録済みのページはそのまま）
+        "page_cache_merge",
+        """
+        MERGE INTO {db}.{schema}.""" + PAGE_CACHE_TABLE + """ c
+        USING (
+            SELECT f.value:hash::STRING AS PAGE_HASH, ANY_VALUE(f.value:route::STRING) AS ROUTE,
+                   ANY_VALUE(f.value:page) AS PAGE
+            FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+            GROUP BY 1
+        ) s
+        ON c.PAGE_HASH = s.PAGE_HASH
+        WHEN NOT MATCHED THEN INSERT (PAGE_HASH, ROUTE, PAGE, CACHED_AT)
+            VALUES (s.PAGE_HASH, s.ROUTE, s.PAGE, CURRENT_TIMESTAMP()::TIMESTAMP_NTZ)
+        """,
+    ),
+    Statement(
+        "delete_report",
+        """
+        DELETE FROM {db}.{schema}.{report_table}
+        WHERE relative_path = ?
+        """,
+    ),
+    Statement(
+        "delete_report_chunks",
+        """
+        DELETE FROM {db}.{schema}.{chunk_table}
+        WHERE relative_path = ?
+        """,
+    ),
+    Statement(
+        # シャードごとの pages 配列を、ページ番号をファイル全体の通し番号に直して結合
+        # params: [relative_path, relative_path, relative_path, content_hash, pages_per_shard]
+        "insert_stitched_report",
+        """
+        INSERT INTO {db}.{schema}.{report_table}
+        (relative_path, scoped_file_url, raw_text_dict)
+        SELECT
+            ? AS relative_path,
+            GET_PRESIGNED_URL('@{db}.{schema}.{stage}', ?) AS scoped_file_url,
+            OBJECT_CONSTRUCT(
+                'pages', ARRAY_AGG(
+                    OBJECT_INSERT(
+                        p.value, 'index',
+                        COALESCE(GET(s.PAGE_MAP, p.value:index::INT)::INT, p.value:index::INT + s.PAGE_START), TRUE
+                    )
+                ) WITHIN GROUP (ORDER BY COALESCE(GET(s.PAGE_MAP, p.value:index::INT)::INT, p.value:index::INT + s.PAGE_START)),
+                'metadata', OBJECT_CONSTRUCT('pageCount', COUNT(*), 'shardCount', COUNT(DISTINCT s.SHARD_INDEX))
+            ) AS raw_text_dict
+        FROM {db}.{schema}.""" + PARSE_SHARD_TABLE + """ s,
+            LATERAL FLATTEN(input => s.PARSED:pages) p
+        WHERE s.RELATIVE_PATH = ? AND s.CONTENT_HASH = ? AND s.PAGES_PER_SHARD = ?
+        """,
+    ),
+    Statement(
+        "insert_report_chunks",
+        """
+        INSERT INTO {db}.{schema}.{chunk_table}
+        (relative_path, scoped_file_url, file_name, page_index, chunk_index_on_page, chunk_text, chunk_id)
+        SELECT
+            t.relative_path,
+            t.scoped_file_url,
+            SPLIT_PART(t.relative_path, '/', -1) AS file_name,
+            p.value:index::INT AS page_index,
+            c.index::INT AS chunk_index_on_page,
+            c.value::STRING AS chunk_text,
+            MD5_HEX(t.relative_path || ':' || p.value:index::INT || ':' || c.index::INT)::STRING AS chunk_id
+        FROM
+            {db}.{schema}.{report_table} t,
+            LATERAL FLATTEN(input => t.raw_text_dict:pages) p,
+            LATERAL FLATTEN(
+                INPUT => SNOWFLAKE.CORTEX.SPLIT_TEXT_RECURSIVE_CHARACTER(
+                    p.value:content::STRING,
+                    'markdown',
+                    1000,
+                    100
+                )
+            ) c
+        WHERE t.relative_path = ?
+        """,
+    ),
+    Statement(
+        "count_report_chunks",
+        """
+        SELECT COUNT(*) AS count
+        FROM {db}.{schema}.{chunk_table}
+        WHERE relative_path = ?
+        """,
+    ),
+    Statement(
+        # ハンドソン（handson.ipynb）で作成済みの場合は何もしない
+        "document_chunks_create",
+        """
+        CREATE TABLE IF NOT EXISTS {db}.{schema}.{chunk_catalog} (
+            COLLECTION STRING,
+            SOURCE STRING,
+            RELATIVE_PATH STRING,
+            SCOPED_FILE_URL STRING,
+            FILE_NAME STRING,
+            PAGE_INDEX INT,
+            CHUNK_INDEX_IN_FILE INT,
+            CHUNK_INDEX_ON_PAGE INT,
+            CHUNK_TEXT STRING,
+            CHUNK_ID STRING,
+            VERSION NUMBER(19, 0),
+            INGESTED_AT TIMESTAMP_NTZ,
+            SIMHASH STRING,
+            DUPLICATE_OF STRING,
+            DEDUP_VERSION STRING
+        )
+        CLUSTER BY (SOURCE, FILE_NAME, PAGE_INDEX, CHUNK_INDEX_ON_PAGE)
+        """,
+    ),
+    Statement(
+        # 重複チャンクの判定（common.dedup）の列。ハンズオンで作成済みのテーブルに追加する
+        "document_chunks_add_dedup_columns",
+        """
+        ALTER TABLE {db}.{schema}.{chunk_catalog} ADD COLUMN IF NOT EXISTS SIMHASH STRING, DUPLICATE_OF STRING, DEDUP_VERSION STRING
+        """,
+    ),
+    Statement(
+        # 取り込んだファイルのチャンクを新しいバージョンとして追加
+        # （VERSION は取り込み時刻のミリ秒。全体の最大値がそのままテーブルのバージョンになる）
+        # params: [collection, source, {chunk_id, simhash, duplicate_of, version} の配列のJSON, relative_path]
+        "document_chunks_insert",
+        """
+        INSERT INTO {db}.{schema}.{chunk_catalog}
+        (COLLECTION, SOURCE, RELATIVE_PATH, SCOPED_FILE_URL, FILE_NAME, PAGE_INDEX,
+         CHUNK_INDEX_IN_FILE, CHUNK_INDEX_ON_PAGE, CHUNK_TEXT, CHUNK_ID, VERSION, INGESTED_AT,
+         SIMHASH, DUPLICATE_OF, DEDUP_VERSION)
+        SELECT ?, ?, c.relative_path, c.scoped_file_url, c.file_name, c.page_index,
+            NULL, c.chunk_index_on_page, c.chunk_text, c.chunk_id,
+            DATE_PART(EPOCH_MILLISECOND, CURRENT_TIMESTAMP()), CURRENT_TIMESTAMP()::TIMESTAMP_NTZ,
+            s.value:simhash::STRING, s.value:duplicate_of::STRING, s.value:version::STRING
+        FROM {db}.{schema}.{chunk_table} c
+        LEFT JOIN TABLE(FLATTEN(INPUT => PARSE_JSON(?))) s
+          ON s.value:chunk_id::STRING = c.chunk_id
+        WHERE c.relative_path = ?
+        """,
+    ),
+    Statement(
+        # 新しいバージョンを追加した後に古いバージョンを削除（ファイルのチャンクが空になる時間を作らない）
+        # params: [relative_path, relative_path]
+        "document_chunks_prune",
+        """
+        DELETE FROM {db}.{schema}.{chunk_catalog}
+        WHERE RELATIVE_PATH = ?
+          AND VERSION < (
+              SELECT MAX(VERSION) FROM {db}.{schema}.{chunk_catalog} WHERE RELATIVE_PATH = ?
+          )
+        """,
+    ),
+    Statement(
+        # 代表チャンクが削除・差し替えられた重複チャンクを代表に戻す
+        # params: [collection, collection]
+        "document_chunks_promote_orphans",
+        """
+        UPDATE {db}.{schema}.{chunk_catalog}
+        SET DUPLICATE_OF = NULL
+        WHERE COLLECTION = ? AND DUPLICATE_OF IS NOT NULL
+          AND DUPLICATE_OF NOT IN (
+              SELECT CHUNK_ID FROM {db}.{schema}.{chunk_catalog}
+              WHERE COLLECTION = ? AND DUPLICATE_OF IS NULL
+          )
+        """,
+    ),
+    Statement(
+        "count_view_chunks",
+        """
+        SELECT COUNT(*) AS count
+        FROM {db}.{schema}.{chunk_catalog}
+        WHERE FILE_NAME = ?
+        """,
+    ),
+]
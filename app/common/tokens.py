@@ -0,0 +1,28 @@
+# =========================================================
+# トークン数の概算
+# =========================================================
+# チャンクの大きさ・プロンプトの長さを、モデルのトークナイザーを使わずに概算する。
+# 日本語（かな・漢字）は1文字あたり約1トークン、英語は1単語あたり約1.3トークンとして数える。
+# 文字数で揃えると日本語と英語でトークン数が5倍近く違うため、チャンクの上限・下限はこちらで決める。
+
+import math
+import re
+
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟ]")
+_WORD = re.compile(r"[A-Za-z]+(?:['’][A-Za-z]+)?")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+_SYMBOL = re.compile(r"[^\sA-Za-z\d]")
+
+WORD_TOKENS = 1.3
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数の概算"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    rest = _CJK.sub(" ", text)
+    words = len(_WORD.findall(rest))
+    numbers = len(_NUMBER.findall(rest))
+    symbols = len(_SYMBOL.findall(rest))
+    return cjk + math.ceil(words * WORD_TOKENS) + numbers + symbols
@@ -5,8 +5,14 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from snowflake.snowpark.context import get_active_session
-from snowflake.core import Root
+from common.query_layer import Statement, get_query_layer
+from common.statements import DOCUMENT_CHUNKS_TABLE, INGESTION_STATEMENTS
+from common.report_text_loader import ReportTextLoader
+from common.catalog import COLLECTION_GLOBAL, content_hash, get_document_catalog
+from common.ingestion import ShardedReportParser, publish_chunks, stage_writer
+from common.dedup import DEDUP_STATEMENTS, ChunkDeduplicator
+from common.resources import current_context, get_session
+from common.completion_executor import CompletionExecutor, FlowPolicy, get_latency_tracker, snowpark_starter
 
 # =========================================================
 # ヘルパー関数
@@ -130,11 +136,7 @@ st.markdown("""
 # =========================================================
 # Snowflake接続
 # =========================================================
-session = get_active_session()
-root = Root(session)
-
-current_db = session.sql("SELECT CURRENT_DATABASE()").collect()[0][0]
-current_schema = session.sql("SELECT CURRENT_SCHEMA()").collect()[0][0]
+# セッションは最初のクエリ実行時に取得する（common.resources）
 
 # =========================================================
 # 設定値
@@ -142,8 +144,114 @@ current_schema = session.sql("SELECT CURRENT_SCHEMA()").collect()[0][0]
 CORTEX_SEARCH_DATABASE = "DEMO_DB"
 CORTEX_SEARCH_SCHEMA = "DEMO_SUSTAINABILITY"
 CORTEX_SEARCH_SERVICE = "GLOBAL_PF_SUSTAINABILITY_REPORT"
-CORTEX_SEARCH_VIEW = "COMBINED_GLOBAL_SUSTAINABILITY_VIEW"
 DOCUMENT_STAGE = "DOCUMENT_STAGE"
+REPORT_TABLE = "GLOBAL_PF_SUSTAINABILITY_REPORT"
+CHUNK_TABLE = "GLOBAL_PF_SUSTAINABILITY_REPORT_CHUNK"
+
+# =========================================================
+# SQLステートメント（値はすべてバインドパラメータ）
+# =========================================================
+GLOBAL_STATEMENTS = [
+    Statement(
+        "report_chunk_stream",
+        """
+        SELECT CHUNK_TEXT
+        FROM {db}.{schema}.{chunk_catalog}
+        WHERE FILE_NAME = ?
+        ORDER BY PAGE_INDEX, CHUNK_INDEX_ON_PAGE
+        LIMIT ?
+        """,
+    ),
+    Statement(
+        # 取り込みごとに増える VERSION の最大値（メタデータのみで取得できる）
+        "chunk_table_version",
+        """
+        SELECT TO_VARCHAR(MAX(VERSION))
+        FROM {db}.{schema}.{chunk_catalog}
+        """,
+    ),
+    Statement(
+        "ai_complete",
+        """
+        SELECT AI_COMPLETE(?, ?) AS response
+        """,
+    ),
+    Statement(
+        "summarize_reports_batch",
+        """
+        WITH ranked_chunks AS (
+            SELECT FILE_NAME, CHUNK_TEXT, PAGE_INDEX, CHUNK_INDEX_ON_PAGE
+            FROM {db}.{schema}.{chunk_catalog}
+            WHERE FILE_NAME IN (?)
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY FILE_NAME ORDER BY PAGE_INDEX, CHUNK_INDEX_ON_PAGE
+            ) <= ?
+        ),
+        report_texts AS (
+            SELECT
+                FILE_NAME,
+                LISTAGG(CHUNK_TEXT, '\\n\\n') WITHIN GROUP (ORDER BY PAGE_INDEX, CHUNK_INDEX_ON_PAGE) AS REPORT_TEXT
+            FROM ranked_chunks
+            GROUP BY FILE_NAME
+        )
+        SELECT
+            FILE_NAME,
+            AI_COMPLETE(
+                ?,
+                REPLACE(
+                    REPLACE(?, '{{file_name}}', FILE_NAME),
+                    '{{report_text}}',
+                    IFF(LENGTH(REPORT_TEXT) > ?, LEFT(REPORT_TEXT, ?) || '...', REPORT_TEXT)
+                )
+            ) AS RESPONSE
+        FROM report_texts
+        """,
+    ),
+] + INGESTION_STATEMENTS + DEDUP_STATEMENTS
+
+query_layer = get_query_layer(
+    get_session,
+    GLOBAL_STATEMENTS,
+    {
+        "db": CORTEX_SEARCH_DATABASE,
+        "schema": CORTEX_SEARCH_SCHEMA,
+        "stage": DOCUMENT_STAGE,
+        "report_table": REPORT_TABLE,
+        "chunk_table": CHUNK_TABLE,
+        "chunk_catalog": DOCUMENT_CHUNKS_TABLE,
+    },
+    key="global_query_layer",
+)
+
+@st.cache_resource
+def get_report_text_loader():
+    """全セッションで共有するレポート本文ローダー（LRUキャッシュ付き）"""
+    return ReportTextLoader()
+
+def get_report_parser() -> ShardedReportParser:
+    """セッションごとのレポート解析（ページ範囲ごとの並列解析。保存先のテーブルがページで異なるためキーを分ける）"""
+    if 'global_report_parser' not in st.session_state:
+        st.session_state.global_report_parser = ShardedReportParser(
+            query_layer,
+            stage_writer(get_session, f"{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.{DOCUMENT_STAGE}")
+        )
+    return st.session_state.global_report_parser
+
+def get_chunk_deduplicator() -> ChunkDeduplicator:
+    """セッションごとの重複チャンク判定（このページのクエリレイヤーを使うためキーを分ける）"""
+    if 'global_chunk_deduplicator' not in st.session_state:
+        st.session_state.global_chunk_deduplicator = ChunkDeduplicator(query_layer)
+    return st.session_state.global_chunk_deduplicator
+
+def get_completion_executor() -> CompletionExecutor:
+    """セッションごとのAI_COMPLETE実行（期限・ヘッジ・フォールバック。レイテンシの記録は全セッション共有）"""
+    if 'global_completion_executor' not in st.session_state:
+        st.session_state.global_completion_executor = CompletionExecutor(
+            snowpark_starter(query_layer, "ai_complete"),
+            policies=COMPLETION_POLICIES,
+            tracker=get_latency_tracker(),
+        )
+    return st.session_state.global_completion_executor
 
 # =========================================================
 # セッション状態の初期化
@@ -156,53 +264,22 @@ if 'trend_analysis' not in st.session_state:
     st.session_state.trend_analysis = None
 if 'gap_analysis' not in st.session_state:
     st.session_state.gap_analysis = None
-if 'file_list_refresh_key' not in st.session_state:
-    st.session_state.file_list_refresh_key = 0
 
 # =========================================================
 # データ取得関数
 # =========================================================
 def get_file_list():
-    """利用可能なPDFファイルのリストを取得"""
-    # refresh_keyを使ってキャッシュを無効化できるようにする
-    refresh_key = st.session_state.get('file_list_refresh_key', 0)
-    return _get_file_list_cached(refresh_key)
-
-@st.cache_data
-def _get_file_list_cached(refresh_key):
-    """キャッシュ付きのファイルリスト取得関数"""
+    """利用可能なPDFファイルのリストをドキュメントカタログから取得（全セッション共有のキャッシュ）"""
     try:
-        query = f"""
-        SELECT DISTINCT FILE_NAME, SOURCE_REPORT
-        FROM {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.{CORTEX_SEARCH_VIEW}
-        ORDER BY SOURCE_REPORT, FILE_NAME
-        """
-        df = session.sql(query).to_pandas()
-        return df
+        return get_document_catalog().files(COLLECTION_GLOBAL)
     except Exception as e:
         st.error(f"ファイル一覧の取得に失敗しました: {str(e)}")
         return pd.DataFrame()
 
-def refresh_file_list():
-    """ファイルリストのキャッシュをリフレッシュ"""
-    st.session_state.file_list_refresh_key += 1
-
 def get_full_report_text(file_name, limit=100):
-    """指定されたレポートの全テキストを取得"""
+    """指定されたレポートの全テキストを取得（2回目以降はキャッシュから取得）"""
     try:
-        query = f"""
-        SELECT CHUNK_TEXT, PAGE_INDEX
-        FROM {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.{CORTEX_SEARCH_VIEW}
-        WHERE FILE_NAME = '{file_name}'
-        ORDER BY PAGE_INDEX, CHUNK_INDEX_ON_PAGE
-        LIMIT {limit}
-        """
-        df = session.sql(query).to_pandas()
-        
-        if len(df) > 0:
-            full_text = "\n\n".join(df['CHUNK_TEXT'].tolist())
-            return full_text
-        return ""
+        return get_report_text_loader().get_text(query_layer, file_name, limit)
     except Exception as e:
         st.error(f"レポートテキストの取得に失敗しました: {str(e)}")
         return ""
@@ -210,14 +287,18 @@ def get_full_report_text(file_name, limit=100):
 # =========================================================
 # AI分析関数
 # =========================================================
-def summarize_report(file_name, report_text):
-    """AI_COMPLETEを使用してレポートをサマライズ"""
-    try:
-        max_chars = 10000
-        if len(report_text) > max_chars:
-            report_text = report_text[:max_chars] + "..."
-        
-        prompt = f"""あなたは年金基金のサステナビリティレポートを分析する専門家です。
+SUMMARY_MODEL = "claude-sonnet-4-5"
+
+# フローごとの期限・フォールバック（要約は1件ずつ、分析は複数要約をまとめるため長めにする）
+COMPLETION_POLICIES = {
+    "summary": FlowPolicy(fallbacks=["claude-4-sonnet", "llama4-maverick"], timeout_sec=120, initial_hedge_sec=45),
+    "analysis": FlowPolicy(fallbacks=["claude-4-sonnet", "llama4-maverick"], timeout_sec=180, initial_hedge_sec=60),
+}
+SUMMARY_MAX_CHARS = 10000
+SUMMARY_CHUNK_LIMIT = 100
+
+# {file_name} / {report_text} はPython側（format）とSQL側（REPLACE）の両方で置換する
+SUMMARY_PROMPT_TEMPLATE = """あなたは年金基金のサステナビリティレポートを分析する専門家です。
 以下のレポートの内容を日本語で要約してください。
 
 【レポート名】
@@ -247,16 +328,16 @@ def summarize_report(file_name, report_text):
 ## 5. 特筆すべき点
 他の年金基金と比較して特徴的な点や先進的な取り組み
 """
+
+def summarize_report(file_name, report_text):
+    """AI_COMPLETEを使用してレポートをサマライズ"""
+    try:
+        if len(report_text) > SUMMARY_MAX_CHARS:
+            report_text = report_text[:SUMMARY_MAX_CHARS] + "..."
         
-        ai_query = f"""
-        SELECT AI_COMPLETE(
-            'claude-sonnet-4-5',
-            '{prompt.replace("'", "''")}'
-        ) AS response
-        """
+        prompt = SUMMARY_PROMPT_TEMPLATE.format(file_name=file_name, report_text=report_text)
         
-        result = session.sql(ai_query).collect()
-        raw_response = result[0]['RESPONSE']
+        raw_response = get_completion_executor().complete("summary", SUMMARY_MODEL, prompt).text
         
         return clean_ai_response(raw_response)
         
@@ -264,6 +345,36 @@ def summarize_report(file_name, report_text):
         st.error(f"サマライズに失敗しました: {str(e)}")
         return f"エラー: {str(e)}"
 
+def summarize_reports_batch(file_names):
+    """複数レポートのサマライズを1つのSQLで一括実行
+    
+    チャンクの結合（LISTAGG）とプロンプトの組み立てをサーバー側で行い、
+    レポート本文をクライアントに転送せずに全ファイル分のAI_COMPLETEを並列実行する。
+    """
+    if not file_names:
+        return {}
+    
+    try:
+        params = [
+            list(file_names),
+            SUMMARY_CHUNK_LIMIT,
+            SUMMARY_MODEL,
+            SUMMARY_PROMPT_TEMPLATE,
+            SUMMARY_MAX_CHARS,
+            SUMMARY_MAX_CHARS,
+        ]
+        
+        result = query_layer.collect("summarize_reports_batch", params)
+        
+        return {
+            row['FILE_NAME']: clean_ai_response(row['RESPONSE'])
+            for row in result
+        }
+        
+    except Exception as e:
+        st.error(f"一括サマライズに失敗しました: {str(e)}")
+        return {}
+
 def analyze_trends(selected_files_data):
     """複数レポートからトレンドを分析"""
     try:
@@ -313,15 +424,7 @@ GPIFをはじめとする日本の年金基金が学べる具体的な点（3-4
 全6項目を必ず完成させてください。
 """
         
-        ai_query = f"""
-        SELECT AI_COMPLETE(
-            'claude-sonnet-4-5',
-            '{prompt.replace("'", "''")}'
-        ) AS response
-        """
-        
-        result = session.sql(ai_query).collect()
-        raw_response = result[0]['RESPONSE']
+        raw_response = get_completion_executor().complete("analysis", SUMMARY_MODEL, prompt).text
         
         return clean_ai_response(raw_response)
         
@@ -381,15 +484,7 @@ GPIFが取り組むべき優先事項（3項目、実行可能性を含む箇条
 全6項目を必ず完成させてください。
 """
         
-        ai_query = f"""
-        SELECT AI_COMPLETE(
-            'claude-sonnet-4-5',
-            '{prompt.replace("'", "''")}'
-        ) AS response
-        """
-        
-        result = session.sql(ai_query).collect()
-        raw_response = result[0]['RESPONSE']
+        raw_response = get_completion_executor().complete("analysis", SUMMARY_MODEL, prompt).text
         
         return clean_ai_response(raw_response)
         
@@ -447,6 +542,16 @@ with st.sidebar:
     
     st.markdown("---")
     st.caption(f"データソース: {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}")
+    connected = current_context()
+    if connected:
+        st.caption(f"接続先: {connected[0]}.{connected[1]}")
+    
+    with st.expander("クエリ統計"):
+        query_stats = query_layer.stats_rows()
+        if query_stats:
+            st.dataframe(pd.DataFrame(query_stats), hide_index=True)
+        else:
+            st.caption("まだクエリは実行されていません")
 
 # =========================================================
 # タブ構成
@@ -461,7 +566,9 @@ tab1, tab2, tab3, tab4 = st.tabs([
 # ========================================
 # タブ1: レポートサマリー
 # ========================================
-with tab1:
+@st.fragment
+def render_summary_tab():
+    """タブ1の描画（操作時はこのタブのみ再実行）"""
     st.header("レポートサマリー")
     st.caption("選択した各レポートの内容を自動的にサマライズします")
     st.markdown("---")
@@ -471,11 +578,29 @@ with tab1:
         value=False
     )
     
+    batch_mode = st.checkbox(
+        "一括モード（サーバー側で全レポートを1クエリで要約）",
+        value=True,
+        help="チャンクの結合とAI_COMPLETEの呼び出しをSnowflake側でまとめて実行します"
+    )
+    
     col1, col2 = st.columns([1, 4])
     with col1:
         if st.button("サマライズ実行", type="primary", use_container_width=True):
             if len(st.session_state.selected_reports) == 0 and not (include_gpif and st.session_state.gpif_file):
                 st.warning("サイドバーからレポートを選択してください")
+            elif batch_mode:
+                target_files = list(st.session_state.selected_reports)
+                if include_gpif and st.session_state.gpif_file:
+                    target_files.insert(0, st.session_state.gpif_file)
+                
+                with st.spinner(f"{len(target_files)}件のレポートを一括分析中..."):
+                    st.session_state.summary_results = summarize_reports_batch(target_files)
+                
+                missing_files = [f for f in target_files if f not in st.session_state.summary_results]
+                if missing_files:
+                    st.warning(f"テキストが見つからなかったレポート: {', '.join(missing_files)}")
+                st.success("サマライズ完了")
             else:
                 st.session_state.summary_results = {}
                 
@@ -512,10 +637,15 @@ with tab1:
                 with st.expander(file_name, expanded=False):
                     st.markdown(summary)
 
+with tab1:
+    render_summary_tab()
+
 # ========================================
 # タブ2: トレンド分析
 # ========================================
-with tab2:
+@st.fragment
+def render_trend_tab():
+    """タブ2の描画（操作時はこのタブのみ再実行）"""
     st.header("グローバルトレンド分析")
     st.caption("選択した複数の海外年金基金レポートから、共通するトレンドや特徴を抽出します")
     st.markdown("---")
@@ -554,10 +684,15 @@ with tab2:
             mime="text/plain"
         )
 
+with tab2:
+    render_trend_tab()
+
 # ========================================
 # タブ3: GAP分析
 # ========================================
-with tab3:
+@st.fragment
+def render_gap_tab():
+    """タブ3の描画（操作時はこのタブのみ再実行）"""
     st.header("GPIF vs グローバル年金基金 GAP分析")
     st.caption("GPIFのサステナビリティレポートと海外主要年金基金のレポートを比較し、強み、改善機会、具体的な推奨事項を提示します")
     st.markdown("---")
@@ -598,10 +733,15 @@ with tab3:
             mime="text/plain"
         )
 
+with tab3:
+    render_gap_tab()
+
 # ========================================
 # タブ4: レポート追加
 # ========================================
-with tab4:
+@st.fragment
+def render_upload_tab():
+    """タブ4の描画（操作時はこのタブのみ再実行）"""
     st.header("新規レポート追加")
     st.caption("新しい海外年金基金のサステナビリティレポート（PDF）をアップロードして、分析対象に追加します")
     st.markdown("---")
@@ -610,7 +750,9 @@ with tab4:
     **処理の流れ**
     1. PDFファイルをアップロード
     2. ステージに保存
-    3. AI_PARSE_DOCUMENTでテキスト抽出
+    3. ページごとにテキスト層を確認し、テキスト層のあるページはそのまま抽出、
+       スキャン・表組みの多いページだけAI_PARSE_DOCUMENTで並列に解析
+       （解析済みのページは内容のハッシュで解析キャッシュから再利用。失敗時は失敗した範囲のみ再解析）
     4. チャンク化してデータベースに格納
     """)
     
@@ -629,98 +771,33 @@ with tab4:
             try:
                 with st.spinner("ステップ1/4: ファイルをステージにアップロード中..."):
                     stage_path = f"global_pf_esg_report/{uploaded_file.name}"
-                    
-                    temp_path = f"/tmp/{uploaded_file.name}"
-                    with open(temp_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    stage_location = f"@{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.document_stage/global_pf_esg_report/"
-                    session.file.put(
-                        temp_path,
-                        stage_location,
-                        auto_compress=False,
-                        overwrite=True
-                    )
+                    file_data = uploaded_file.getvalue()
+                    get_report_parser().put_fn(stage_path, file_data)
                     st.success("ファイルアップロード完了")
                 
-                with st.spinner("ステップ2/4: テキスト抽出中..."):
-                    escaped_stage_path = stage_path.replace("'", "''")
-                    
-                    check_table_sql = f"""
-                    SELECT column_name 
-                    FROM {CORTEX_SEARCH_DATABASE}.INFORMATION_SCHEMA.COLUMNS 
-                    WHERE table_schema = '{CORTEX_SEARCH_SCHEMA}' 
-                    AND table_name = 'GLOBAL_PF_SUSTAINABILITY_REPORT'
-                    ORDER BY ordinal_position
-                    """
-                    columns_result = session.sql(check_table_sql).collect()
-                    table_columns = [row['COLUMN_NAME'] for row in columns_result]
-                    
-                    if len(table_columns) == 4:
-                        direct_insert_sql = f"""
-                        INSERT INTO {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.global_pf_sustainability_report 
-                        (relative_path, scoped_file_url, raw_text_dict, raw_text)
-                        SELECT
-                            '{escaped_stage_path}' AS relative_path,
-                            GET_PRESIGNED_URL('@{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.document_stage', '{escaped_stage_path}') AS scoped_file_url,
-                            AI_PARSE_DOCUMENT(
-                                TO_FILE('@{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.document_stage', '{escaped_stage_path}'),
-                                {{'mode': 'LAYOUT', 'page_split': true}}
-                            ) AS raw_text_dict,
-                            NULL AS raw_text
-                        """
-                    else:
-                        direct_insert_sql = f"""
-                        INSERT INTO {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.global_pf_sustainability_report 
-                        (relative_path, scoped_file_url, raw_text_dict)
-                        SELECT
-                            '{escaped_stage_path}' AS relative_path,
-                            GET_PRESIGNED_URL('@{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.document_stage', '{escaped_stage_path}') AS scoped_file_url,
-                            AI_PARSE_DOCUMENT(
-                                TO_FILE('@{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.document_stage', '{escaped_stage_path}'),
-                                {{'mode': 'LAYOUT', 'page_split': true}}
-                            ) AS raw_text_dict
-                        """
-                    
-                    session.sql(direct_insert_sql).collect()
-                    st.success("テキスト抽出完了")
+                with st.spinner("ステップ2/4: テキスト抽出中（ページごとに経路を判定して並列解析）..."):
+                    parse_progress = st.progress(0)
+                    parse_report = get_report_parser().parse(
+                        stage_path,
+                        file_data,
+                        on_progress=lambda done, total: parse_progress.progress(done / total)
+                    )
+                    parse_progress.empty()
+                    get_report_parser().stitch(parse_report)
+                    st.success(
+                        f"テキスト抽出完了（{parse_report.shards}分割 / 解析 {parse_report.parsed}件・"
+                        f"キャッシュから再利用 {parse_report.reused}ページ、{parse_report.elapsed_ms / 1000:.1f}秒）"
+                    )
+                    if parse_report.page_count:
+                        st.caption(" / ".join(
+                            f"{row['経路']}: {row['ページ数']}ページ" for row in parse_report.route_rows()
+                        ))
                 
                 with st.spinner("ステップ3/4: チャンク化中..."):
-                    chunk_sql = f"""
-                    INSERT INTO {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.global_pf_sustainability_report_chunk 
-                    (relative_path, scoped_file_url, file_name, page_index, chunk_index_on_page, chunk_text, chunk_id)
-                    SELECT
-                        t.relative_path,
-                        t.scoped_file_url,
-                        SPLIT_PART(t.relative_path, '/', -1) AS file_name,
-                        p.value:index::INT AS page_index, 
-                        c.index::INT AS chunk_index_on_page,
-                        c.value::STRING AS chunk_text,
-                        MD5_HEX(t.relative_path || ':' || p.value:index::INT || ':' || c.index::INT)::STRING AS chunk_id
-                    FROM 
-                        {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.global_pf_sustainability_report t,
-                        LATERAL FLATTEN(input => t.raw_text_dict:pages) p,
-                        LATERAL FLATTEN(
-                            INPUT => SNOWFLAKE.CORTEX.SPLIT_TEXT_RECURSIVE_CHARACTER(
-                                p.value:content::STRING,
-                                'markdown',
-                                1000,
-                                100
-                            )
-                        ) c
-                    WHERE t.relative_path = '{escaped_stage_path}'
-                    """
-                    
                     try:
-                        session.sql(chunk_sql).collect()
+                        query_layer.collect("insert_report_chunks", [stage_path])
                         
-                        chunk_count_sql = f"""
-                        SELECT COUNT(*) as count 
-                        FROM {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.global_pf_sustainability_report_chunk
-                        WHERE relative_path = '{escaped_stage_path}'
-                        """
-                        chunk_count_result = session.sql(chunk_count_sql).collect()
-                        chunk_count = chunk_count_result[0]['COUNT']
+                        chunk_count = query_layer.scalar("count_report_chunks", [stage_path], default=0)
                         st.success(f"チャンク化完了（{chunk_count}チャンク生成）")
                         
                         if chunk_count == 0:
@@ -730,16 +807,22 @@ with tab4:
                         chunk_count = 0
                 
                 with st.spinner("ステップ4/4: データを反映中..."):
-                    escaped_filename = uploaded_file.name.replace("'", "''")
-                    
-                    view_check_sql = f"""
-                    SELECT COUNT(*) as count 
-                    FROM {CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.COMBINED_GLOBAL_SUSTAINABILITY_VIEW
-                    WHERE file_name = '{escaped_filename}'
-                    """
-                    view_result = session.sql(view_check_sql).collect()
-                    view_count = view_result[0]['COUNT']
-                    st.success(f"データ反映完了（ビュー内に{view_count}チャンク確認）")
+                    # 定型文などの重複チャンクを判定し、統合チャンクテーブル（ページ・検索サービスの参照先）に反映
+                    dedup_result = get_chunk_deduplicator().dedup_file(COLLECTION_GLOBAL, stage_path)
+                    publish_chunks(query_layer, COLLECTION_GLOBAL, "Global_PF_Sustainability", stage_path, dedup_result.to_json())
+                    view_count = query_layer.scalar("count_view_chunks", [uploaded_file.name], default=0)
+                    # ドキュメントカタログに登録（全ページのファイル一覧に反映される）
+                    get_document_catalog().record_ingestion(
+                        COLLECTION_GLOBAL,
+                        stage_path,
+                        source="Global_PF_Sustainability",
+                        size_bytes=uploaded_file.size,
+                        content_hash=content_hash(file_data),
+                    )
+                    st.success(
+                        f"データ反映完了（統合チャンクテーブルに{view_count}チャンク確認、"
+                        f"うち重複 {dedup_result.duplicates}件は検索対象から除外）"
+                    )
                 
                 st.markdown("---")
                 st.success(f"""
@@ -752,7 +835,7 @@ with tab4:
                 """)
                 
                 # キャッシュをリフレッシュしてからリロード
-                refresh_file_list()
+                get_report_text_loader().invalidate_version()
                 
                 if st.button("ページをリロード", key="reload_after_upload"):
                     st.rerun()
@@ -766,6 +849,9 @@ with tab4:
                 - 同じファイル名のレポートが既に存在しないか確認してください
                 """)
 
+with tab4:
+    render_upload_tab()
+
 # フッター
 st.markdown("---")
 st.caption("GPIF グローバル年金基金 サステナビリティレポート分析システム")
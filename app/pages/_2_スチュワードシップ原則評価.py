@@ -4,11 +4,64 @@
 
 import streamlit as st
 import pandas as pd
-import json
+import time
 from datetime import datetime
-from snowflake.snowpark.context import get_active_session
-from snowflake.core import Root
-import _snowflake
+from common.query_layer import Statement, get_query_layer
+from common.resources import get_root, get_session, send_snow_api_request
+from common.statements import DOCUMENT_CHUNKS_TABLE, INGESTION_STATEMENTS
+from common.agent_response import AgentResponse
+from common.agent_threads import AgentThread, AgentThreadManager
+from common.agent_client import (
+    AgentAPIError,
+    AgentClient,
+    CircuitBreaker,
+    RetryPolicy,
+    ERROR_CIRCUIT_OPEN,
+    ERROR_RESPONSE,
+)
+from common.principles import GPIF_PRINCIPLES, all_requirements, mentioned_principles, principle_requirements
+from common.requirement_evidence import (
+    EVIDENCE_STATEMENTS,
+    EvidenceStore,
+    RequirementPrefetcher,
+    evidence_digest,
+)
+from common.search import SEARCH_SERVICES, file_filter
+from common.query_expansion import get_cross_lingual_search
+from common.completion_executor import CompletionExecutor, FlowPolicy, get_latency_tracker, snowpark_starter
+from common.fast_evaluation import FastEvaluator, count_verdicts
+from common.catalog import COLLECTION_STEWARDSHIP, content_hash, get_document_catalog
+from common.ingestion import ShardedReportParser, publish_chunks, stage_writer
+from common.dedup import DEDUP_STATEMENTS, ChunkDeduplicator
+from common.citations import CITATION_STATEMENTS, CitationResolver, display_title
+from common.chat_render import (
+    history_window,
+    lazy_section,
+    new_turn_id,
+    render_load_more,
+    reset_history_window,
+    turn_id,
+)
+from common.scorecard import (
+    SCORECARD_STATEMENTS,
+    ScorecardStore,
+    build_scorecard_rows,
+    manager_comparison,
+    principle_scores,
+    scorecard_frame,
+    summary_metrics,
+    to_csv_bytes,
+    to_parquet_bytes,
+)
+from common.evaluation_store import (
+    EVALUATION_STORE_STATEMENTS,
+    EvaluationKey,
+    SnowflakeEvaluationStore,
+    is_storable,
+    lookup,
+    ordered_results,
+    principle_text_hash,
+)
 
 # =========================================================
 # ページ設定
@@ -118,9 +171,7 @@ st.markdown("""
 # =========================================================
 # Snowflake接続
 # =========================================================
-session = get_active_session()
-root = Root(session)
-
+# セッション・Rootは最初に使う時点で取得する（common.resources）
 pd.set_option("max_colwidth", None)
 pd.set_option('display.max_columns', None)
 
@@ -132,12 +183,20 @@ AGENT_SCHEMA = "DEMO_SUSTAINABILITY"
 AGENT_NAME = "STEWARDSHIP_AGENT"
 AGENT_FULL_NAME = f"{AGENT_DATABASE}.{AGENT_SCHEMA}.{AGENT_NAME}"
 
-API_ENDPOINT = "/api/v2/cortex/agent:run"
+# 回答ルールを含むAgent仕様（handson.ipynbのCREATE AGENT）を使って実行する
+API_ENDPOINT = f"/api/v2/databases/{AGENT_DATABASE}/schemas/{AGENT_SCHEMA}/agents/{AGENT_NAME}:run"
 API_TIMEOUT = 50000
+AGENT_MAX_ATTEMPTS = 3
+AGENT_BREAKER_FAILURE_THRESHOLD = 5
+AGENT_BREAKER_RESET_SEC = 30
+# handson.ipynbのCREATE AGENT（instructions・ツール定義）を変更したら更新する
+AGENT_SPEC_VERSION = "v2"
+CORPUS_VERSION_TTL_SEC = 300
+# チャット履歴の表示件数（「さらに表示」で増やした値）を保持するセッションキー
+CHAT_HISTORY_WINDOW_KEY = "chat_history_visible"
 
 DATA_DATABASE = "DEMO_DB"
 DATA_SCHEMA = "DEMO_SUSTAINABILITY"
-DATA_VIEW = "COMBINED_SUSTAINABILITY_CHUNKS_VIEW"
 DOCUMENT_STAGE = "DOCUMENT_STAGE"
 
 # AM用のテーブル
@@ -152,56 +211,53 @@ CORTEX_SEARCH_MAX_RESULTS = 12
 CORTEX_SEARCH_ID_COLUMN = "SCOPED_FILE_URL"
 CORTEX_SEARCH_TITLE_COLUMN = "RELATIVE_PATH"
 
+# 高速評価（Agentを経由せず Cortex Search + COMPLETE を直接実行）
+ENGINE_AGENT = "agent"
+ENGINE_FAST = "fast"
+ENGINE_LABELS = {
+    ENGINE_FAST: "高速評価（Search + Complete）",
+    ENGINE_AGENT: "Cortex Agent",
+}
+FAST_EVAL_MODEL = "claude-sonnet-4-5"
+FAST_EVAL_NUM_RESULTS = 5
+FAST_EVAL_MAX_WORKERS = 8
+# プロンプト・判定ロジック・モデルを変更したら更新する
+FAST_EVAL_SPEC_VERSION = "fast-v1"
+# 要求事項ごとのCOMPLETEの期限・フォールバック
+FAST_EVAL_POLICY = FlowPolicy(fallbacks=["claude-4-sonnet", "llama4-maverick"], timeout_sec=60, initial_hedge_sec=15)
+
 # =========================================================
-# GPIFのスチュワードシップ活動原則（5つの原則）
+# SQLステートメント（値はすべてバインドパラメータ）
 # =========================================================
-GPIF_PRINCIPLES = {
-    "原則1": {
-        "title": "運用受託機関におけるコーポレート・ガバナンス体制",
-        "description": """○運用受託機関は、日本版スチュワードシップ・コードを受け入れること。
-○運用受託機関は、自らのコーポレート・ガバナンス体制を整えること。特に、運用機関としての独立性、透明性を高めるため、独立性の高い社外取締役を導入する等、監督の仕組みを整えること。
-○運用受託機関は、スチュワードシップ責任を実効的に果たすための組織・体制の構築、人材育成を行うこと。
-○運用受託機関は、役職員の報酬体系がどのように受益者の利益に合致しているか説明を行うこと。"""
-    },
-    "原則2": {
-        "title": "運用受託機関における利益相反管理",
-        "description": """○運用受託機関は、受益者の利益を第一として行動するために、適切に利益相反（企業グループに所属する場合には、グループ内における利益相反を含む。）を管理すること。管理に当たっては、利益相反の種類を資本関係、取引関係等に類型化した上で、管理方針を策定し、公表すること。
-○運用受託機関は、独立性の高い第三者委員会の設置等、利益相反を防止するための体制・仕組みを構築し、公表すること。第三者委員会の構成は、独立性、経験等も十分考慮して検討すること。
-○運用受託機関は、自社又は親会社、グループ会社等の利害関係先に対して議決権行使を行う場合、第三者委員会等による行使判断や妥当性の検討、議決権行使助言会社の推奨の適用等、恣意性を排除し、ガバナンスのベストプラクティスを追求する仕組みを整え、公表すること。"""
-    },
-    "原則3": {
-        "title": "エンゲージメントを含むスチュワードシップ活動方針",
-        "description": """○運用受託機関は、エンゲージメントを含むスチュワードシップ活動を実施するに当たり、スチュワードシップ活動方針を策定し、公表すること。
-○運用受託機関は、エンゲージメントを含むスチュワードシップ活動についてはショートターミズムに陥らないよう、長期の視点からリスク調整後のリターン向上に資する内容、質を重視して取り組むこと。また、実効的な活動が行えるよう、アクションプランの策定等も検討すること。
-○運用受託機関は、エンゲージメントを含むスチュワードシップ活動と運用の連携を図ること。
-○運用受託機関は、インデックス構成が投資パフォーマンスを大きく左右する要素であることを踏まえ、インデックス会社が実施するコンサルテーションの機会を活用する等、受益者の利益のため、積極的にエンゲージメントを行うこと。
-○運用受託機関は、市場全体の持続的成長の観点から、企業やインデックス会社にとどまらず関係者と幅広くエンゲージメントを行うこと。
-○運用受託機関は、コーポレート・ガバナンスに関する報告書、統合報告書等に記載の非財務情報も十分に活用し企業とエンゲージメントを行うこと。
-○運用受託機関は、各国のコーポレートガバナンス・コード又はそれに準ずるものの各原則において、企業が「実施しない理由」を説明している項目について、企業の考えを十分にヒアリングすること。
-○特に、株式のパッシブ運用を行う運用受託機関は、市場全体の持続的成長を目指す観点から、エンゲージメントの戦略を立案し、実効性のある取組みを実践すること。
-○運用受託機関は、エンゲージメント代行会社を利用する場合、採用に当たり、組織体制、人員等についてデューディリジェンスを実施するとともに、採用後にはサービス内容についてモニタリング・評価を継続的に行い、必要に応じてエンゲージメントを行うこと。"""
-    },
-    "原則4": {
-        "title": "投資におけるESGなどのサステナビリティの考慮",
-        "description": """○投資においてESG（環境・社会・ガバナンス）などのサステナビリティを適切に考慮することは、運用資産の長期的な投資収益拡大の観点から、企業価値の向上や投資先及び市場全体の持続的成長に資すると考えられることから、運用受託機関は、セクターにおける重要性、投資先の実情等を踏まえて、ESGなどのサステナビリティ課題に取り組むこと。
-○運用受託機関は、重大なESGなどのサステナビリティ課題について、投資家として考える目標を示し、積極的にエンゲージメントを行うこと。
-○運用受託機関は、PRI（責任投資原則）への署名を行うこと。また、ESGなどのサステナビリティに関する様々なイニシアティブに積極的に参加すること。"""
+STEWARDSHIP_STATEMENTS = [
+    Statement(
+        "cortex_complete",
+        """
+        SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS response
+        """,
+    ),
+] + INGESTION_STATEMENTS + DEDUP_STATEMENTS + EVALUATION_STORE_STATEMENTS + EVIDENCE_STATEMENTS + SCORECARD_STATEMENTS + CITATION_STATEMENTS
+
+query_layer = get_query_layer(
+    get_session,
+    STEWARDSHIP_STATEMENTS,
+    {
+        "db": DATA_DATABASE,
+        "schema": DATA_SCHEMA,
+        "stage": DOCUMENT_STAGE,
+        "report_table": AM_REPORT_TABLE,
+        "chunk_table": AM_CHUNK_TABLE,
+        "chunk_catalog": DOCUMENT_CHUNKS_TABLE,
+        "search_service": CORTEX_SEARCH_SERVICE,
     },
-    "原則5": {
-        "title": "議決権行使",
-        "description": """○運用受託機関は、議決権の行使について、GPIFから委託されたものであることを十分認識し、受託者責任の観点から専ら受益者の利益のために議決権を行使すること。
-○運用受託機関は、企業価値向上を促すエンゲージメントの一環として、別に定める議決権行使原則のとおり、議決権を行使すること。
-○運用受託機関は、議決権行使において議決権行使助言会社を利用する場合、採用に当たり、組織体制、人員等についてデューディリジェンスを実施するとともに、採用後にはその助言内容についてモニタリング・評価を継続的に行い、必要に応じてエンゲージメントを行うこと（利益相反管理を目的とする場合は除く。）。"""
-    }
-}
+    key="stewardship_query_layer",
+)
 
 # =========================================================
 # セッション状態の初期化
 # =========================================================
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
-if 'agent_session_id' not in st.session_state:
-    st.session_state.agent_session_id = None
 if 'selected_company' not in st.session_state:
     st.session_state.selected_company = None
 if 'selected_file' not in st.session_state:
@@ -210,76 +266,115 @@ if 'evaluation_results' not in st.session_state:
     st.session_state.evaluation_results = None
 if 'file_list_refresh_key' not in st.session_state:
     st.session_state.file_list_refresh_key = 0
+if 'evaluation_results_key' not in st.session_state:
+    st.session_state.evaluation_results_key = None
+if 'evaluation_engine' not in st.session_state:
+    st.session_state.evaluation_engine = ENGINE_FAST
+if 'evaluation_benchmarks' not in st.session_state:
+    st.session_state.evaluation_benchmarks = []
+if 'requirement_evidence' not in st.session_state:
+    st.session_state.requirement_evidence = {}
+if 'scorecard_cache' not in st.session_state:
+    st.session_state.scorecard_cache = {}
+if 'individual_evaluations' not in st.session_state:
+    # (対象レポート, 原則) -> 個別評価の結果（参照資料の開閉で再実行されても表示し続ける）
+    st.session_state.individual_evaluations = {}
 
 # =========================================================
 # データ取得関数（動的にレポートを取得）
 # =========================================================
 def get_am_file_list():
-    """運用機関レポートのリストをビューから動的に取得"""
-    # refresh_keyを使ってキャッシュを無効化できるようにする
-    refresh_key = st.session_state.get('file_list_refresh_key', 0)
-    return _get_am_file_list_cached(refresh_key)
-
-@st.cache_data
-def _get_am_file_list_cached(refresh_key):
-    """キャッシュ付きのファイルリスト取得関数"""
+    """運用機関レポートのリストをドキュメントカタログから取得（全セッション共有のキャッシュ）"""
     try:
         # AMレポートのみを取得（source_table = 'AM'）
-        query = f"""
-        SELECT DISTINCT FILE_NAME, SOURCE_TABLE
-        FROM {DATA_DATABASE}.{DATA_SCHEMA}.{DATA_VIEW}
-        WHERE SOURCE_TABLE = 'AM'
-        ORDER BY FILE_NAME
-        """
-        df = session.sql(query).to_pandas()
-        return df
+        return get_document_catalog().files(COLLECTION_STEWARDSHIP, source="AM")
     except Exception as e:
         st.error(f"ファイル一覧の取得に失敗しました: {str(e)}")
         return pd.DataFrame()
 
+def get_report_parser() -> ShardedReportParser:
+    """セッションごとのレポート解析（ページ範囲ごとの並列解析。保存先のテーブルがページで異なるためキーを分ける）"""
+    if 'stewardship_report_parser' not in st.session_state:
+        st.session_state.stewardship_report_parser = ShardedReportParser(
+            query_layer,
+            stage_writer(get_session, f"{DATA_DATABASE}.{DATA_SCHEMA}.{DOCUMENT_STAGE}")
+        )
+    return st.session_state.stewardship_report_parser
+
+def get_chunk_deduplicator() -> ChunkDeduplicator:
+    """セッションごとの重複チャンク判定（このページのクエリレイヤーを使うためキーを分ける）"""
+    if 'stewardship_chunk_deduplicator' not in st.session_state:
+        st.session_state.stewardship_chunk_deduplicator = ChunkDeduplicator(query_layer)
+    return st.session_state.stewardship_chunk_deduplicator
+
 def refresh_file_list():
-    """ファイルリストのキャッシュをリフレッシュ"""
+    """レポート追加時に、ファイル単位のキャッシュ（コーパスバージョン）を無効化"""
     st.session_state.file_list_refresh_key += 1
 
+# =========================================================
+# 評価結果ストア
+# =========================================================
+def get_evaluation_store() -> SnowflakeEvaluationStore:
+    """セッションごとの評価結果ストアを取得"""
+    if 'evaluation_store' not in st.session_state:
+        st.session_state.evaluation_store = SnowflakeEvaluationStore(query_layer)
+    return st.session_state.evaluation_store
+
+def get_corpus_version(selected_file):
+    """対象レポートのコーパスバージョンを取得（レポート追加時はrefresh_keyで無効化）"""
+    refresh_key = st.session_state.get('file_list_refresh_key', 0)
+    return _get_corpus_version_cached(selected_file, refresh_key)
+
+@st.cache_data(ttl=CORPUS_VERSION_TTL_SEC)
+def _get_corpus_version_cached(selected_file, refresh_key):
+    return get_evaluation_store().corpus_version(selected_file)
+
+def evaluation_spec_version(engine):
+    """評価方式ごとの仕様バージョン（方式が違う結果は再利用しない）"""
+    return FAST_EVAL_SPEC_VERSION if engine == ENGINE_FAST else AGENT_SPEC_VERSION
+
+def load_stored_evaluations(selected_file, engine):
+    """現在の原則・評価方式の仕様・コーパスに一致する保存済み評価結果を取得"""
+    if not selected_file:
+        return {}
+    try:
+        return get_evaluation_store().load_latest(
+            selected_file, evaluation_spec_version(engine), get_corpus_version(selected_file)
+        )
+    except Exception as e:
+        st.warning(f"保存済みの評価結果を取得できませんでした: {str(e)}")
+        return {}
+
+def sync_evaluation_results(selected_file, engine):
+    """対象レポート・評価方式が変わったら保存済みの評価結果を読み込む"""
+    if st.session_state.evaluation_results_key == (selected_file, engine):
+        return
+    stored = load_stored_evaluations(selected_file, engine)
+    results = ordered_results(stored, GPIF_PRINCIPLES)
+    st.session_state.evaluation_results = results or None
+    st.session_state.evaluation_results_key = (selected_file, engine)
+
 # =========================================================
 # Agent API関数
 # =========================================================
-def build_agent_payload(user_message: str, session_id: str | None = None) -> dict:
-    """Agent呼び出し用のpayloadを生成"""
-    selected_file = st.session_state.get('selected_file')
+def build_agent_payload(user_message: str, thread: AgentThread | None = None) -> dict:
+    """Agent呼び出し用のpayloadを生成
     
-    file_context = ""
-    search_filter = ""
+    回答ルールはAgentの仕様（instructions）に定義済みのため送信しない。
+    対象レポートの指定はスレッドの最初のメッセージ（またはスレッドなしの単発呼び出し）にのみ付与し、
+    2ターン目以降は thread_id / parent_message_id と質問文だけを送る。
+    """
+    selected_file = st.session_state.get('selected_file')
     
-    if selected_file:
+    message_text = user_message
+    if selected_file and (thread is None or not thread.thread_id or thread.is_new):
         file_context = (
-            f"\n【重要】対象レポート: {selected_file}\n"
-            f"**必ずこのレポート（ファイル名に'{selected_file}'を含むもの）からのみ情報を取得してください。**\n"
-            "**他のレポートの情報は絶対に使用しないでください。**\n"
+            f"【対象レポート】{selected_file}\n"
+            f"このレポート（ファイル名に'{selected_file}'を含むもの）からのみ情報を取得してください。\n"
         )
-        search_filter = f"ファイル名='{selected_file}'"
-
-    guidance_text = (
-        "以下のルールに厳密に従って回答してください。\n"
-        "1. 必ずCortex Search (sustainability_report_search_tool) を使って関連情報を検索すること。\n"
-        "2. 検索結果の引用に基づいて回答すること。\n"
-        "3. 引用する際はファイル名とページ番号を必ず明示すること。\n"
-        "4. **検索時は、指定されたレポートに関連する情報のみを取得すること。**\n"
-        "5. **評価の際は、具体的な数値や詳細な記載がなくても、原則の趣旨に沿った取り組みや方針が示されていれば「対応している」と判断すること。**\n"
-    )
-    
-    if search_filter:
-        guidance_text += f"6. **検索条件: {search_filter}**\n"
-
-    message_text = (
-        guidance_text
-        + file_context
-        + "\n【質問】\n"
-        + user_message
-    )
+        message_text = file_context + "\n【質問】\n" + user_message
 
     payload = {
-        "agent": AGENT_FULL_NAME,
         "messages": [
             {
                 "role": "user",
@@ -290,185 +385,145 @@ def build_agent_payload(user_message: str, session_id: str | None = None) -> dic
                     }
                 ]
             }
-        ],
-        "tools": [
-            {
-                "tool_spec": {
-                    "type": "cortex_search",
-                    "name": CORTEX_SEARCH_TOOL_NAME
-                }
-            }
-        ],
-        "tool_resources": {
-            CORTEX_SEARCH_TOOL_NAME: {
-                "name": f"{CORTEX_SEARCH_DATABASE}.{CORTEX_SEARCH_SCHEMA}.{CORTEX_SEARCH_SERVICE}",
-                "max_results": CORTEX_SEARCH_MAX_RESULTS,
-                "id_column": CORTEX_SEARCH_ID_COLUMN,
-                "title_column": CORTEX_SEARCH_TITLE_COLUMN
-            }
-        }
+        ]
     }
 
-    if session_id:
-        payload["session_id"] = session_id
+    if thread is not None and thread.thread_id:
+        payload["thread_id"] = thread.thread_id
+        payload["parent_message_id"] = thread.parent_message_id
 
     return payload
 
-def call_agent_api(message: str, session_id: str = None):
-    """Cortex Agent APIを呼び出してメッセージを送信"""
+def get_current_user() -> str:
+    """スレッドのキーに使うユーザー名を取得"""
+    user = getattr(st, "user", None) or getattr(st, "experimental_user", None)
     try:
-        request_body = build_agent_payload(message, session_id)
-
-        response = _snowflake.send_snow_api_request(
-            "POST",
-            API_ENDPOINT,
-            {},
-            {},
-            request_body,
-            {},
-            API_TIMEOUT
+        return user.get("user_name") or user.get("email") or "default"
+    except Exception:
+        return "default"
+
+def get_thread_manager() -> AgentThreadManager:
+    """セッションごとのスレッドマネージャーを取得"""
+    if 'agent_thread_manager' not in st.session_state:
+        st.session_state.agent_thread_manager = AgentThreadManager(get_agent_client())
+    return st.session_state.agent_thread_manager
+
+@st.cache_resource
+def get_agent_client():
+    """全セッションで共有するAgentクライアント（サーキットブレーカーの状態を共有）"""
+    return AgentClient(
+        transport=send_snow_api_request,
+        endpoint=API_ENDPOINT,
+        timeout_ms=API_TIMEOUT,
+        retry_policy=RetryPolicy(max_attempts=AGENT_MAX_ATTEMPTS),
+        breaker=CircuitBreaker(
+            failure_threshold=AGENT_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout_sec=AGENT_BREAKER_RESET_SEC
         )
-        
-        if response:
-            if isinstance(response, dict) and 'status' in response:
-                if response['status'] != 200:
-                    return None
-                
-                content = response.get('content', '')
-                
-                if isinstance(content, str):
-                    try:
-                        response_json = json.loads(content)
-                    except json.JSONDecodeError:
-                        return None
-                else:
-                    response_json = content
-            else:
-                if isinstance(response, (dict, list)):
-                    response_json = response
-                elif isinstance(response, str):
-                    try:
-                        response_json = json.loads(response)
-                    except json.JSONDecodeError:
-                        return None
-                else:
-                    response_json = response
-            
-            return response_json
-        else:
-            return None
-            
-    except Exception as e:
-        return None
+    )
+
+def call_agent_api(message: str, thread: AgentThread | None = None):
+    """Cortex Agent APIを呼び出し、受信したイベントのイテレータを返す
+    
+    失敗時は分類済みの AgentAPIError を送出する。
+    スレッドへの追記は冪等でないため、スレッド利用時はリトライしない。
+    """
+    request_body = build_agent_payload(message, thread)
+    idempotent = thread is None or not thread.thread_id
+    return get_agent_client().run(request_body, idempotent=idempotent)
+
+def send_message_to_agent(message: str, use_thread: bool = False):
+    """Cortex Agentにメッセージを送信して応答を取得
+    
+    use_thread=True の場合は (ユーザー, 対象ファイル) のスレッドで会話を継続する。
+    send_snow_api_request は応答本文をすべて受信してから返すため、途中経過は表示できない。
+    失敗時は AgentAPIError を送出する。
+    """
+    thread = None
+    if use_thread:
+        thread = get_thread_manager().get(get_current_user(), st.session_state.get('selected_file'))
+    
+    agent_response = AgentResponse.from_events(call_agent_api(message, thread))
+    
+    content_text = agent_response.text
+    if not content_text:
+        raise AgentAPIError(ERROR_RESPONSE, "応答本文が空です")
+    
+    if thread is not None:
+        get_thread_manager().record_turn(thread, agent_response.metadata)
+    
+    return {
+        'content': content_text,
+        'citations': agent_response.citations,
+        'thread_id': thread.thread_id if thread is not None else None
+    }
+
+@st.cache_resource
+def get_citation_resolver():
+    """全セッションで共有する引用リゾルバ（presigned URLのキャッシュを共有）"""
+    return CitationResolver()
 
-def send_message_to_agent(message: str):
-    """Cortex Agentにメッセージを送信して応答を取得"""
+def resolve_citations(citations):
+    """引用のページ番号・chunk_id・URLを1回のクエリでまとめて補完"""
+    if not citations:
+        return citations
     try:
-        response = call_agent_api(message, st.session_state.agent_session_id)
-        
-        if not response:
-            return None
-        
-        session_id = None
-        content_text = ""
-        citations = []
-        
-        # イベントストリーム形式のレスポンスを処理
-        if isinstance(response, list):
-            for event in response:
-                if not isinstance(event, dict):
-                    continue
-                
-                event_type = event.get('event', '')
-                event_data = event.get('data', {})
-                
-                if isinstance(event_data, str):
-                    try:
-                        event_data = json.loads(event_data)
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-                
-                if event_type == 'response.text':
-                    if isinstance(event_data, dict) and 'text' in event_data:
-                        content_text = event_data['text']
-                
-                elif event_type == 'response.text.annotation':
-                    if isinstance(event_data, dict) and 'annotation' in event_data:
-                        annotation = event_data['annotation']
-                        if annotation.get('type') == 'cortex_search_citation':
-                            citation = {
-                                'doc_id': annotation.get('doc_id', ''),
-                                'doc_title': annotation.get('doc_title', ''),
-                                'text': annotation.get('text', ''),
-                                'index': annotation.get('index', 0),
-                                'search_result_id': annotation.get('search_result_id', '')
-                            }
-                            citations.append(citation)
-                
-                elif event_type == 'response':
-                    if isinstance(event_data, dict):
-                        if 'content' in event_data and isinstance(event_data['content'], list):
-                            for content_item in event_data['content']:
-                                if isinstance(content_item, dict):
-                                    if content_item.get('type') == 'citations':
-                                        additional_citations = content_item.get('citations', [])
-                                        citations.extend(additional_citations)
-                        
-                        if 'citations' in event_data:
-                            additional_citations = event_data['citations']
-                            citations.extend(additional_citations)
-                
-                # セッションIDの取得
-                if 'session_id' in event:
-                    session_id = event['session_id']
-                elif isinstance(event_data, dict) and 'session_id' in event_data:
-                    session_id = event_data['session_id']
-        
-        # messageフィールドがある場合
-        elif isinstance(response, dict) and 'message' in response:
-            message_content = response['message']
-            
-            if 'content' in message_content:
-                if isinstance(message_content['content'], str):
-                    content_text = message_content['content']
-                elif isinstance(message_content['content'], list):
-                    for content_item in message_content['content']:
-                        if isinstance(content_item, dict) and content_item.get('type') == 'text':
-                            content_text += content_item.get('text', '')
-            
-            if 'citations' in message_content:
-                citations = message_content['citations']
-            elif 'citations' in response:
-                citations = response['citations']
-            
-            session_id = response.get('session_id')
-        
-        # セッションIDの保存
-        if session_id and not st.session_state.agent_session_id:
-            st.session_state.agent_session_id = session_id
-        
-        if not content_text:
-            return None
+        return get_citation_resolver().resolve(query_layer, citations)
+    except Exception:
+        # 解決できなくても元の引用（タイトル・本文）は表示できる
+        return citations
+
+def render_citations(citations, max_chars=200):
+    """参照資料を表示（保存済みのURLは期限切れ前のものに差し替える）"""
+    try:
+        citations = get_citation_resolver().refresh_urls(query_layer, citations)
+    except Exception:
+        pass
+    for idx, citation in enumerate(citations, 1):
+        label = f"**[{idx}] {display_title(citation)}**"
+        page_index = citation.get('page_index')
+        if page_index not in (None, ""):
+            label += f"（ページ: {page_index}）"
+        if citation.get('url'):
+            label += f" [PDFを開く]({citation['url']})"
+        st.markdown(label)
         
-        return {
-            'content': content_text,
-            'citations': citations,
-            'session_id': session_id
-        }
+        text = citation.get('text') or citation.get('content') or ''
+        if text and len(str(text)) > max_chars:
+            st.caption(str(text)[:max_chars] + "...")
+        elif text:
+            st.caption(text)
         
-    except Exception as e:
-        return None
+        if idx < len(citations):
+            st.markdown("---")
+
+def render_citation_section(citations, key, max_chars=200):
+    """参照資料の一覧（開いたときだけ描画・URLを解決する）"""
+    lazy_section(
+        f"参照資料 ({len(citations)}件)",
+        key=f"citations_{key}",
+        render_fn=lambda: render_citations(citations, max_chars=max_chars),
+    )
 
 def evaluate_principle_with_agent(principle_key, principle_data, selected_file):
     """特定の原則に対する評価をAgentで実行"""
     principle_details = principle_data.get('description', '')
+    evidence_context = build_evidence_context([principle_key], selected_file)
+    evidence_section = ""
+    if evidence_context:
+        evidence_section = f"""
+【事前検索済みの根拠（対象レポートからの抜粋）】
+{evidence_context}
+
+上記の根拠を起点に評価し、根拠が不足する項目のみ追加で検索してください。
+"""
     
     query = f"""
 {principle_key}: {principle_data['title']}
 
 【原則の詳細】
 {principle_details}
-
+{evidence_section}
 上記のGPIFスチュワードシップ活動原則について、「{selected_file}」の対応状況を分析してください。
 
 **【重要】以下のフォーマットで回答してください：**
@@ -510,24 +565,254 @@ def evaluate_principle_with_agent(principle_key, principle_data, selected_file):
 """
     
     with st.spinner(f'{principle_key}の評価中...'):
-        response = send_message_to_agent(query)
-        
-        if response:
+        try:
+            response = send_message_to_agent(query)
+        except AgentAPIError as e:
             return {
                 'principle': principle_key,
                 'title': principle_data['title'],
                 'query': query,
-                'response': response.get('content', '応答を取得できませんでした'),
-                'citations': response.get('citations', [])
+                'response': f'エラー: {e.user_message()}',
+                'citations': [],
+                'error_kind': e.kind
             }
+        
+        return {
+            'principle': principle_key,
+            'title': principle_data['title'],
+            'query': query,
+            'response': response.get('content', '応答を取得できませんでした'),
+            'citations': resolve_citations(response.get('citations', []))
+        }
+
+def search_report_chunks(query, file_name):
+    """対象レポートに絞ってCortex Searchを実行（ワーカースレッドから呼び出す）
+
+    日本語の要求事項は英訳クエリでも検索して統合する（英訳はキャッシュされ、2回目以降はモデルを呼ばない）。
+    """
+    return get_cross_lingual_search().search(
+        get_root(),
+        query,
+        SEARCH_SERVICES[0],
+        num_results=FAST_EVAL_NUM_RESULTS,
+        filter_obj=file_filter(file_name),
+    )
+
+def get_completion_executor() -> CompletionExecutor:
+    """セッションごとのCOMPLETE実行（期限・ヘッジ・フォールバック。レイテンシの記録は全セッション共有）"""
+    if 'stewardship_completion_executor' not in st.session_state:
+        st.session_state.stewardship_completion_executor = CompletionExecutor(
+            snowpark_starter(query_layer, "cortex_complete"),
+            policies={"fast_eval": FAST_EVAL_POLICY},
+            tracker=get_latency_tracker(),
+        )
+    return st.session_state.stewardship_completion_executor
+
+def completion_fn(executor: CompletionExecutor):
+    """COMPLETEを実行する関数（ワーカースレッドから呼び出すため、実行器はメインスレッドで取得して渡す）"""
+    def complete_text(prompt):
+        return executor.complete("fast_eval", FAST_EVAL_MODEL, prompt).text
+    return complete_text
+
+def get_fast_evaluator() -> FastEvaluator:
+    """セッションごとの高速評価エンジンを取得"""
+    if 'fast_evaluator' not in st.session_state:
+        st.session_state.fast_evaluator = FastEvaluator(
+            search_fn=search_report_chunks,
+            complete_fn=completion_fn(get_completion_executor()),
+            max_workers=FAST_EVAL_MAX_WORKERS,
+        )
+    return st.session_state.fast_evaluator
+
+def get_evidence_store() -> EvidenceStore:
+    """セッションごとの根拠ストアを取得"""
+    if 'evidence_store' not in st.session_state:
+        st.session_state.evidence_store = EvidenceStore(query_layer)
+    return st.session_state.evidence_store
+
+def prefetch_requirement_evidence(selected_file, refresh_service=False):
+    """全要求事項の検索を対象レポートに絞って実行し、上位k件の根拠を保存"""
+    if refresh_service:
+        try:
+            query_layer.collect("search_service_refresh")
+        except Exception as e:
+            st.warning(f"検索サービスの更新に失敗しました（TARGET_LAG経過後に反映されます）: {str(e)}")
+    
+    requirements = all_requirements(GPIF_PRINCIPLES)
+    prefetcher = RequirementPrefetcher(
+        search_report_chunks,
+        top_k=FAST_EVAL_NUM_RESULTS,
+        max_workers=FAST_EVAL_MAX_WORKERS
+    )
+    evidence = prefetcher.prefetch(selected_file, requirements)
+    saved = get_evidence_store().save(selected_file, requirements, evidence)
+    st.session_state.requirement_evidence[selected_file] = evidence
+    return saved
+
+def get_requirement_evidence(selected_file):
+    """要求事項ごとの根拠を取得（未取得のレポートはその場で事前検索する）"""
+    if not selected_file:
+        return {}
+    cache = st.session_state.requirement_evidence
+    if selected_file not in cache:
+        try:
+            evidence = get_evidence_store().load(selected_file, all_requirements(GPIF_PRINCIPLES))
+            if evidence:
+                cache[selected_file] = evidence
+            else:
+                with st.spinner("要求事項ごとの根拠を検索中..."):
+                    prefetch_requirement_evidence(selected_file)
+        except Exception as e:
+            st.warning(f"事前検索済みの根拠を取得できませんでした: {str(e)}")
+            return {}
+    return cache.get(selected_file, {})
+
+def build_evidence_context(principle_keys, selected_file):
+    """Agentへのメッセージに添える、原則の要求事項ごとの根拠の抜粋"""
+    evidence = get_requirement_evidence(selected_file)
+    if not evidence:
+        return ""
+    requirements = []
+    for key in principle_keys:
+        requirements.extend(principle_requirements(key, GPIF_PRINCIPLES[key]))
+    return evidence_digest(requirements, evidence)
+
+def get_scorecard_store() -> ScorecardStore:
+    """セッションごとのスコアカードストアを取得"""
+    if 'scorecard_store' not in st.session_state:
+        st.session_state.scorecard_store = ScorecardStore(query_layer)
+    return st.session_state.scorecard_store
+
+def get_scorecard_frame(engine):
+    """全運用機関の最新スコアカード（評価を保存するたびに再取得）"""
+    cache = st.session_state.scorecard_cache
+    if engine not in cache:
+        try:
+            cache[engine] = get_scorecard_store().load_latest(evaluation_spec_version(engine))
+        except Exception as e:
+            st.warning(f"スコアカードを取得できませんでした: {str(e)}")
+            return scorecard_frame([])
+    return cache[engine]
+
+def current_scorecard(selected_file, engine, results):
+    """表示中の評価結果のスコアカード（保存済みの行がなければ結果から作成）"""
+    all_df = get_scorecard_frame(engine)
+    file_df = all_df[all_df["file_name"] == selected_file]
+    evaluated = {r['principle'] for r in results}
+    if set(file_df["principle"]) >= evaluated:
+        return file_df[file_df["principle"].isin(evaluated)]
+    rows = []
+    for result in results:
+        rows.extend(build_scorecard_rows(
+            selected_file or "",
+            result,
+            principle_requirements(result['principle'], GPIF_PRINCIPLES[result['principle']]),
+            engine,
+            evaluation_spec_version(engine),
+        ))
+    return scorecard_frame(rows)
+
+def save_evaluation(principle_key, principle_data, selected_file, result, engine):
+    """評価結果に評価日時を付けて保存（○ 項目ごとの判定はスコアカードに保存）"""
+    principle_hash = principle_text_hash(principle_data)
+    result['principle_hash'] = principle_hash
+    result['evaluated_at'] = datetime.now().isoformat(timespec="seconds")
+    result['engine'] = engine
+    
+    if selected_file and is_storable(result):
+        rows = build_scorecard_rows(
+            selected_file,
+            result,
+            principle_requirements(principle_key, principle_data),
+            engine,
+            evaluation_spec_version(engine),
+        )
+        try:
+            get_scorecard_store().save(rows)
+            st.session_state.scorecard_cache.pop(engine, None)
+        except Exception as e:
+            st.warning(f"スコアカードの保存に失敗しました: {str(e)}")
+    
+    if selected_file:
+        key = EvaluationKey(
+            file_name=selected_file,
+            principle=principle_key,
+            principle_hash=principle_hash,
+            agent_spec_version=evaluation_spec_version(engine),
+            corpus_version=get_corpus_version(selected_file),
+        )
+        try:
+            get_evaluation_store().save(key, result)
+        except Exception as e:
+            st.warning(f"評価結果の保存に失敗しました: {str(e)}")
+    return result
+
+def evaluate_principle(principle_key, principle_data, selected_file, stored=None, force=False, engine=ENGINE_AGENT):
+    """保存済みの結果があれば再利用し、なければ指定の方式で評価して保存"""
+    if not force and stored is not None:
+        cached = lookup(stored, principle_key, principle_text_hash(principle_data))
+        if cached is not None:
+            return cached
+    
+    if engine == ENGINE_FAST:
+        with st.spinner(f'{principle_key}の評価中...'):
+            result = get_fast_evaluator().evaluate(
+                principle_key, principle_data, selected_file,
+                evidence=get_requirement_evidence(selected_file)
+            )
+        result['citations'] = resolve_citations(result['citations'])
+    else:
+        result = evaluate_principle_with_agent(principle_key, principle_data, selected_file)
+    return save_evaluation(principle_key, principle_data, selected_file, result, engine)
+
+def evaluate_all_fast(selected_file, stored=None, force=False, on_done=None):
+    """未評価の原則の全項目をまとめて並列評価（保存済みの原則は再利用）"""
+    reused = {}
+    pending = {}
+    for key, principle in GPIF_PRINCIPLES.items():
+        cached = None if force or stored is None else lookup(stored, key, principle_text_hash(principle))
+        if cached is not None:
+            reused[key] = cached
         else:
-            return {
-                'principle': principle_key,
-                'title': principle_data['title'],
-                'query': query,
-                'response': 'エラー: 応答を取得できませんでした',
-                'citations': []
-            }
+            pending[key] = principle
+    
+    evaluated = {}
+    if pending:
+        evidence = get_requirement_evidence(selected_file)
+        for result in get_fast_evaluator().evaluate_many(pending, selected_file, on_done=on_done, evidence=evidence):
+            key = result['principle']
+            result['citations'] = resolve_citations(result['citations'])
+            evaluated[key] = save_evaluation(key, pending[key], selected_file, result, ENGINE_FAST)
+    return [reused.get(key) or evaluated[key] for key in GPIF_PRINCIPLES]
+
+def run_evaluation_benchmark(principle_key, selected_file):
+    """同じ原則をAgent経由と高速評価で実行し、所要時間と判定を比較"""
+    principle = GPIF_PRINCIPLES[principle_key]
+    rows = []
+    for engine in (ENGINE_AGENT, ENGINE_FAST):
+        start = time.perf_counter()
+        if engine == ENGINE_FAST:
+            with st.spinner(f'{principle_key}の評価中（高速評価）...'):
+                result = get_fast_evaluator().evaluate(
+                    principle_key, principle, selected_file,
+                    evidence=get_requirement_evidence(selected_file)
+                )
+        else:
+            result = evaluate_principle_with_agent(principle_key, principle, selected_file)
+        elapsed_sec = time.perf_counter() - start
+        counts = count_verdicts(result.get('response', ''))
+        rows.append({
+            "原則": principle_key,
+            "方式": ENGINE_LABELS[engine],
+            "所要時間(秒)": round(elapsed_sec, 2),
+            "✅": counts["対応している"],
+            "⚠️": counts["部分的に対応"],
+            "❌": counts["情報なし"],
+            "参照数": len(result.get('citations', [])),
+            "エラー": result.get('error_kind') or "",
+            "実行日時": datetime.now().strftime('%H:%M:%S'),
+        })
+    return rows
 
 # =========================================================
 # UI
@@ -562,6 +847,25 @@ with st.sidebar:
         st.warning("レポートが見つかりません")
         st.session_state.selected_file = None
     
+    st.markdown("**評価方式**")
+    engine_options = list(ENGINE_LABELS.keys())
+    st.session_state.evaluation_engine = st.radio(
+        "評価方式",
+        options=engine_options,
+        index=engine_options.index(st.session_state.evaluation_engine),
+        format_func=lambda engine: ENGINE_LABELS[engine],
+        label_visibility="collapsed",
+        help="高速評価は ○ 項目ごとに対象レポートを直接検索し、並列に判定します"
+    )
+    
+    sync_evaluation_results(st.session_state.selected_file, st.session_state.evaluation_engine)
+    
+    if st.session_state.selected_file and st.button("根拠を再検索", use_container_width=True,
+                                                    help="GPIF原則の要求事項ごとの検索をやり直し、保存済みの根拠を更新します"):
+        with st.spinner("要求事項ごとの根拠を検索中..."):
+            evidence_count = prefetch_requirement_evidence(st.session_state.selected_file)
+        st.caption(f"{evidence_count}件の根拠チャンクを保存しました")
+    
     st.markdown("---")
     
     st.markdown("**GPIF 5つの原則**")
@@ -575,6 +879,28 @@ with st.sidebar:
     st.markdown("---")
     st.caption(f"Agent: {AGENT_NAME}")
     st.caption(f"データソース: {DATA_DATABASE}.{DATA_SCHEMA}")
+    
+    with st.expander("クエリ統計"):
+        query_stats = query_layer.stats_rows()
+        if query_stats:
+            st.dataframe(pd.DataFrame(query_stats), hide_index=True)
+        else:
+            st.caption("まだクエリは実行されていません")
+    
+    with st.expander("Agent呼び出し統計"):
+        agent_client = get_agent_client()
+        st.caption(f"サーキットブレーカー: {agent_client.breaker.state}")
+        citation_cache = get_citation_resolver().cache_info()
+        st.caption(
+            f"引用URLキャッシュ: {citation_cache['urls']}件 / "
+            f"クエリ {citation_cache['round_trips']}回 / "
+            f"ヒット {citation_cache['url_hits']}・生成 {citation_cache['url_misses']}"
+        )
+        agent_metrics = agent_client.metrics_rows()
+        if agent_metrics:
+            st.dataframe(pd.DataFrame(agent_metrics), hide_index=True)
+        else:
+            st.caption("まだAgentは呼び出されていません")
 
 # =========================================================
 # タブ構成
@@ -584,15 +910,19 @@ tab1, tab2, tab3, tab4 = st.tabs(["自然言語検索", "原則別評価", "総
 # ========================================
 # タブ1: 自然言語検索
 # ========================================
-with tab1:
+@st.fragment
+def render_chat_tab():
+    """タブ1の描画（操作時はこのタブのみ再実行）"""
     col1, col2 = st.columns([4, 1])
     with col1:
         st.header("自然言語での検索・問い合わせ")
     with col2:
         if st.button("履歴クリア", key="clear_tab1", use_container_width=True):
             st.session_state.chat_history = []
+            reset_history_window(CHAT_HISTORY_WINDOW_KEY)
+            get_thread_manager().reset(get_current_user())
             st.success("クリアしました")
-            st.rerun()
+            st.rerun(scope="fragment")
     
     st.caption("""
     自由な形式で質問してください。Cortex Agentが適切な情報を検索し、分析結果を提供します。
@@ -608,80 +938,98 @@ with tab1:
     chat_container = st.container()
     
     with chat_container:
-        for message in st.session_state.chat_history:
+        # 直近のメッセージのみ描画し、古い履歴は「さらに表示」で展開する
+        history = st.session_state.chat_history
+        start = history_window(history, CHAT_HISTORY_WINDOW_KEY)
+        render_load_more(start, CHAT_HISTORY_WINDOW_KEY)
+        for i, message in enumerate(history[start:], start=start):
             # 古いデータ形式への対応（'role'キーがない場合はスキップ）
             if 'role' not in message or 'content' not in message:
                 continue
             with st.chat_message(message['role']):
                 st.markdown(message['content'])
                 
-                if 'citations' in message and message['citations']:
-                    with st.expander(f"参照資料 ({len(message['citations'])}件)"):
-                        for idx, citation in enumerate(message['citations'], 1):
-                            title = (citation.get('doc_title') or 
-                                   citation.get('title') or 
-                                   citation.get('file_name') or 'N/A')
-                            text = (citation.get('text') or 
-                                  citation.get('content') or 'N/A')
-                            
-                            st.markdown(f"**[{idx}] {title}**")
-                            st.caption(f"> {text[:300]}..." if len(str(text)) > 300 else text)
-                            st.markdown("---")
+                if message.get('citations'):
+                    render_citation_section(message['citations'], f"chat_{turn_id(message, i)}", max_chars=300)
     
     user_query = st.chat_input("質問を入力してください...")
     
     if user_query:
         st.session_state.chat_history.append({
+            'id': new_turn_id(),
             'role': 'user',
             'content': user_query
         })
+        assistant_turn_id = new_turn_id()
         
         with st.chat_message("user"):
             st.markdown(user_query)
         
         with st.chat_message("assistant"):
-            with st.spinner("Cortex Agentが分析中..."):
-                response = send_message_to_agent(user_query)
+            status_placeholder = st.empty()
+            text_placeholder = st.empty()
+            status_placeholder.caption("Cortex Agentが分析中...")
+            
+            # 原則への言及があれば、事前検索済みの根拠を添えて送信する
+            agent_message = user_query
+            principle_keys = mentioned_principles(user_query, GPIF_PRINCIPLES)
+            if principle_keys:
+                evidence_context = build_evidence_context(principle_keys, st.session_state.selected_file)
+                if evidence_context:
+                    agent_message = f"{user_query}\n\n【事前検索済みの根拠（対象レポートからの抜粋）】\n{evidence_context}"
+            
+            # Agentの検索ツールはサーバー側で実行されるため、英訳クエリを検索の手がかりとして添える
+            cross_lingual = get_cross_lingual_search()
+            if cross_lingual.expands(user_query, SEARCH_SERVICES[0]):
+                translated_query = cross_lingual.translator.translate(user_query)
+                if translated_query:
+                    agent_message += (
+                        f"\n\n【検索用の英語クエリ】{translated_query}\n"
+                        "対象レポートが英語の場合は、このクエリでも検索してください。"
+                    )
+            
+            agent_error = None
+            try:
+                response = send_message_to_agent(agent_message, use_thread=True)
+            except AgentAPIError as e:
+                response = None
+                agent_error = e
+            status_placeholder.empty()
             
             if response:
                 response_content = response.get('content', '応答を取得できませんでした')
-                citations = response.get('citations', [])
+                citations = resolve_citations(response.get('citations', []))
                 
-                st.markdown(response_content)
+                text_placeholder.markdown(response_content)
                 
                 if citations:
-                    with st.expander(f"参照資料 ({len(citations)}件)"):
-                        for idx, citation in enumerate(citations, 1):
-                            title = (citation.get('doc_title') or 
-                                   citation.get('title') or 
-                                   citation.get('file_name') or 'N/A')
-                            text = (citation.get('text') or 
-                                  citation.get('content') or 'N/A')
-                            
-                            st.markdown(f"**[{idx}] {title}**")
-                            st.caption(f"> {text[:300]}..." if len(str(text)) > 300 else text)
-                            st.markdown("---")
+                    render_citation_section(citations, f"chat_{assistant_turn_id}", max_chars=300)
                 
                 st.session_state.chat_history.append({
+                    'id': assistant_turn_id,
                     'role': 'assistant',
                     'content': response_content,
                     'citations': citations
                 })
             else:
-                error_msg = "申し訳ございません。応答の取得に失敗しました。"
-                st.error(error_msg)
+                error_msg = f"申し訳ございません。{agent_error.user_message()}"
+                text_placeholder.error(error_msg)
                 st.session_state.chat_history.append({
+                    'id': assistant_turn_id,
                     'role': 'assistant',
                     'content': error_msg,
                     'citations': []
                 })
-        
-        st.rerun()
+
+with tab1:
+    render_chat_tab()
 
 # ========================================
 # タブ2: 原則別評価
 # ========================================
-with tab2:
+@st.fragment
+def render_principle_tab():
+    """タブ2の描画（操作時はこのタブのみ再実行）"""
     st.header("GPIFスチュワードシップ原則 対応度評価")
     
     st.caption(f"評価対象: {st.session_state.selected_file or '未選択'}")
@@ -689,24 +1037,50 @@ with tab2:
     st.markdown("---")
     
     col1, col2 = st.columns([1, 4])
+    with col2:
+        force_reevaluate = st.checkbox(
+            "保存済みの結果を使わずに再評価",
+            value=False,
+            help="オフの場合、レポート・原則・評価方式の仕様が変わっていない原則は保存済みの結果を再利用します"
+        )
     with col1:
         if st.button("全原則を一括評価", type="primary", use_container_width=True):
             results = []
             progress_bar = st.progress(0)
             status_text = st.empty()
+            engine = st.session_state.evaluation_engine
+            stored = None if force_reevaluate else load_stored_evaluations(st.session_state.selected_file, engine)
             
-            for idx, (key, principle) in enumerate(GPIF_PRINCIPLES.items()):
-                status_text.text(f"{key}を評価中...")
-                result = evaluate_principle_with_agent(
-                    key, 
-                    principle, 
-                    st.session_state.selected_file
+            if engine == ENGINE_FAST:
+                status_text.text("全原則の項目を並列に評価中...")
+                results = evaluate_all_fast(
+                    st.session_state.selected_file,
+                    stored=stored,
+                    force=force_reevaluate,
+                    on_done=lambda done, total: progress_bar.progress(done / total)
                 )
-                results.append(result)
-                progress_bar.progress((idx + 1) / len(GPIF_PRINCIPLES))
+            else:
+                for idx, (key, principle) in enumerate(GPIF_PRINCIPLES.items()):
+                    status_text.text(f"{key}を評価中...")
+                    result = evaluate_principle(
+                        key, 
+                        principle, 
+                        st.session_state.selected_file,
+                        stored=stored,
+                        force=force_reevaluate
+                    )
+                    results.append(result)
+                    progress_bar.progress((idx + 1) / len(GPIF_PRINCIPLES))
+                    
+                    # サービス劣化中は残りの原則の呼び出しを中止して負荷を抑える
+                    if result.get('error_kind') == ERROR_CIRCUIT_OPEN:
+                        st.warning("Cortex Agentが不安定なため、残りの原則の評価を中止しました")
+                        break
             
             st.session_state.evaluation_results = results
-            status_text.text("評価完了")
+            st.session_state.evaluation_results_key = (st.session_state.selected_file, engine)
+            reused = sum(1 for r in results if r.get('cached'))
+            status_text.text(f"評価完了（保存済みの結果を再利用: {reused}件）")
             progress_bar.empty()
             st.rerun()
     
@@ -724,10 +1098,13 @@ with tab2:
             st.markdown("---")
             
             if st.button(f"この原則を評価", key=f"eval_{key}"):
-                result = evaluate_principle_with_agent(
+                # 個別評価は明示的な再実行のため保存済みの結果を使わず、選択中の評価方式で評価する
+                result = evaluate_principle(
                     key, 
                     principle, 
-                    st.session_state.selected_file
+                    st.session_state.selected_file,
+                    force=True,
+                    engine=st.session_state.evaluation_engine
                 )
                 
                 if st.session_state.evaluation_results is None:
@@ -743,37 +1120,68 @@ with tab2:
                     if not updated:
                         st.session_state.evaluation_results.append(result)
                 
+                st.session_state.individual_evaluations[(st.session_state.selected_file, key)] = result
+            
+            # ボタンの分岐の外で描画する（参照資料のトグルでフラグメントが再実行されても消えない）
+            result = st.session_state.individual_evaluations.get((st.session_state.selected_file, key))
+            if result is not None:
                 st.markdown("**評価結果**")
+                if result.get('requirements'):
+                    st.dataframe(pd.DataFrame(result['requirements']), hide_index=True)
                 st.markdown(result['response'])
                 
                 if result['citations']:
-                    with st.expander(f"参照資料 ({len(result['citations'])}件)", expanded=False):
-                        for idx, citation in enumerate(result['citations'], 1):
-                            title = citation.get('doc_title') or citation.get('title') or citation.get('file_name') or 'N/A'
-                            text = citation.get('text') or citation.get('content') or ''
-                            
-                            if '/' in str(title):
-                                display_title = title.split('/')[-1]
-                            else:
-                                display_title = title
-                            
-                            st.markdown(f"**[{idx}] {display_title}**")
-                            
-                            if text and len(str(text)) > 200:
-                                st.caption(str(text)[:200] + "...")
-                            elif text:
-                                st.caption(text)
-                            
-                            if idx < len(result['citations']):
-                                st.markdown("---")
+                    render_citation_section(result['citations'], f"eval_{key}")
                 
                 st.success(f"{key}の評価結果を総合レポートに保存しました")
 
+    st.markdown("---")
+    
+    with st.expander("評価方式のベンチマーク（Cortex Agent / 高速評価）", expanded=False):
+        st.caption("同じ原則を両方の方式で評価し、所要時間と判定の件数を比較します（保存済みの結果は使いません）")
+        bench_col1, bench_col2 = st.columns([3, 1])
+        with bench_col1:
+            bench_principle = st.selectbox(
+                "比較する原則",
+                options=list(GPIF_PRINCIPLES.keys()),
+                format_func=lambda key: f"{key}: {GPIF_PRINCIPLES[key]['title']}",
+                key="benchmark_principle"
+            )
+        with bench_col2:
+            run_benchmark = st.button("比較を実行", use_container_width=True)
+        
+        if run_benchmark:
+            st.session_state.evaluation_benchmarks.extend(
+                run_evaluation_benchmark(bench_principle, st.session_state.selected_file)
+            )
+        
+        if st.session_state.evaluation_benchmarks:
+            bench_df = pd.DataFrame(st.session_state.evaluation_benchmarks)
+            st.dataframe(bench_df, hide_index=True)
+            mean_sec = bench_df.groupby("方式")["所要時間(秒)"].mean()
+            agent_label = ENGINE_LABELS[ENGINE_AGENT]
+            fast_label = ENGINE_LABELS[ENGINE_FAST]
+            if agent_label in mean_sec and fast_label in mean_sec and mean_sec[fast_label] > 0:
+                st.caption(
+                    f"平均所要時間: Agent {mean_sec[agent_label]:.1f}秒 / 高速評価 {mean_sec[fast_label]:.1f}秒"
+                    f"（{mean_sec[agent_label] / mean_sec[fast_label]:.1f}倍）"
+                )
+
+with tab2:
+    render_principle_tab()
+
 # ========================================
 # タブ3: 総合レポート
 # ========================================
-with tab3:
-    st.header("総合評価レポート")
+@st.fragment
+def render_report_tab():
+    """タブ3の描画（操作時はこのタブのみ再実行）"""
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.header("総合評価レポート")
+    with col2:
+        # 原則ごとの個別評価はタブ2だけを再実行するため、このタブは必要に応じて更新する
+        st.button("表示を更新", key="refresh_tab3", use_container_width=True)
     
     if st.session_state.evaluation_results is None:
         st.info("まず「原則別評価」タブで評価を実行してください")
@@ -785,15 +1193,38 @@ with tab3:
         
         st.markdown("**評価サマリー**")
         
-        col1, col2, col3 = st.columns(3)
+        engine = st.session_state.evaluation_engine
+        scorecard_df = current_scorecard(
+            st.session_state.selected_file,
+            engine,
+            st.session_state.evaluation_results
+        )
+        metrics = summary_metrics(scorecard_df)
+        total_citations = sum([len(r.get('citations', [])) for r in st.session_state.evaluation_results])
+        
+        col1, col2, col3, col4, col5 = st.columns(5)
         with col1:
-            st.metric("評価原則数", f"{len(GPIF_PRINCIPLES)}原則")
+            st.metric("対応度スコア", f"{metrics['score']:.1f}点")
         with col2:
-            total_citations = sum([len(r.get('citations', [])) for r in st.session_state.evaluation_results])
-            st.metric("参照資料数", f"{total_citations}件")
+            st.metric("✅ 対応している", f"{metrics['counts']['対応している']}項目")
         with col3:
-            avg_citations = total_citations / len(GPIF_PRINCIPLES) if len(GPIF_PRINCIPLES) > 0 else 0
-            st.metric("原則あたり平均参照数", f"{avg_citations:.1f}件")
+            st.metric("⚠️ 部分的に対応", f"{metrics['counts']['部分的に対応']}項目")
+        with col4:
+            st.metric("❌ 情報なし", f"{metrics['counts']['情報なし']}項目")
+        with col5:
+            st.metric("参照資料数", f"{total_citations}件")
+        st.caption("対応度スコア: ✅=1点、⚠️=0.5点、❌=0点として全項目の平均を100点満点で表示")
+        
+        st.markdown("**原則別スコア**")
+        st.dataframe(principle_scores(scorecard_df), hide_index=True)
+        
+        st.markdown("**運用機関の比較**")
+        comparison_df = manager_comparison(get_scorecard_frame(engine))
+        if comparison_df.empty:
+            st.caption("比較できる評価結果がまだ保存されていません")
+        else:
+            st.dataframe(comparison_df)
+            st.caption(f"評価方式「{ENGINE_LABELS[engine]}」で保存済みのレポートごとの最新スコア")
         
         st.markdown("---")
         
@@ -801,31 +1232,16 @@ with tab3:
         
         for result in st.session_state.evaluation_results:
             st.markdown(f"### {result['principle']}: {result['title']}")
+            if result.get('evaluated_at'):
+                source_label = "保存済み" if result.get('cached') else "今回評価"
+                st.caption(f"評価日時: {result['evaluated_at']}（{source_label}）")
             
             st.markdown("**評価**")
             st.markdown(result['response'])
             
             citations = result.get('citations', [])
             if citations:
-                with st.expander(f"参照資料 ({len(citations)}件)", expanded=False):
-                    for idx, citation in enumerate(citations, 1):
-                        title = citation.get('doc_title') or citation.get('title') or citation.get('file_name') or 'N/A'
-                        text = citation.get('text') or citation.get('content') or ''
-                        
-                        if '/' in str(title):
-                            display_title = title.split('/')[-1]
-                        else:
-                            display_title = title
-                        
-                        st.markdown(f"**[{idx}] {display_title}**")
-                        
-                        if text and len(str(text)) > 200:
-                            st.caption(str(text)[:200] + "...")
-                        elif text:
-                            st.caption(text)
-                        
-                        if idx < len(citations):
-                            st.markdown("---")
+                render_citation_section(citations, f"report_{result['principle']}")
             
             st.markdown("---")
         
@@ -855,18 +1271,52 @@ GPIFスチュワードシップ活動原則 対応度評価レポート (Cortex
 
 """
         
+        export_suffix = datetime.now().strftime('%Y%m%d_%H%M%S')
         st.download_button(
             label="評価レポートをダウンロード",
             data=report_text,
-            file_name=f"gpif_agent_evaluation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+            file_name=f"gpif_agent_evaluation_{export_suffix}.txt",
             mime="text/plain",
             type="primary"
         )
+        
+        export_df = get_scorecard_frame(engine)
+        if export_df.empty:
+            export_df = scorecard_df
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="スコアカード（CSV）",
+                data=to_csv_bytes(export_df),
+                file_name=f"gpif_scorecard_{export_suffix}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+        with col2:
+            try:
+                parquet_data = to_parquet_bytes(export_df)
+            except ImportError:
+                parquet_data = None
+            if parquet_data is not None:
+                st.download_button(
+                    label="スコアカード（Parquet）",
+                    data=parquet_data,
+                    file_name=f"gpif_scorecard_{export_suffix}.parquet",
+                    mime="application/octet-stream",
+                    use_container_width=True
+                )
+            else:
+                st.caption("Parquet出力にはpyarrowが必要です")
+
+with tab3:
+    render_report_tab()
 
 # ========================================
 # タブ4: レポート追加
 # ========================================
-with tab4:
+@st.fragment
+def render_upload_tab():
+    """タブ4の描画（操作時はこのタブのみ再実行）"""
     st.header("新規レポート追加")
     st.caption("新しい運用機関のサステナビリティレポート（PDF）をアップロードして、分析対象に追加します")
     st.markdown("---")
@@ -875,8 +1325,11 @@ with tab4:
     **処理の流れ**
     1. PDFファイルをアップロード
     2. ステージに保存
-    3. AI_PARSE_DOCUMENTでテキスト抽出
+    3. ページごとにテキスト層を確認し、テキスト層のあるページはそのまま抽出、
+       スキャン・表組みの多いページだけAI_PARSE_DOCUMENTで並列に解析
+       （解析済みのページは内容のハッシュで解析キャッシュから再利用。失敗時は失敗した範囲のみ再解析）
     4. チャンク化してデータベースに格納
+    5. GPIF原則の要求事項ごとに根拠を事前検索
     """)
     
     st.markdown("---")
@@ -892,101 +1345,35 @@ with tab4:
         
         if st.button("レポートを追加", type="primary"):
             try:
-                with st.spinner("ステップ1/4: ファイルをステージにアップロード中..."):
+                with st.spinner("ステップ1/5: ファイルをステージにアップロード中..."):
                     stage_path = f"am_esg_report/{uploaded_file.name}"
-                    
-                    temp_path = f"/tmp/{uploaded_file.name}"
-                    with open(temp_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    stage_location = f"@{DATA_DATABASE}.{DATA_SCHEMA}.{DOCUMENT_STAGE}/am_esg_report/"
-                    session.file.put(
-                        temp_path,
-                        stage_location,
-                        auto_compress=False,
-                        overwrite=True
-                    )
+                    file_data = uploaded_file.getvalue()
+                    get_report_parser().put_fn(stage_path, file_data)
                     st.success("ファイルアップロード完了")
                 
-                with st.spinner("ステップ2/4: テキスト抽出中..."):
-                    escaped_stage_path = stage_path.replace("'", "''")
-                    
-                    # テーブルのカラムを確認
-                    check_table_sql = f"""
-                    SELECT column_name 
-                    FROM {DATA_DATABASE}.INFORMATION_SCHEMA.COLUMNS 
-                    WHERE table_schema = '{DATA_SCHEMA}' 
-                    AND table_name = '{AM_REPORT_TABLE}'
-                    ORDER BY ordinal_position
-                    """
-                    columns_result = session.sql(check_table_sql).collect()
-                    table_columns = [row['COLUMN_NAME'] for row in columns_result]
-                    
-                    if len(table_columns) == 4:
-                        direct_insert_sql = f"""
-                        INSERT INTO {DATA_DATABASE}.{DATA_SCHEMA}.{AM_REPORT_TABLE} 
-                        (relative_path, scoped_file_url, raw_text_dict, raw_text)
-                        SELECT
-                            '{escaped_stage_path}' AS relative_path,
-                            GET_PRESIGNED_URL('@{DATA_DATABASE}.{DATA_SCHEMA}.{DOCUMENT_STAGE}', '{escaped_stage_path}') AS scoped_file_url,
-                            AI_PARSE_DOCUMENT(
-                                TO_FILE('@{DATA_DATABASE}.{DATA_SCHEMA}.{DOCUMENT_STAGE}', '{escaped_stage_path}'),
-                                {{'mode': 'LAYOUT', 'page_split': true}}
-                            ) AS raw_text_dict,
-                            NULL AS raw_text
-                        """
-                    else:
-                        direct_insert_sql = f"""
-                        INSERT INTO {DATA_DATABASE}.{DATA_SCHEMA}.{AM_REPORT_TABLE} 
-                        (relative_path, scoped_file_url, raw_text_dict)
-                        SELECT
-                            '{escaped_stage_path}' AS relative_path,
-                            GET_PRESIGNED_URL('@{DATA_DATABASE}.{DATA_SCHEMA}.{DOCUMENT_STAGE}', '{escaped_stage_path}') AS scoped_file_url,
-                            AI_PARSE_DOCUMENT(
-                                TO_FILE('@{DATA_DATABASE}.{DATA_SCHEMA}.{DOCUMENT_STAGE}', '{escaped_stage_path}'),
-                                {{'mode': 'LAYOUT', 'page_split': true}}
-                            ) AS raw_text_dict
-                        """
-                    
-                    session.sql(direct_insert_sql).collect()
-                    st.success("テキスト抽出完了")
+                with st.spinner("ステップ2/5: テキスト抽出中（ページ範囲ごとに並列解析）..."):
+                    parse_progress = st.progress(0)
+                    parse_report = get_report_parser().parse(
+                        stage_path,
+                        file_data,
+                        on_progress=lambda done, total: parse_progress.progress(done / total)
+                    )
+                    parse_progress.empty()
+                    get_report_parser().stitch(parse_report)
+                    st.success(
+                        f"テキスト抽出完了（{parse_report.shards}分割 / 解析 {parse_report.parsed}件・"
+                        f"キャッシュから再利用 {parse_report.reused}ページ、{parse_report.elapsed_ms / 1000:.1f}秒）"
+                    )
+                    if parse_report.page_count:
+                        st.caption(" / ".join(
+                            f"{row['経路']}: {row['ページ数']}ページ" for row in parse_report.route_rows()
+                        ))
                 
-                with st.spinner("ステップ3/4: チャンク化中..."):
-                    chunk_sql = f"""
-                    INSERT INTO {DATA_DATABASE}.{DATA_SCHEMA}.{AM_CHUNK_TABLE} 
-                    (relative_path, scoped_file_url, file_name, page_index, chunk_index_on_page, chunk_text, chunk_id)
-                    SELECT
-                        t.relative_path,
-                        t.scoped_file_url,
-                        SPLIT_PART(t.relative_path, '/', -1) AS file_name,
-                        p.value:index::INT AS page_index, 
-                        c.index::INT AS chunk_index_on_page,
-                        c.value::STRING AS chunk_text,
-                        MD5_HEX(t.relative_path || ':' || p.value:index::INT || ':' || c.index::INT)::STRING AS chunk_id
-                    FROM 
-                        {DATA_DATABASE}.{DATA_SCHEMA}.{AM_REPORT_TABLE} t,
-                        LATERAL FLATTEN(input => t.raw_text_dict:pages) p,
-                        LATERAL FLATTEN(
-                            INPUT => SNOWFLAKE.CORTEX.SPLIT_TEXT_RECURSIVE_CHARACTER(
-                                p.value:content::STRING,
-                                'markdown',
-                                1000,
-                                100
-                            )
-                        ) c
-                    WHERE t.relative_path = '{escaped_stage_path}'
-                    """
-                    
+                with st.spinner("ステップ3/5: チャンク化中..."):
                     try:
-                        session.sql(chunk_sql).collect()
+                        query_layer.collect("insert_report_chunks", [stage_path])
                         
-                        chunk_count_sql = f"""
-                        SELECT COUNT(*) as count 
-                        FROM {DATA_DATABASE}.{DATA_SCHEMA}.{AM_CHUNK_TABLE}
-                        WHERE relative_path = '{escaped_stage_path}'
-                        """
-                        chunk_count_result = session.sql(chunk_count_sql).collect()
-                        chunk_count = chunk_count_result[0]['COUNT']
+                        chunk_count = query_layer.scalar("count_report_chunks", [stage_path], default=0)
                         st.success(f"チャンク化完了（{chunk_count}チャンク生成）")
                         
                         if chunk_count == 0:
@@ -995,17 +1382,31 @@ with tab4:
                         st.error(f"チャンク化エラー: {str(e)}")
                         chunk_count = 0
                 
-                with st.spinner("ステップ4/4: データを反映中..."):
-                    escaped_filename = uploaded_file.name.replace("'", "''")
-                    
-                    view_check_sql = f"""
-                    SELECT COUNT(*) as count 
-                    FROM {DATA_DATABASE}.{DATA_SCHEMA}.{DATA_VIEW}
-                    WHERE file_name = '{escaped_filename}'
-                    """
-                    view_result = session.sql(view_check_sql).collect()
-                    view_count = view_result[0]['COUNT']
-                    st.success(f"データ反映完了（ビュー内に{view_count}チャンク確認）")
+                with st.spinner("ステップ4/5: データを反映中..."):
+                    # 定型文などの重複チャンクを判定し、統合チャンクテーブル（ページ・検索サービスの参照先）に反映
+                    dedup_result = get_chunk_deduplicator().dedup_file(COLLECTION_STEWARDSHIP, stage_path)
+                    publish_chunks(query_layer, COLLECTION_STEWARDSHIP, "AM", stage_path, dedup_result.to_json())
+                    view_count = query_layer.scalar("count_view_chunks", [uploaded_file.name], default=0)
+                    # ドキュメントカタログに登録（全ページのファイル一覧に反映される）
+                    get_document_catalog().record_ingestion(
+                        COLLECTION_STEWARDSHIP,
+                        stage_path,
+                        source="AM",
+                        size_bytes=uploaded_file.size,
+                        content_hash=content_hash(file_data),
+                    )
+                    st.success(
+                        f"データ反映完了（統合チャンクテーブルに{view_count}チャンク確認、"
+                        f"うち重複 {dedup_result.duplicates}件は検索対象から除外）"
+                    )
+                
+                with st.spinner("ステップ5/5: 要求事項ごとの根拠を事前検索中..."):
+                    try:
+                        evidence_count = prefetch_requirement_evidence(uploaded_file.name, refresh_service=True)
+                        st.success(f"事前検索完了（{evidence_count}件の根拠チャンクを保存）")
+                    except Exception as e:
+                        # 評価時にも未取得なら再検索されるため、取り込み自体は完了とする
+                        st.warning(f"事前検索に失敗しました（評価時に再実行されます）: {str(e)}")
                 
                 st.markdown("---")
                 st.success(f"""
@@ -1032,6 +1433,9 @@ with tab4:
                 - 同じファイル名のレポートが既に存在しないか確認してください
                 """)
 
+with tab4:
+    render_upload_tab()
+
 # フッター
 st.markdown("---")
 st.caption("GPIF スチュワードシップ活動原則 対応度評価システム")
@@ -14,24 +14,40 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime
 import time
 import streamlit as st
-from snowflake.snowpark.context import get_active_session
-from snowflake.core import Root
-
-# Cortex Complete をSQL経由で呼び出す関数
-def cortex_complete(session, model: str, prompt: str) -> str:
-    """Cortex CompleteをSQL経由で実行（SiS互換）"""
-    # プロンプト内のシングルクォートをエスケープ
-    escaped_prompt = prompt.replace("'", "''")
-    
-    sql = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE(
-            '{model}',
-            '{escaped_prompt}'
-        ) AS response
+from common.query_layer import Statement, get_query_layer
+from common.resources import get_root, get_session
+from common.search import SEARCH_SERVICES, files_filter, query_cortex_search
+from common.query_expansion import get_cross_lingual_search
+from common.model_router import FAST_MODEL, ROUTE_LABELS, ModelRouter
+from common.completion_executor import (
+    CompletionExecutor,
+    CompletionResult,
+    FlowPolicy,
+    get_latency_tracker,
+    snowpark_starter,
+)
+from common.catalog import get_document_catalog
+from common.chat_render import (
+    history_window,
+    lazy_section,
+    memoized,
+    new_turn_id,
+    preview_rows,
+    render_load_more,
+    reset_history_window,
+    turn_id,
+)
+
+HISTORY_WINDOW_KEY = "rag_history_visible"
+
+# Cortex Complete を期限・ヘッジ・フォールバック付きで呼び出す関数
+def cortex_complete(model: str, prompt: str) -> CompletionResult:
+    """回答生成フロー（rag）の設定で COMPLETE を実行し、応答と実際に回答したモデルを返す
+
+    期限を過ぎた場合は CompletionTimeoutError を送出する。遅い呼び出しにはヘッジを送り、
+    失敗・空の応答はフォールバック先のモデルで呼び直す。
     """
-    
-    result = session.sql(sql).collect()
-    return result[0]['RESPONSE'] if result else ""
+    return get_completion_executor().complete("rag", model, prompt)
 
 # =====================================================
 # 設定
@@ -39,6 +55,11 @@ def cortex_complete(session, model: str, prompt: str) -> str:
 DEFAULT_DATABASE = "DEMO_DB"
 DEFAULT_SCHEMA = "DEMO_SUSTAINABILITY"
 
+# 回答生成の期限・フォールバック（ヘッジは直近の p90 を過ぎた呼び出しにだけ送る）
+COMPLETION_POLICIES = {
+    "rag": FlowPolicy(fallbacks=["claude-3-7-sonnet", "llama4-maverick"], timeout_sec=60, initial_hedge_sec=15),
+}
+
 # 利用可能なモデル
 MODELS = [
     "claude-4-sonnet",
@@ -48,97 +69,44 @@ MODELS = [
     "llama4-scout",
 ]
 
-# Cortex Search Services（固定リスト - 動的取得も可能）
-SEARCH_SERVICES = [
-    {
-        "name": "スチュワードシップ評価用",
-        "fq_name": "DEMO_DB.DEMO_SUSTAINABILITY.SUSTAINABILITY_REPORT",
-        "db": "DEMO_DB",
-        "schema": "DEMO_SUSTAINABILITY",
-        "short_name": "SUSTAINABILITY_REPORT",
-        "search_column": "chunk_text",
-        "columns": ["chunk_text", "file_name", "relative_path", "scoped_file_url", "page_index"],
-    },
-    {
-        "name": "グローバル年金分析用",
-        "fq_name": "DEMO_DB.DEMO_SUSTAINABILITY.GLOBAL_PF_SUSTAINABILITY_REPORT",
-        "db": "DEMO_DB",
-        "schema": "DEMO_SUSTAINABILITY",
-        "short_name": "GLOBAL_PF_SUSTAINABILITY_REPORT",
-        "search_column": "chunk_text",
-        "columns": ["chunk_text", "file_name", "relative_path", "scoped_file_url", "page_index", "source_report"],
-    },
+# SQLステートメント（値はすべてバインドパラメータ）
+RAG_STATEMENTS = [
+    Statement(
+        "cortex_complete",
+        """
+        SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS response
+        """,
+    ),
 ]
 
-# Snowflake接続
-session = get_active_session()
-root = Root(session)
+# Snowflake接続（セッション・Rootは最初に使う時点で取得する）
+query_layer = get_query_layer(get_session, RAG_STATEMENTS, {}, key="rag_query_layer")
+
+
+def get_completion_executor() -> CompletionExecutor:
+    """セッションごとのCOMPLETE実行（レイテンシの記録は全セッション共有）"""
+    if "rag_completion_executor" not in st.session_state:
+        st.session_state.rag_completion_executor = CompletionExecutor(
+            snowpark_starter(query_layer, "cortex_complete"),
+            policies=COMPLETION_POLICIES,
+            tracker=get_latency_tracker(),
+        )
+    return st.session_state.rag_completion_executor
+
+
+def get_model_router() -> ModelRouter:
+    """セッションごとのモデルルーター（ルートごとの計測値を保持）"""
+    if "model_router" not in st.session_state:
+        st.session_state.model_router = ModelRouter(
+            cortex_complete
+        )
+    return st.session_state.model_router
 
 
 # =====================================================
 # ユーティリティ関数
 # =====================================================
 
-def get_cortex_search_service(service_config: Dict[str, Any]):
-    """Cortex Search Serviceオブジェクトを取得"""
-    return root.databases[service_config["db"]].schemas[service_config["schema"]].cortex_search_services[service_config["short_name"]]
-
-
-def query_cortex_search(
-    query: str,
-    service_config: Dict[str, Any],
-    num_results: int = 5,
-    filter_obj: Optional[Dict[str, Any]] = None
-) -> tuple[str, List[Dict[str, Any]]]:
-    """Cortex Searchを実行してコンテキストを取得"""
-    
-    svc = get_cortex_search_service(service_config)
-    search_col = service_config.get("search_column", "chunk_text")
-    request_columns = service_config.get("columns", ["chunk_text", "file_name", "relative_path"])
-    
-    # 検索実行
-    kwargs = {
-        "query": query,
-        "columns": request_columns,
-        "limit": num_results,
-    }
-    if filter_obj:
-        kwargs["filter"] = filter_obj
-    
-    doc = svc.search(**kwargs)
-    results = doc.results
-    
-    # コンテキスト構築
-    context_rows = []
-    context_lines = []
-    
-    for i, r in enumerate(results, start=1):
-        content = r.get(search_col) or r.get(search_col.lower()) or r.get(search_col.upper()) or ""
-        file_name = r.get("file_name") or r.get("FILE_NAME") or ""
-        relative_path = r.get("relative_path") or r.get("RELATIVE_PATH") or ""
-        file_url = r.get("scoped_file_url") or r.get("SCOPED_FILE_URL") or r.get("file_url") or ""
-        page_index = r.get("page_index") or r.get("PAGE_INDEX") or ""
-        
-        context_rows.append({
-            "idx": i,
-            "file_name": file_name,
-            "relative_path": relative_path,
-            "file_url": file_url,
-            "page_index": page_index,
-            "chunk": content,
-        })
-        
-        # LLMに渡すコンテキストテキスト
-        source_info = f"[ファイル: {file_name}"
-        if page_index:
-            source_info += f", ページ: {page_index}"
-        source_info += "]"
-        context_lines.append(f"--- ドキュメント {i} {source_info} ---\n{content}\n")
-    
-    context_text = "\n".join(context_lines)
-    return context_text, context_rows
-
-
 def build_history_text(chat_history: List[Dict[str, Any]], k: int) -> str:
     """過去の会話履歴をテキストに変換"""
     if k <= 0 or not chat_history:
@@ -208,8 +176,17 @@ def init_sidebar():
     if "selected_model" not in st.session_state:
         st.session_state.selected_model = MODELS[0]
     
+    if "model_routing" not in st.session_state:
+        st.session_state.model_routing = True
+    
+    st.session_state.model_routing = st.sidebar.toggle(
+        "モデルの自動選択",
+        value=st.session_state.model_routing,
+        help=f"簡単な事実確認は {FAST_MODEL} で回答し、要約・比較や検索結果の確信度が低い質問は下のモデルで回答します"
+    )
+    
     st.session_state.selected_model = st.sidebar.selectbox(
-        "回答生成モデル",
+        "回答生成モデル（自動選択時は難しい質問に使用）" if st.session_state.model_routing else "回答生成モデル",
         MODELS,
         index=MODELS.index(st.session_state.selected_model),
     )
@@ -230,6 +207,15 @@ def init_sidebar():
         help="検索で取得するドキュメントチャンクの数"
     )
     
+    if "cross_lingual" not in st.session_state:
+        st.session_state.cross_lingual = True
+    
+    st.session_state.cross_lingual = st.sidebar.toggle(
+        "英訳クエリでも検索",
+        value=st.session_state.cross_lingual,
+        help="日本語の質問を英語の検索クエリにも書き換え、両方の検索結果を統合します（英語のレポート向け）"
+    )
+    
     if "history_k" not in st.session_state:
         st.session_state.history_k = 3
     
@@ -255,13 +241,18 @@ def init_sidebar():
     )
     
     if st.session_state.filter_enabled:
-        if "filter_file_name" not in st.session_state:
-            st.session_state.filter_file_name = ""
+        # 候補はドキュメントカタログ（全ページ共有のキャッシュ）から取得する
+        try:
+            file_options = get_document_catalog().file_names(st.session_state.selected_service["catalog"])
+        except Exception as e:
+            st.sidebar.error(f"ファイル一覧の取得に失敗しました: {str(e)}")
+            file_options = []
         
-        st.session_state.filter_file_name = st.sidebar.text_input(
-            "ファイル名（部分一致）",
-            value=st.session_state.filter_file_name,
-            placeholder="例: AMOne",
+        st.session_state.filter_file_names = st.sidebar.multiselect(
+            "対象ファイル",
+            options=file_options,
+            default=[f for f in st.session_state.get("filter_file_names", []) if f in file_options],
+            placeholder="ファイルを選択（未選択の場合は全件）",
         )
     
     st.sidebar.divider()
@@ -276,6 +267,7 @@ def init_sidebar():
     with col1:
         if st.button("🗑️ 履歴クリア", use_container_width=True):
             st.session_state.chat_history = []
+            reset_history_window(HISTORY_WINDOW_KEY)
             st.rerun()
     
     with col2:
@@ -291,43 +283,54 @@ def init_sidebar():
 # チャット表示
 # =====================================================
 
-def render_context_expander(context_rows: List[Dict[str, Any]]):
-    """参照コンテキストをエクスパンダで表示"""
+def render_context_rows(context_rows: List[Dict[str, Any]]):
+    """参照コンテキストの中身（チャンクのプレビュー）を表示"""
+    for r in context_rows:
+        st.markdown(f"**#{r['idx']} - {r['file_name']}**")
+        if r.get("page_index") not in (None, ""):
+            st.caption(f"📄 ページ: {r['page_index']}")
+        st.text(r["preview"])
+        if r.get("file_url"):
+            st.markdown(f"[📎 ファイルを開く]({r['file_url']})")
+        st.divider()
+
+
+def render_context_expander(context_rows: List[Dict[str, Any]], turn_key: str):
+    """参照コンテキストを表示（開いたときだけチャンクを描画）"""
     if not context_rows:
         return
     
-    with st.expander(f"📚 参照ドキュメント ({len(context_rows)}件)", expanded=False):
-        for r in context_rows:
-            st.markdown(f"**#{r['idx']} - {r['file_name']}**")
-            if r.get("page_index"):
-                st.caption(f"📄 ページ: {r['page_index']}")
-            
-            # チャンク内容（折りたたみ）
-            with st.container():
-                chunk_preview = r["chunk"][:300] + "..." if len(r["chunk"]) > 300 else r["chunk"]
-                st.text(chunk_preview)
-            
-            if r.get("file_url"):
-                st.markdown(f"[📎 ファイルを開く]({r['file_url']})")
-            
-            st.divider()
+    lazy_section(
+        f"📚 参照ドキュメント ({len(context_rows)}件)",
+        key=f"rag_ctx_{turn_key}",
+        render_fn=lambda: render_context_rows(
+            memoized(turn_key, "contexts", lambda: preview_rows(context_rows, "chunk", 300))
+        ),
+    )
 
 
 def render_chat_history():
-    """過去のチャット履歴を表示"""
-    for turn in st.session_state.get("chat_history", []):
+    """過去のチャット履歴を表示（直近のみ。古い履歴は「さらに表示」で展開）"""
+    history = st.session_state.get("chat_history", [])
+    start = history_window(history, HISTORY_WINDOW_KEY)
+    render_load_more(start, HISTORY_WINDOW_KEY)
+    
+    for i, turn in enumerate(history[start:], start=start):
+        turn_key = turn_id(turn, i)
         # ユーザーメッセージ
         with st.chat_message("user"):
             st.markdown(turn.get("question", ""))
         
         # アシスタントメッセージ
         with st.chat_message("assistant"):
+            if turn.get("translated_query"):
+                st.caption(f"🌐 英訳クエリ: {turn['translated_query']}")
+            if turn.get("route_note"):
+                st.caption(turn["route_note"])
             st.markdown(turn.get("answer", ""))
             
             # 参照コンテキスト
-            ctx = turn.get("contexts") or []
-            if ctx:
-                render_context_expander(ctx)
+            render_context_expander(turn.get("contexts") or [], turn_key)
 
 
 # =====================================================
@@ -362,6 +365,23 @@ def main():
         with col3:
             st.metric("参照チャンク数", st.session_state.num_retrieved_chunks)
     
+    if "model_router" in st.session_state:
+        with st.expander("モデルルーティングの計測", expanded=False):
+            router = st.session_state.model_router
+            savings = router.savings()
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("推定クレジット", f"{savings['credits']:.4f}")
+            with col2:
+                st.metric("すべて大きなモデルの場合", f"{savings['baseline_credits']:.4f}")
+            with col3:
+                st.metric("削減率", f"{savings['saved_ratio'] * 100:.0f}%")
+            st.dataframe(router.stats_rows(), hide_index=True)
+    
+    if "rag_completion_executor" in st.session_state:
+        with st.expander("COMPLETEの計測（ヘッジ・フォールバック）", expanded=False):
+            st.dataframe(st.session_state.rag_completion_executor.stats_rows(), hide_index=True)
+    
     st.divider()
     
     # チャット履歴を表示
@@ -371,27 +391,38 @@ def main():
     user_query = st.chat_input("質問を入力してください...")
     
     if user_query:
+        turn_key = new_turn_id()
+        
         # ユーザーメッセージを即座に表示
         with st.chat_message("user"):
             st.markdown(user_query)
         
         # フィルタ構築
+        # Cortex SearchのフィルタはATTRIBUTES列（file_name）に対する完全一致で指定する
         filter_obj = None
-        if st.session_state.get("filter_enabled") and st.session_state.get("filter_file_name"):
-            # 注意: Cortex SearchのフィルタはATTRIBUTES列に対してのみ有効
-            # @contains はARRAY用、テキスト部分一致は検索クエリに含める方が効果的
-            pass
+        if st.session_state.get("filter_enabled"):
+            filter_obj = files_filter(st.session_state.get("filter_file_names", []))
         
         # アシスタント応答
         with st.chat_message("assistant"):
             with st.spinner("検索中..."):
-                # 1) Cortex Searchで検索
-                context_text, context_rows = query_cortex_search(
+                # 1) Cortex Searchで検索（日本語の質問は英訳クエリでも検索して統合）
+                search_fn = query_cortex_search
+                translated_query = None
+                if st.session_state.cross_lingual:
+                    cross_lingual = get_cross_lingual_search()
+                    search_fn = cross_lingual.search
+                context_text, context_rows = search_fn(
+                    get_root(),
                     query=user_query,
                     service_config=service,
                     num_results=st.session_state.num_retrieved_chunks,
                     filter_obj=filter_obj,
                 )
+                if st.session_state.cross_lingual:
+                    translated_query = cross_lingual.translator.cached(user_query)
+            if translated_query:
+                st.caption(f"🌐 英訳クエリ: {translated_query}")
             
             with st.spinner("回答生成中..."):
                 # 2) 履歴テキスト構築
@@ -408,29 +439,55 @@ def main():
                     service_name=service["name"],
                 )
                 
-                # 4) LLM呼び出し（SQL経由）
+                # 4) LLM呼び出し（SQL経由。自動選択時は質問の難しさでモデルを選ぶ）
                 placeholder = st.empty()
+                answer_model = st.session_state.selected_model
+                route_note = None
                 try:
-                    answer = cortex_complete(
-                        session=session,
-                        model=st.session_state.selected_model,
-                        prompt=prompt
-                    )
+                    if st.session_state.model_routing:
+                        routed = get_model_router().answer(
+                            user_query,
+                            prompt,
+                            context_rows,
+                            large_model=st.session_state.selected_model,
+                            translated_query=translated_query,
+                        )
+                        answer = routed.answer
+                        answer_model = routed.model
+                        route_note = (
+                            f"🧭 {ROUTE_LABELS[routed.route]}: {routed.model}"
+                            f"（{'・'.join(routed.decision.reasons)}、{routed.latency_ms / 1000:.1f}秒）"
+                        )
+                    else:
+                        completion = cortex_complete(
+                            model=st.session_state.selected_model,
+                            prompt=prompt
+                        )
+                        answer = completion.text
+                        answer_model = completion.model
+                        if completion.fell_back:
+                            route_note = f"↪️ フォールバック: {completion.model}"
                 except Exception as e:
                     answer = f"❌ エラーが発生しました: {str(e)}"
                 
+                if route_note:
+                    st.caption(route_note)
+                
                 # 疑似ストリーミング表示
                 stream_text(placeholder, answer)
             
             # 参照コンテキスト表示
-            render_context_expander(context_rows)
+            render_context_expander(context_rows, turn_key)
         
         # 履歴に保存
         turn = {
+            "id": turn_key,
             "timestamp": datetime.now().isoformat(timespec="seconds"),
             "question": user_query,
             "answer": answer,
-            "model": st.session_state.selected_model,
+            "model": answer_model,
+            "route_note": route_note,
+            "translated_query": translated_query,
             "contexts": context_rows,
         }
         st.session_state.chat_history.append(turn)
@@ -0,0 +1,83 @@
+# =========================================================
+# チャンク分割方式のベンチマーク（ローカル実行用）
+# =========================================================
+# 同梱のPDF（data/）をローカルでテキスト化し、
+# - fixed: 現行の方式（ページごとに SPLIT_TEXT_RECURSIVE_CHARACTER(本文, 'markdown', 1000, 100)）
+# - structured: 見出し・表を考慮し、ページをまたいで連結する方式（common.chunker.chunk_pages）
+# を比較する。検索の評価は retrieval_benchmark.py のローカル検索（BM25）とゴールデンセットで行う。
+# ローカルに pypdf が必要（Snowflake・Streamlit は不要）。
+#
+#   python benchmarks/chunking_benchmark.py
+#   python benchmarks/chunking_benchmark.py --k 3 --min-tokens 200 --max-tokens 600
+#   python benchmarks/chunking_benchmark.py --json results.json
+#
+# 計測値
+# - chunks / mean_tokens / max_tokens: チャンク数とチャンクあたりのトークン数（概算）
+# - index_kb: チャンク本文と埋め込みベクトル（EMBEDDING_DIM 次元の float32）の合計サイズ
+# - recall / mrr: 正解ページを含むチャンクが上位 k 件に入った割合と逆順位の平均（ゴールデンセット）
+# - context_tokens: 上位 k 件のチャンクから作るコンテキストのトークン数（1回答あたりの平均）
+
+import argparse
+import json
+import statistics
+from pathlib import Path
+from typing import Any, Dict
+
+from retrieval_benchmark import GOLDEN_PATH, LocalRetriever, evaluate, load_golden, load_pages
+
+from common.chunker import DEFAULT_MAX_TOKENS, DEFAULT_MIN_TOKENS
+
+# snowflake-arctic-embed-l-v2.0 の次元数
+EMBEDDING_DIM = 1024
+
+
+def index_stats(retriever: LocalRetriever) -> Dict[str, Any]:
+    tokens = [row["tokens"] for row in retriever.rows]
+    text_bytes = sum(len(row["chunk"].encode("utf-8")) for row in retriever.rows)
+    return {
+        "chunks": len(tokens),
+        "mean_tokens": round(statistics.mean(tokens), 1) if tokens else 0,
+        "max_tokens": max(tokens, default=0),
+        "index_kb": round((text_bytes + len(tokens) * EMBEDDING_DIM * 4) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャンク分割方式の比較")
+    parser.add_argument("--k", type=int, default=5, help="検索結果の件数（Cortex Search の num_results）")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="fixed の最大文字数")
+    parser.add_argument("--overlap", type=int, default=100, help="fixed の重なり文字数")
+    parser.add_argument("--min-tokens", type=int, default=DEFAULT_MIN_TOKENS)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--golden", type=Path, default=GOLDEN_PATH)
+    parser.add_argument("--json", type=Path, help="結果をJSONで保存するパス")
+    args = parser.parse_args()
+
+    documents = load_pages()
+    golden = load_golden(args.golden)
+    questions = golden["questions"]
+
+    results = []
+    for chunking in ("fixed", "structured"):
+        retriever = LocalRetriever(
+            chunking, documents, args.min_tokens, args.max_tokens, args.chunk_size, args.overlap,
+        )
+        result = {"strategy": chunking, **index_stats(retriever)}
+        result.update(evaluate(retriever, questions, args.k))
+        for key in ("p50_ms", "p90_ms", "p99_ms"):
+            result.pop(key)
+        results.append(result)
+
+    print(f"golden set: {golden['version']} ({len(questions)} questions), files: {len(documents)}, k={args.k}")
+    columns = list(results[0].keys())
+    print("  ".join(f"{c:>14}" for c in columns))
+    for result in results:
+        print("  ".join(f"{result[c]!s:>14}" for c in columns))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"golden": golden["version"], "k": args.k, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
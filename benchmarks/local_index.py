@@ -0,0 +1,66 @@
+# =========================================================
+# ローカルの検索インデックス（ベンチマーク用）
+# =========================================================
+# Cortex Search に接続せずにチャンク分割・検索設定を比較するための BM25 インデックス。
+# 英数字は単語、日本語（かな・漢字）は文字の2-gramを索引語にする。
+# ベクトル検索を含む Cortex Search とはスコアが異なるため、絶対値ではなく方式間の比較に使う。
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿豈-﫿]+")
+_WORD = re.compile(r"[a-z0-9]+")
+
+# 検索語として意味の薄い英単語
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "how", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "to", "what", "when", "which", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    terms = [w for w in _WORD.findall(text) if w not in STOPWORDS]
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class LocalIndex:
+    """BM25 による全文検索（documents は検索結果として返す任意の値、texts は本文）"""
+
+    def __init__(self, texts: Sequence[str], documents: Sequence = None, k1: float = 1.2, b: float = 0.75):
+        self.documents = list(documents) if documents is not None else list(texts)
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        for doc_id, text in enumerate(texts):
+            terms = Counter(tokenize(text))
+            self._lengths.append(sum(terms.values()))
+            for term, count in terms.items():
+                self._postings[term].append((doc_id, count))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, object]]:
+        """(スコア, ドキュメント) をスコアの高い順に最大 k 件"""
+        n = len(self._lengths)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, count in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / (self._avg_length or 1))
+                scores[doc_id] += idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(score, self.documents[doc_id]) for doc_id, score in ranked]
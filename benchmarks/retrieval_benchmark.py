@@ -0,0 +1,305 @@
+# =========================================================
+# 検索の品質・レイテンシのベンチマーク
+# =========================================================
+# ゴールデンセット（benchmarks/golden/questions_v*.json）の質問を検索し、
+# 正解のファイル・ページが検索結果に含まれるかを評価する。
+# 検索は差し替え可能で、
+# - local: 同梱PDF（data/）をローカルでチャンク分割した BM25 インデックス（Snowflake不要）
+# - cortex: Cortex Search Service（common.search.query_cortex_search。接続名で Snowflake に接続）
+# のいずれかを使う。結果は設定（検索方式・チャンク分割・サービス・k）とゴールデンセットの版と
+# 一緒に JSON Lines に追記し、同じ版の結果どうしで比較する。
+#
+#   python benchmarks/retrieval_benchmark.py --k 3 5 8 12
+#   python benchmarks/retrieval_benchmark.py --chunking fixed structured --k 5 --results runs.jsonl
+#   python benchmarks/retrieval_benchmark.py --retriever cortex --connection default --k 5 12 --results runs.jsonl
+#   python benchmarks/retrieval_benchmark.py --retriever cortex --connection default \
+#       --service global=DEMO_DB.DEMO_SUSTAINABILITY.GLOBAL_PF_REPORT_E5 --results runs.jsonl
+#   python benchmarks/retrieval_benchmark.py --results runs.jsonl --select --min-recall 0.8
+#
+# 計測値
+# - recall@k / mrr: 正解を含む結果が上位 k 件に入った割合と逆順位の平均（言語別の recall も出す）
+# - p50_ms / p90_ms / p99_ms: 1回の検索のレイテンシ
+# - context_tokens: 検索結果から作るコンテキスト（common.search.format_context）のトークン数の平均
+# --select は結果ファイルのうち、品質の基準（--min-recall / --min-mrr）を満たす設定の中で
+# context_tokens が最も少ないもの（同じなら p90_ms が短いもの）を選ぶ。
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+APP_DIR = ROOT_DIR / "app"
+DATA_DIR = ROOT_DIR / "data"
+GOLDEN_PATH = Path(__file__).resolve().parent / "golden" / "questions_v1.json"
+
+sys.path.insert(0, str(APP_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from common.chunker import DEFAULT_MAX_TOKENS, DEFAULT_MIN_TOKENS, chunk_pages, fixed_chunks  # noqa: E402
+from common.search import SEARCH_SERVICES, file_filter, format_context, query_cortex_search  # noqa: E402
+from common.tokens import estimate_tokens  # noqa: E402
+from local_index import LocalIndex  # noqa: E402
+
+
+# =========================================================
+# ゴールデンセット
+# =========================================================
+def load_golden(path: Path = GOLDEN_PATH) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_hit(row: Dict[str, Any], question: Dict[str, Any]) -> bool:
+    """正解のファイルで、正解ページのいずれかを含む検索結果
+
+    ページ番号を持たないチャンク（見出し単位で分割したスチュワードシップ活動原則など）はファイルだけで判定する。
+    """
+    if row.get("file_name") != question["file_name"]:
+        return False
+    page = row.get("page_index")
+    if page is None or page == "":
+        return True
+    page_end = row.get("page_end", page)
+    return any(int(page) <= expected <= int(page_end) for expected in question["pages"])
+
+
+# =========================================================
+# 検索方式
+# =========================================================
+class LocalRetriever:
+    """同梱PDFのチャンクに対する BM25 検索（結果の形式は query_cortex_search の行と同じ）"""
+
+    def __init__(self, chunking: str = "fixed", documents: Optional[Dict[str, List[str]]] = None,
+                 min_tokens: int = DEFAULT_MIN_TOKENS, max_tokens: int = DEFAULT_MAX_TOKENS,
+                 chunk_size: int = 1000, overlap: int = 100):
+        self.chunking = chunking
+        documents = load_pages() if documents is None else documents
+        rows = []
+        for file_name, pages in documents.items():
+            if chunking == "structured":
+                chunks = chunk_pages(pages, min_tokens, max_tokens)
+            else:
+                chunks = fixed_chunks(pages, chunk_size, overlap)
+            for chunk in chunks:
+                rows.append({
+                    "file_name": file_name,
+                    "page_index": chunk.page_index,
+                    "page_end": chunk.page_end,
+                    "chunk": chunk.text,
+                    "tokens": chunk.tokens,
+                })
+        self.rows = rows
+        self.index = LocalIndex([row["chunk"] for row in rows], rows)
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return {"retriever": "local", "chunking": self.chunking}
+
+    def search(self, question: Dict[str, Any], k: int, scope: str) -> List[Dict[str, Any]]:
+        if scope == "file":
+            # ファイルを絞り込んだ検索（アプリでファイルを選んで検索する場合）
+            candidates = self.index.search(question["question"], len(self.index))
+            results = [row for _, row in candidates if row["file_name"] == question["file_name"]][:k]
+        else:
+            results = [row for _, row in self.index.search(question["question"], k)]
+        return [dict(row, idx=i) for i, row in enumerate(results, start=1)]
+
+
+class CortexRetriever:
+    """Cortex Search Service による検索（質問の collection に対応するサービスを使う）"""
+
+    def __init__(self, connection_name: Optional[str] = None, services: Optional[Dict[str, str]] = None):
+        from snowflake.core import Root
+        from snowflake.snowpark import Session
+
+        builder = Session.builder
+        if connection_name:
+            builder = builder.config("connection_name", connection_name)
+        self.root = Root(builder.create())
+        self.services = {service["catalog"]: dict(service) for service in SEARCH_SERVICES}
+        for collection, fq_name in (services or {}).items():
+            db, schema, short_name = fq_name.split(".")
+            self.services[collection].update(fq_name=fq_name, db=db, schema=schema, short_name=short_name)
+
+    @property
+    def config(self) -> Dict[str, Any]:
+        return {
+            "retriever": "cortex",
+            "services": {collection: service["fq_name"] for collection, service in sorted(self.services.items())},
+        }
+
+    def search(self, question: Dict[str, Any], k: int, scope: str) -> List[Dict[str, Any]]:
+        filter_obj = file_filter(question["file_name"]) if scope == "file" else None
+        _, rows = query_cortex_search(
+            self.root, question["question"], self.services[question["collection"]], k, filter_obj,
+        )
+        return rows
+
+
+def load_pages(data_dir: Path = DATA_DIR) -> Dict[str, List[str]]:
+    """同梱PDFのページ本文（ファイル名 -> ページ順の本文）"""
+    from pypdf import PdfReader
+
+    documents = {}
+    for path in sorted(data_dir.rglob("*.pdf")):
+        reader = PdfReader(str(path))
+        documents[path.name] = [page.extract_text() or "" for page in reader.pages]
+    return documents
+
+
+# =========================================================
+# 評価
+# =========================================================
+def percentile(values: Sequence[float], q: float) -> float:
+    """最近傍順位法のパーセンタイル（q は 0〜100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def evaluate(retriever, questions: Sequence[Dict[str, Any]], k: int, scope: str = "all") -> Dict[str, Any]:
+    """ゴールデンセットの全質問を検索して指標を集計"""
+    hits, reciprocal_ranks, latencies, context_tokens = [], [], [], []
+    by_lang: Dict[str, List[bool]] = {}
+    for question in questions:
+        started = time.perf_counter()
+        rows = retriever.search(question, k, scope)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rank = next((i + 1 for i, row in enumerate(rows) if is_hit(row, question)), None)
+        hits.append(rank is not None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        context_tokens.append(estimate_tokens(format_context(rows)))
+        by_lang.setdefault(question["lang"], []).append(rank is not None)
+
+    metrics = {
+        "recall": round(sum(hits) / len(hits), 3) if hits else 0.0,
+        "mrr": round(statistics.mean(reciprocal_ranks), 3) if reciprocal_ranks else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p90_ms": round(percentile(latencies, 90), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "context_tokens": round(statistics.mean(context_tokens), 1) if context_tokens else 0.0,
+    }
+    for lang, lang_hits in sorted(by_lang.items()):
+        metrics[f"recall_{lang}"] = round(sum(lang_hits) / len(lang_hits), 3)
+    return metrics
+
+
+def run(retriever, golden: Dict[str, Any], ks: Sequence[int], scope: str) -> List[Dict[str, Any]]:
+    """k ごとに評価し、設定と結果を1件ずつ返す"""
+    results = []
+    for k in ks:
+        results.append({
+            "golden": golden["version"],
+            "config": dict(retriever.config, k=k, scope=scope),
+            "metrics": evaluate(retriever, golden["questions"], k, scope),
+            "questions": len(golden["questions"]),
+            "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+    return results
+
+
+# =========================================================
+# 結果の保存・比較
+# =========================================================
+def config_label(config: Dict[str, Any]) -> str:
+    parts = [config["retriever"]]
+    if "chunking" in config:
+        parts.append(config["chunking"])
+    if "services" in config:
+        parts.append(",".join(name.split(".")[-1] for name in config["services"].values()))
+    parts.append(f"k={config['k']}")
+    parts.append(config["scope"])
+    return " ".join(parts)
+
+
+def append_results(path: Path, results: Sequence[Dict[str, Any]]):
+    with open(path, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def read_results(path: Path, golden_version: str) -> List[Dict[str, Any]]:
+    """結果ファイルのうち、同じ版のゴールデンセットで評価したもの"""
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    return [result for result in results if result["golden"] == golden_version]
+
+
+def select_cheapest(results: Sequence[Dict[str, Any]], min_recall: float, min_mrr: float = 0.0) -> Optional[Dict[str, Any]]:
+    """品質の基準を満たす設定のうち、コンテキストが最も短いもの"""
+    passing = [
+        result for result in results
+        if result["metrics"]["recall"] >= min_recall and result["metrics"]["mrr"] >= min_mrr
+    ]
+    if not passing:
+        return None
+    return min(passing, key=lambda r: (r["metrics"]["context_tokens"], r["metrics"]["p90_ms"]))
+
+
+def print_table(results: Sequence[Dict[str, Any]]):
+    if not results:
+        print("結果がありません")
+        return
+    columns = list(results[0]["metrics"].keys())
+    width = max(len(config_label(r["config"])) for r in results)
+    print(f"{'config':<{width}}  " + "  ".join(f"{c:>14}" for c in columns))
+    for result in results:
+        print(f"{config_label(result['config']):<{width}}  "
+              + "  ".join(f"{result['metrics'].get(c, '')!s:>14}" for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="検索の品質・レイテンシの評価")
+    parser.add_argument("--retriever", choices=["local", "cortex"], default="local")
+    parser.add_argument("--chunking", nargs="+", choices=["fixed", "structured"], default=["fixed"],
+                        help="local のチャンク分割方式")
+    parser.add_argument("--connection", help="cortex で使う Snowflake の接続名（connections.toml）")
+    parser.add_argument("--service", action="append", default=[], metavar="COLLECTION=FQ_NAME",
+                        help="cortex でコレクションの検索サービスを差し替える（埋め込みモデル・チャンクの比較用）")
+    parser.add_argument("--k", nargs="+", type=int, default=[5], help="検索結果の件数（複数指定で比較）")
+    parser.add_argument("--scope", choices=["all", "file"], default="all",
+                        help="all: コレクション全体を検索 / file: 正解のファイルに絞り込んで検索")
+    parser.add_argument("--golden", type=Path, default=GOLDEN_PATH)
+    parser.add_argument("--results", type=Path, help="結果を追記する JSON Lines ファイル")
+    parser.add_argument("--select", action="store_true", help="評価せず、結果ファイルから設定を選ぶ")
+    parser.add_argument("--min-recall", type=float, default=0.8)
+    parser.add_argument("--min-mrr", type=float, default=0.0)
+    args = parser.parse_args()
+
+    golden = load_golden(args.golden)
+    if args.select:
+        if not args.results:
+            parser.error("--select には --results が必要です")
+        results = read_results(args.results, golden["version"])
+    else:
+        if args.retriever == "cortex":
+            services = dict(item.split("=", 1) for item in args.service)
+            retrievers = [CortexRetriever(args.connection, services)]
+        else:
+            documents = load_pages()
+            retrievers = [LocalRetriever(chunking, documents) for chunking in args.chunking]
+        results = [result for retriever in retrievers for result in run(retriever, golden, args.k, args.scope)]
+        if args.results:
+            append_results(args.results, results)
+
+    print(f"golden set: {golden['version']} ({len(golden['questions'])} questions)")
+    print_table(results)
+    best = select_cheapest(results, args.min_recall, args.min_mrr)
+    if best:
+        print(f"\nrecall >= {args.min_recall} / mrr >= {args.min_mrr} を満たす最も安い設定: {config_label(best['config'])}"
+              f"（context_tokens={best['metrics']['context_tokens']}, p90_ms={best['metrics']['p90_ms']}）")
+    else:
+        print(f"\nrecall >= {args.min_recall} / mrr >= {args.min_mrr} を満たす設定はありません")
+
+
+if __name__ == "__main__":
+    main()
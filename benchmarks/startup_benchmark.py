@@ -0,0 +1,202 @@
+# =========================================================
+# ページ起動時間のベンチマーク（ローカル実行用）
+# =========================================================
+# Snowflakeに接続せず、遅延を模したスタンドイン（snowflake.snowpark / snowflake.core /
+# _snowflake）を使って、各ページを初回表示（コールドスタート）したときの時間を計測する。
+# Streamlit の AppTest でページを実行するため、ローカルに streamlit と pandas が必要。
+#
+#   python benchmarks/startup_benchmark.py --runs 5
+#   python benchmarks/startup_benchmark.py --query-ms 300 --session-ms 800
+#
+# 計測値
+# - first_paint_ms: 実行開始から最初の要素が送出されるまで
+# - run_ms: スクリプト全体の実行時間（最初のクエリ結果の表示まで）
+# - sessions / roots / queries: 1回の実行で行われたセッション取得・Root作成・クエリの回数
+
+import argparse
+import importlib.abc
+import importlib.machinery
+import statistics
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parents[1] / "app"
+
+# 読み込みに時間がかかるモジュールとして扱うスタンドイン
+HEAVY_MODULES = {"snowflake.snowpark", "snowflake.core"}
+STAND_IN_MODULES = {"snowflake", "snowflake.snowpark", "snowflake.snowpark.context", "snowflake.core", "_snowflake"}
+
+
+# =========================================================
+# スタンドイン
+# =========================================================
+class StandIn:
+    """Snowflake接続の代わりに遅延だけを再現する"""
+
+    def __init__(self, import_ms: float, session_ms: float, query_ms: float):
+        self.import_ms = import_ms
+        self.session_ms = session_ms
+        self.query_ms = query_ms
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def wait(self, kind: str, ms: float):
+        with self._lock:
+            self.counts[kind] += 1
+        time.sleep(ms / 1000)
+
+    def get_active_session(self):
+        self.wait("sessions", self.session_ms)
+        return _Session(self)
+
+    def root(self, session):
+        self.wait("roots", 0)
+        return types.SimpleNamespace(session=session)
+
+    def send_snow_api_request(self, *args, **kwargs):
+        self.wait("api_requests", self.query_ms)
+        return {"status": 200, "content": "[]"}
+
+
+class _Session:
+    def __init__(self, stand_in: StandIn):
+        self.stand_in = stand_in
+        self.file = types.SimpleNamespace(put=lambda *args, **kwargs: None)
+
+    def sql(self, sql, params=None):
+        return _DataFrame(self.stand_in, sql)
+
+
+class _DataFrame:
+    def __init__(self, stand_in: StandIn, sql: str):
+        self.stand_in = stand_in
+        self.sql = sql
+
+    def collect(self):
+        self.stand_in.wait("queries", self.stand_in.query_ms)
+        if "CURRENT_DATABASE()" in self.sql:
+            return [("STANDIN_DB", "STANDIN_SCHEMA")]
+        return []
+
+    def to_pandas(self):
+        import pandas as pd
+        self.stand_in.wait("queries", self.stand_in.query_ms)
+        return pd.DataFrame()
+
+
+class _StandInFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """スタンドインのモジュールを返すインポートフック（重いモジュールは読み込み時間を再現）"""
+
+    def __init__(self, stand_in: StandIn):
+        self.stand_in = stand_in
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname in STAND_IN_MODULES:
+            is_package = fullname in {"snowflake", "snowflake.snowpark"}
+            return importlib.machinery.ModuleSpec(fullname, self, is_package=is_package)
+        return None
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        name = module.__name__
+        if name in HEAVY_MODULES:
+            self.stand_in.wait("imports", self.stand_in.import_ms)
+        if name == "snowflake.snowpark.context":
+            module.get_active_session = self.stand_in.get_active_session
+        elif name == "snowflake.core":
+            module.Root = self.stand_in.root
+        elif name == "_snowflake":
+            module.send_snow_api_request = self.stand_in.send_snow_api_request
+
+
+# =========================================================
+# 計測
+# =========================================================
+def _first_paint_recorder():
+    """最初の要素（delta）が送出された時刻を記録するフック"""
+    try:
+        from streamlit.runtime.scriptrunner_utils import script_run_context as ctx_module
+    except ImportError:
+        from streamlit.runtime.scriptrunner import script_run_context as ctx_module
+
+    record = {"first": None}
+    original = ctx_module.ScriptRunContext.enqueue
+
+    def enqueue(self, msg):
+        if record["first"] is None and msg.WhichOneof("type") == "delta":
+            record["first"] = time.perf_counter()
+        return original(self, msg)
+
+    ctx_module.ScriptRunContext.enqueue = enqueue
+    return record, lambda: setattr(ctx_module.ScriptRunContext, "enqueue", original)
+
+
+def _reset_modules():
+    """コールドスタートを再現するため、スタンドインと共通モジュールを読み込み直す"""
+    for name in list(sys.modules):
+        if name in STAND_IN_MODULES or name == "common" or name.startswith("common."):
+            del sys.modules[name]
+
+
+def run_page(page: Path, stand_in: StandIn, timeout_sec: float):
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    _reset_modules()
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    stand_in.counts.clear()
+
+    record, restore = _first_paint_recorder()
+    try:
+        app = AppTest.from_file(str(page), default_timeout=timeout_sec)
+        start = time.perf_counter()
+        app.run()
+        run_ms = (time.perf_counter() - start) * 1000
+    finally:
+        restore()
+    first_paint_ms = (record["first"] - start) * 1000 if record["first"] else run_ms
+    errors = [e.message for e in app.exception]
+    return first_paint_ms, run_ms, dict(stand_in.counts), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="各ページのコールドスタート時間を計測")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--import-ms", type=float, default=400, help="snowflake.snowpark / snowflake.core の読み込み時間")
+    parser.add_argument("--session-ms", type=float, default=500, help="get_active_session() の所要時間")
+    parser.add_argument("--query-ms", type=float, default=200, help="1クエリあたりの所要時間")
+    parser.add_argument("--timeout-sec", type=float, default=120)
+    parser.add_argument("--page", action="append", help="計測するページ（省略時は全ページ）")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(APP_DIR))
+    stand_in = StandIn(args.import_ms, args.session_ms, args.query_ms)
+    sys.meta_path.insert(0, _StandInFinder(stand_in))
+
+    pages = [APP_DIR / "mainpage.py"] + sorted((APP_DIR / "pages").glob("_*.py"))
+    if args.page:
+        pages = [p for p in pages if any(name in p.name for name in args.page)]
+
+    print(f"{'page':<40} {'first_paint_ms':>15} {'run_ms':>10}  calls")
+    for page in pages:
+        first_paints, runs = [], []
+        counts, errors = {}, []
+        for _ in range(args.runs):
+            first_paint_ms, run_ms, counts, errors = run_page(page, stand_in, args.timeout_sec)
+            first_paints.append(first_paint_ms)
+            runs.append(run_ms)
+        calls = ", ".join(f"{k}={v}" for k, v in sorted(counts.items())) or "-"
+        print(f"{page.name:<40} {statistics.median(first_paints):>15.0f} {statistics.median(runs):>10.0f}  {calls}")
+        for error in errors:
+            print(f"  ! {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+# ページと同じく common パッケージを app/ から読み込む
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+
+def _streamlit_stand_in() -> types.ModuleType:
+    """テストで使う範囲の streamlit（キャッシュのデコレータと session_state）"""
+    module = types.ModuleType("streamlit")
+
+    def cache(func=None, **kwargs):
+        if func is None:
+            return lambda f: f
+        return func
+
+    module.cache_resource = cache
+    module.cache_data = cache
+    module.session_state = {}
+    return module
+
+
+# common の各モジュールは import 時に streamlit を読み込むため、
+# 未インストールの環境ではキャッシュのデコレータだけを持つ代わりのモジュールを使う
+if importlib.util.find_spec("streamlit") is None:
+    sys.modules["streamlit"] = _streamlit_stand_in()
@@ -0,0 +1,80 @@
+# =========================================================
+# Agentクライアントのサーキットブレーカーの確認
+# =========================================================
+
+import pytest
+
+from common.agent_client import (
+    ERROR_CIRCUIT_OPEN,
+    ERROR_SERVER,
+    AgentAPIError,
+    AgentClient,
+    CircuitBreaker,
+    RetryPolicy,
+)
+
+EVENTS = [
+    {"event": "response.text.delta", "data": {"content_index": 0, "text": "回答"}},
+    {"event": "response.text.delta", "data": {"content_index": 0, "text": "です"}},
+]
+
+
+def ok_transport(*args):
+    return {"status": 200, "content": EVENTS}
+
+
+def half_open_client(transport=ok_transport) -> AgentClient:
+    """1回の失敗でオープンし、すぐに HALF_OPEN の試行を受け付けるクライアント"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_sec=0.0)
+    breaker.record_failure(AgentAPIError(ERROR_SERVER))
+    assert breaker.state == CircuitBreaker.OPEN
+    return AgentClient(transport=transport, retry_policy=RetryPolicy(max_attempts=1), breaker=breaker)
+
+
+def test_abandoned_stream_does_not_leave_the_probe_in_flight():
+    client = half_open_client()
+
+    events = client.run({})
+    next(events)
+    events.close()
+
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert [event for event, _ in client.run({})] == ["response.text.delta"] * 2
+
+
+def test_unread_stream_does_not_leave_the_probe_in_flight():
+    client = half_open_client()
+
+    client.run({})
+
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert list(client.run({}))
+
+
+def test_failed_probe_reopens_the_breaker():
+    client = half_open_client(lambda *args: {"status": 503, "content": "unavailable"})
+
+    with pytest.raises(AgentAPIError) as first:
+        client.run({})
+    assert first.value.kind == ERROR_SERVER
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    client.breaker.reset_timeout_sec = 60.0
+
+    with pytest.raises(AgentAPIError) as second:
+        client.run({})
+    assert second.value.kind == ERROR_CIRCUIT_OPEN
+
+
+def test_stream_error_is_recorded_as_failure():
+    events = EVENTS + [{"event": "error", "data": {"code": "503", "message": "overloaded"}}]
+    client = AgentClient(
+        transport=lambda *args: {"status": 200, "content": events},
+        retry_policy=RetryPolicy(max_attempts=1),
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout_sec=60.0),
+    )
+
+    with pytest.raises(AgentAPIError):
+        list(client.run({}))
+
+    assert client.breaker.state == CircuitBreaker.OPEN
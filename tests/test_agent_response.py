@@ -0,0 +1,49 @@
+# =========================================================
+# Agentレスポンスの解析の確認
+# =========================================================
+
+from common.agent_response import AgentResponse, iter_agent_events
+
+SSE_BODY = (
+    "event: response.text.delta\n"
+    'data: {"content_index": 0, "text": "運用資産は"}\n'
+    "\n"
+    "event: response.text.delta\n"
+    'data: {"content_index": 0, "text": "245兆円です。"}\n'
+    "\n"
+    "event: response.text.annotation\n"
+    'data: {"annotation": {"type": "cortex_search_citation", "doc_title": "report.pdf", "index": 1}}\n'
+    "\n"
+    "event: metadata\n"
+    'data: {"role": "assistant", "message_id": 7}\n'
+    "\n"
+)
+
+
+def test_sse_body_is_assembled():
+    response = AgentResponse.from_events(iter_agent_events({"status": 200, "content": SSE_BODY}))
+
+    assert response.text == "運用資産は245兆円です。"
+    assert [c["doc_title"] for c in response.citations] == ["report.pdf"]
+    assert response.metadata["assistant_message_id"] == 7
+
+
+def test_event_list_and_sse_body_agree():
+    events = [
+        {"event": "response.text.delta", "data": '{"content_index": 0, "text": "運用資産は"}'},
+        {"event": "response.text.delta", "data": {"content_index": 0, "text": "245兆円です。"}},
+    ]
+
+    assert AgentResponse.from_events(iter_agent_events(events)).text == "運用資産は245兆円です。"
+
+
+def test_completed_text_replaces_deltas():
+    body = SSE_BODY + 'event: response.text\ndata: {"content_index": 0, "text": "最終回答"}\n\n'
+
+    assert AgentResponse.from_events(iter_agent_events(body)).text == "最終回答"
+
+
+def test_message_response_is_supported():
+    body = '{"message": {"content": [{"type": "text", "text": "回答"}], "citations": []}}'
+
+    assert AgentResponse.from_events(iter_agent_events(body)).text == "回答"
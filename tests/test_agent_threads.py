@@ -0,0 +1,56 @@
+# =========================================================
+# Agentスレッド管理の確認
+# =========================================================
+
+from common.agent_threads import AgentThreadManager
+
+
+class FakeClient:
+    def __init__(self, thread_ids):
+        self.thread_ids = list(thread_ids)
+        self.created = 0
+
+    def request(self, method, endpoint, payload=None):
+        self.created += 1
+        thread_id = self.thread_ids.pop(0)
+        if isinstance(thread_id, Exception):
+            raise thread_id
+        return {"thread_id": thread_id}
+
+
+def test_thread_is_reused_after_a_turn():
+    manager = AgentThreadManager(FakeClient(["t1"]))
+
+    thread = manager.get("user", "report.pdf")
+    manager.record_turn(thread, {"assistant_message_id": 42})
+
+    again = manager.get("user", "report.pdf")
+    assert again is thread
+    assert again.thread_id == "t1"
+    assert again.parent_message_id == 42
+    assert not again.is_new
+
+
+def test_failed_creation_is_retried_on_the_next_send():
+    client = FakeClient([RuntimeError("threads unavailable"), "t2"])
+    manager = AgentThreadManager(client)
+
+    first = manager.get("user", "report.pdf")
+    assert first.thread_id is None
+
+    second = manager.get("user", "report.pdf")
+    assert second.thread_id == "t2"
+    assert client.created == 2
+
+
+def test_turn_without_message_id_drops_the_thread():
+    manager = AgentThreadManager(FakeClient(["t1", "t2"]))
+
+    thread = manager.get("user", "report.pdf")
+    manager.record_turn(thread, {})
+
+    assert thread.thread_id is None
+    assert thread.is_new
+    replacement = manager.get("user", "report.pdf")
+    assert replacement.thread_id == "t2"
+    assert replacement.is_new
@@ -0,0 +1,84 @@
+# =========================================================
+# 構造を考慮したチャンク分割・トークン数の概算の確認
+# =========================================================
+
+from common.chunker import chunk_pages, parse_blocks, recursive_character_split, strip_running_lines
+from common.tokens import estimate_tokens
+
+
+def paragraph(sentence, count):
+    return sentence * count
+
+
+def test_estimate_tokens_counts_japanese_by_character_and_english_by_word():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("気候変動") == 4
+    assert estimate_tokens("climate change policy") == 4
+    assert estimate_tokens("2023年") == 2
+
+
+def test_parse_blocks_separates_headers_tables_and_lists():
+    content = "# 方針\n本文です。\n\n| 指標 | 値 |\n| --- | --- |\n| A | 1 |\n- 項目1\n- 項目2\n（３）エンゲージメント"
+
+    blocks = parse_blocks(content, page_index=4)
+
+    assert [(b.kind, b.level) for b in blocks] == [
+        ("header", 1), ("paragraph", 0), ("table", 0), ("list", 0), ("list", 0), ("header", 2),
+    ]
+    assert blocks[2].text.splitlines()[0] == "| 指標 | 値 |"
+    assert {b.page_index for b in blocks} == {4}
+
+
+def test_running_headers_and_page_numbers_are_stripped():
+    bodies = ["気候変動の方針。", "議決権の行使。", "対話の実績。", "人的資本の開示。"]
+    pages = [f"GPIF 年次報告\n{body}\n\n本文の続き{i}。\n\n本文の結び。\n- {i} -" for i, body in enumerate(bodies, 1)]
+
+    stripped = strip_running_lines(pages)
+
+    assert all("GPIF" not in page and not page.rstrip().endswith("-") for page in stripped)
+    assert [page.split()[0] for page in stripped] == bodies
+
+
+def test_chunks_span_pages_and_keep_the_header_path():
+    pages = [
+        "# 気候変動\n## 方針\n" + paragraph("脱炭素に向けた方針を定めている。", 5),
+        paragraph("投資先との対話を続けている。", 5) + "\n## 実績\n" + paragraph("排出量を削減した。", 30),
+    ]
+
+    chunks = chunk_pages(pages, min_tokens=100, max_tokens=200, strip_running=False)
+
+    assert chunks[0].page_index == 0 and chunks[0].page_end == 1
+    assert chunks[0].header_path[0] == "気候変動"
+    assert chunks[-1].header_path == ("気候変動", "実績")
+    assert all(chunk.tokens <= 200 for chunk in chunks)
+    assert [chunk.chunk_index for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_large_tables_are_split_by_row_with_the_header_repeated():
+    rows = "\n".join(f"| 企業{i} | 排出量 {i * 100} | 目標 2030年 |" for i in range(60))
+    table = "| 企業 | 実績 | 目標 |\n| --- | --- | --- |\n" + rows
+
+    chunks = chunk_pages([table], min_tokens=50, max_tokens=150, strip_running=False)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.text.startswith("| 企業 | 実績 | 目標 |\n| --- | --- | --- |\n| 企業")
+        assert chunk.tokens <= 150
+
+
+def test_small_trailing_chunk_is_merged_into_the_previous_one():
+    pages = ["## 概要\n" + paragraph("方針を定めている。", 15) + "\n## 補足\n短い補足。"]
+
+    chunks = chunk_pages(pages, min_tokens=50, max_tokens=400, strip_running=False)
+
+    assert len(chunks) == 1
+    assert chunks[0].text.endswith("短い補足。")
+
+
+def test_recursive_character_split_respects_the_chunk_size():
+    text = "\n\n".join(paragraph("これは段落です。", 20) for _ in range(5))
+
+    chunks = recursive_character_split(text, chunk_size=200, overlap=20)
+
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "").count("これは段落です。") >= 100
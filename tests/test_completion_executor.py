@@ -0,0 +1,145 @@
+# =========================================================
+# COMPLETE の期限・ヘッジ・フォールバックの確認
+# =========================================================
+
+import pytest
+
+from common.completion_executor import (
+    MIN_LATENCY_SAMPLES,
+    CompletionExecutor,
+    CompletionTimeoutError,
+    FlowPolicy,
+    LatencyTracker,
+    _Pending,
+)
+
+
+class FakeClock:
+    """sleep で進む時計"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ScriptedStarter:
+    """モデルごとに (所要秒数, 応答または例外) を開始順に返す"""
+
+    def __init__(self, clock, script):
+        self.clock = clock
+        self.script = {model: list(calls) for model, calls in script.items()}
+        self.started = []
+        self.cancelled = []
+
+    def __call__(self, model, prompt):
+        duration, outcome = self.script[model].pop(0)
+        finish_at = self.clock.now + duration
+        index = len(self.started)
+        self.started.append(model)
+
+        def result():
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        return _Pending(model, lambda: self.clock.now >= finish_at, result, lambda: self.cancelled.append(index))
+
+
+def executor(script, **policy):
+    clock = FakeClock()
+    starter = ScriptedStarter(clock, script)
+    tracker = LatencyTracker()
+    ex = CompletionExecutor(starter, {"rag": FlowPolicy(**policy)}, tracker, clock=clock, sleep=clock.sleep)
+    return ex, starter, tracker
+
+
+def test_first_response_is_returned_without_hedging():
+    ex, starter, tracker = executor({"big": [(0.5, "answer")]}, initial_hedge_sec=5)
+
+    result = ex.complete("rag", "big", "prompt")
+
+    assert (result.text, result.model, result.attempts, result.hedged) == ("answer", "big", 1, False)
+    assert starter.started == ["big"]
+    assert ex.stats_rows()[0]["calls"] == 1
+
+
+def test_slow_call_is_hedged_and_the_loser_is_cancelled():
+    ex, starter, tracker = executor(
+        {"big": [(10.0, "slow"), (0.5, "fast")]}, initial_hedge_sec=1.0, timeout_sec=30,
+    )
+
+    result = ex.complete("rag", "big", "prompt")
+
+    assert result.text == "fast"
+    assert result.hedged and result.hedge_won
+    assert result.attempts == 2
+    assert starter.cancelled == [0]
+    assert result.latency_ms == pytest.approx(1500, abs=100)
+    # 負けた最初の呼び出しも打ち切った時点までの時間を記録する
+    samples = sorted(tracker._samples[("rag", "big")])
+    assert samples[0] == pytest.approx(0.5, abs=0.1)
+    assert samples[1] == pytest.approx(1.5, abs=0.1)
+
+
+def test_hedge_can_go_to_the_first_fallback():
+    ex, starter, _ = executor(
+        {"big": [(10.0, "slow")], "small": [(0.2, "fallback answer")]},
+        fallbacks=["small"], initial_hedge_sec=1.0, hedge_to_fallback=True,
+    )
+
+    result = ex.complete("rag", "big", "prompt")
+
+    assert starter.started == ["big", "small"]
+    assert (result.model, result.hedge_won) == ("small", True)
+
+
+def test_errors_and_empty_responses_fall_back_in_order():
+    ex, starter, _ = executor(
+        {"big": [(0.1, RuntimeError("throttled"))], "mid": [(0.1, "  ")], "small": [(0.1, "ok")]},
+        fallbacks=["mid", "small"], hedge=False,
+    )
+
+    result = ex.complete("rag", "big", "prompt")
+
+    assert starter.started == ["big", "mid", "small"]
+    assert (result.text, result.model, result.attempts, result.fell_back) == ("ok", "small", 3, True)
+
+
+def test_last_error_is_raised_when_every_model_fails():
+    ex, _, _ = executor(
+        {"big": [(0.1, RuntimeError("first"))], "small": [(0.1, RuntimeError("second"))]},
+        fallbacks=["small"], hedge=False,
+    )
+
+    with pytest.raises(RuntimeError, match="second"):
+        ex.complete("rag", "big", "prompt")
+    assert ex.stats_rows()[0]["errors"] == 1
+
+
+def test_deadline_cancels_pending_calls_and_records_the_censored_latency():
+    ex, starter, tracker = executor({"big": [(100.0, "late")]}, timeout_sec=2.0, hedge=False)
+
+    with pytest.raises(CompletionTimeoutError):
+        ex.complete("rag", "big", "prompt")
+
+    assert starter.cancelled == [0]
+    assert ex.stats_rows()[0]["timeouts"] == 1
+    assert tracker._samples[("rag", "big")][0] == pytest.approx(2.0, abs=0.1)
+
+
+def test_hedge_delay_follows_the_recent_p90():
+    ex, _, tracker = executor({}, initial_hedge_sec=20.0, min_hedge_sec=2.0)
+    assert ex.hedge_after_sec("rag", "big") == 20.0
+
+    for i in range(MIN_LATENCY_SAMPLES):
+        tracker.add("rag", "big", 1.0 + i)
+    assert ex.hedge_after_sec("rag", "big") == 9.0
+
+    for _ in range(100):
+        tracker.add("rag", "big", 0.1)
+    assert ex.hedge_after_sec("rag", "big") == 2.0
@@ -0,0 +1,101 @@
+# =========================================================
+# 重複チャンクの判定の確認
+# =========================================================
+
+from common.dedup import (
+    BOILERPLATE_MAX_CHARS,
+    DEDUP_VERSION,
+    _BandIndex,
+    assign_duplicates,
+    bands,
+    hamming_distance,
+    normalize_text,
+    sign,
+    simhash,
+    to_hex,
+)
+
+KPI_2022 = """温室効果ガス排出量（スコープ1・2）
+| 指標 | 2021年度 | 2022年度 |
+| 加重平均カーボン・インテンシティ | 152.3 | 138.7 |
+| 投資先企業のカバー率（%） | 91.2 | 94.5 |
+| エンゲージメント件数 | 1,204 | 1,378 |
+"""
+
+KPI_2023 = """温室効果ガス排出量（スコープ1・2）
+| 指標 | 2022年度 | 2023年度 |
+| 加重平均カーボン・インテンシティ | 138.7 | 121.9 |
+| 投資先企業のカバー率（%） | 94.5 | 96.1 |
+| エンゲージメント件数 | 1,378 | 1,512 |
+"""
+
+DISCLAIMER = "本資料は情報提供を目的としたものであり、特定の金融商品の売買を推奨するものではありません。"
+
+BODY = (
+    "当法人は、投資先企業との建設的な対話を通じて中長期的な企業価値の向上を促すことを目指している。"
+    "2023年度は気候変動、人的資本、取締役会の多様性を重点テーマとし、"
+    "議決権行使においても各テーマの取組み状況を判断材料とした。"
+) * 3
+
+
+def test_tables_that_differ_only_in_values_are_not_duplicates():
+    assert normalize_text(KPI_2022) != normalize_text(KPI_2023)
+
+    results = assign_duplicates(sign([("a", KPI_2022), ("b", KPI_2023)]))
+
+    assert [r["duplicate_of"] for r in results] == [None, None]
+
+
+def test_page_number_lines_are_ignored():
+    page_3 = BODY + "\n- 3 -\n"
+    page_14 = BODY + "\nPage 14 of 40\n"
+
+    assert normalize_text(page_3) == normalize_text(page_14) == normalize_text(BODY)
+    assert simhash(page_3) == simhash(page_14)
+
+
+def test_bands_split_the_signature():
+    signature = to_hex(simhash(BODY))
+
+    assert len(signature) == 16
+    assert "".join(bands(signature)) == signature
+
+
+def test_band_index_returns_the_nearest_match():
+    base = simhash(BODY)
+    near = base ^ 0b1
+    nearer = base ^ 0b11 << 20
+    index = _BandIndex()
+    index.add("near", to_hex(near))
+    index.add("far", to_hex(base ^ 0xFF))
+
+    assert hamming_distance(base, near) == 1
+    assert index.nearest(to_hex(base), max_distance=3) == "near"
+    assert index.nearest(to_hex(base ^ 0xFFFF0000FFFF0000), max_distance=3) is None
+
+    index.add("nearer", to_hex(nearer))
+    assert index.nearest(to_hex(nearer), max_distance=3) == "nearer"
+
+
+def test_first_chunk_in_a_file_is_the_canonical_one():
+    results = assign_duplicates(sign([("a", BODY), ("b", KPI_2022), ("c", BODY + "\n12\n")]))
+
+    assert [r["duplicate_of"] for r in results] == [None, None, "a"]
+    assert {r["version"] for r in results} == {DEDUP_VERSION}
+
+
+def test_long_chunks_are_not_collapsed_across_files():
+    assert len(normalize_text(BODY)) > BOILERPLATE_MAX_CHARS
+    canonical = [("other-file-body", to_hex(simhash(BODY)))]
+
+    results = assign_duplicates(sign([("a", BODY)]), canonical)
+
+    assert results[0]["duplicate_of"] is None
+
+
+def test_short_boilerplate_is_collapsed_across_files():
+    canonical = [("other-file-disclaimer", to_hex(simhash(DISCLAIMER)))]
+
+    results = assign_duplicates(sign([("a", DISCLAIMER), ("b", BODY)]), canonical)
+
+    assert [r["duplicate_of"] for r in results] == ["other-file-disclaimer", None]
@@ -0,0 +1,111 @@
+# =========================================================
+# 評価結果ストアのキー・無効化の確認（SQLite版）
+# =========================================================
+
+import pytest
+
+from common.evaluation_store import (
+    EvaluationKey,
+    SqliteEvaluationStore,
+    lookup,
+    principle_text_hash,
+)
+
+FILE_NAME = "report.pdf"
+PRINCIPLE = {"title": "原則1", "description": "運用受託機関は方針を公表すべきである。"}
+SPEC_VERSION = "fast-v1"
+CORPUS_VERSION = "12-345"
+
+
+def make_key(spec_version=SPEC_VERSION, corpus_version=CORPUS_VERSION, principle_data=PRINCIPLE):
+    return EvaluationKey(
+        file_name=FILE_NAME,
+        principle="原則1",
+        principle_hash=principle_text_hash(principle_data),
+        agent_spec_version=spec_version,
+        corpus_version=corpus_version,
+    )
+
+
+def make_result(**overrides):
+    result = {
+        "principle": "原則1",
+        "title": PRINCIPLE["title"],
+        "query": "方針の公表",
+        "response": "方針を公表している。",
+        "citations": [{"doc_title": FILE_NAME, "index": 1}],
+        "requirements": [{"requirement": "方針の公表", "status": "○"}],
+        "engine": "fast",
+    }
+    result.update(overrides)
+    return result
+
+
+@pytest.fixture
+def store():
+    return SqliteEvaluationStore()
+
+
+def test_saved_result_is_returned_with_requirements_and_engine(store):
+    store.save(make_key(), make_result())
+
+    stored = store.load_latest(FILE_NAME, SPEC_VERSION, CORPUS_VERSION)
+    result = lookup(stored, "原則1", principle_text_hash(PRINCIPLE))
+
+    assert result["response"] == "方針を公表している。"
+    assert result["citations"] == [{"doc_title": FILE_NAME, "index": 1}]
+    assert result["requirements"] == [{"requirement": "方針の公表", "status": "○"}]
+    assert result["engine"] == "fast"
+    assert result["cached"] is True
+
+
+def test_latest_result_wins(store):
+    store.save(make_key(), make_result(response="古い評価"))
+    store.save(make_key(), make_result(response="新しい評価"))
+
+    stored = store.load_latest(FILE_NAME, SPEC_VERSION, CORPUS_VERSION)
+
+    assert lookup(stored, "原則1", principle_text_hash(PRINCIPLE))["response"] == "新しい評価"
+
+
+def test_spec_version_change_is_a_miss(store):
+    store.save(make_key(), make_result())
+
+    assert store.load_latest(FILE_NAME, "fast-v2", CORPUS_VERSION) == {}
+
+
+def test_corpus_version_change_is_a_miss(store):
+    store.save(make_key(), make_result())
+
+    assert store.load_latest(FILE_NAME, SPEC_VERSION, "13-678") == {}
+
+
+def test_principle_text_change_is_a_miss(store):
+    store.save(make_key(), make_result())
+
+    changed = dict(PRINCIPLE, description="運用受託機関は方針を策定し、公表すべきである。")
+    stored = store.load_latest(FILE_NAME, SPEC_VERSION, CORPUS_VERSION)
+
+    assert lookup(stored, "原則1", principle_text_hash(changed)) is None
+
+
+@pytest.mark.parametrize("result", [
+    make_result(error_kind="timeout"),
+    make_result(response="エラー: Cortex Agentの応答がタイムアウトしました。"),
+])
+def test_error_results_are_not_stored(store, result):
+    store.save(make_key(), result)
+
+    assert store.load_latest(FILE_NAME, SPEC_VERSION, CORPUS_VERSION) == {}
+
+
+def test_results_without_engine_default_to_agent(store):
+    result = make_result()
+    del result["engine"], result["requirements"]
+    store.save(make_key(), result)
+
+    stored = store.load_latest(FILE_NAME, SPEC_VERSION, CORPUS_VERSION)
+    result = lookup(stored, "原則1", principle_text_hash(PRINCIPLE))
+
+    assert result["engine"] == "agent"
+    assert result["requirements"] == []
@@ -0,0 +1,88 @@
+# =========================================================
+# 高速評価エンジンの判定の解釈・結果の組み立ての確認
+# =========================================================
+
+from common.fast_evaluation import (
+    VERDICT_NONE,
+    VERDICT_PARTIAL,
+    VERDICT_SUPPORTED,
+    FastEvaluator,
+    RequirementEvaluation,
+    build_result,
+    parse_verdict,
+)
+from common.principles import Requirement
+
+PRINCIPLES = {
+    "原則1": {"title": "原則1のタイトル", "description": "○ 方針を公表している\n○ 体制を整備している"},
+    "原則2": {"title": "原則2のタイトル", "description": "○ 利益相反を管理している"},
+}
+
+EVIDENCE = [{"chunk_id": "c1", "chunk": "方針を公表", "file_name": "a.pdf", "page_index": 3}]
+
+
+def test_parse_verdict_reads_label_and_rationale():
+    verdict, rationale = parse_verdict("判定: 部分的に対応\n根拠: 方針はあるが\n体制の記載がない")
+
+    assert verdict == VERDICT_PARTIAL
+    assert rationale == "方針はあるが\n体制の記載がない"
+
+
+def test_parse_verdict_accepts_full_width_colon_and_icons():
+    assert parse_verdict("判定：対応している\n根拠：記載あり")[0] == VERDICT_SUPPORTED
+    assert parse_verdict("判定: ✅\n根拠: 記載あり")[0] == VERDICT_SUPPORTED
+
+
+def test_parse_verdict_defaults_to_no_information():
+    assert parse_verdict("") == (VERDICT_NONE, "")
+    verdict, rationale = parse_verdict("よくわかりません")
+    assert verdict == VERDICT_NONE
+    assert rationale == "よくわかりません"
+
+
+def test_build_result_renders_each_requirement_and_citation():
+    evaluations = [
+        RequirementEvaluation(Requirement("原則1", 1, "方針を公表している"), VERDICT_SUPPORTED, "公表済み", EVIDENCE),
+        RequirementEvaluation(Requirement("原則1", 2, "体制を整備している")),
+    ]
+
+    result = build_result("原則1", PRINCIPLES["原則1"], evaluations, elapsed_ms=12.34)
+
+    assert "**評価:** ✅ 対応している" in result["response"]
+    assert "**評価:** ❌ 情報なし" in result["response"]
+    assert "全2項目中、対応している: 1件、部分的に対応: 0件、情報なし: 1件です。" in result["response"]
+    assert result["citations"] == [{
+        "doc_title": "a.pdf", "chunk_id": "c1", "text": "方針を公表", "page_index": 3, "requirement_id": "原則1-1",
+    }]
+    assert [row["項目"] for row in result["requirements"]] == ["原則1-1", "原則1-2"]
+    assert result["engine"] == "fast" and result["elapsed_ms"] == 12.3
+
+
+def test_failed_requirement_marks_only_its_principle_as_partial_failure():
+    def search(query, file_name):
+        return "context", EVIDENCE
+
+    def complete(prompt):
+        if "体制を整備している" in prompt:
+            raise RuntimeError("throttled")
+        return "判定: 対応している\n根拠: 記載あり"
+
+    results = FastEvaluator(search, complete, max_workers=2).evaluate_many(PRINCIPLES, "a.pdf")
+
+    assert [r["principle"] for r in results] == ["原則1", "原則2"]
+    assert results[0]["error_kind"] == "partial_failure"
+    assert "error_kind" not in results[1]
+    assert "評価に失敗しました: throttled" in results[0]["response"]
+    assert results[1]["requirements"][0]["評価"] == "✅ 対応している"
+
+
+def test_requirement_without_search_results_skips_the_model():
+    def complete(prompt):
+        raise AssertionError("COMPLETE should not be called")
+
+    evaluation = FastEvaluator(lambda q, f: ("", []), complete).evaluate_requirement(
+        Requirement("原則2", 1, "利益相反を管理している"), "a.pdf"
+    )
+
+    assert evaluation.verdict == VERDICT_NONE
+    assert evaluation.error is None
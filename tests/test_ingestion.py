@@ -0,0 +1,56 @@
+# =========================================================
+# レポート取り込みのシャード分割の確認
+# =========================================================
+
+from common.ingestion import (
+    ROUTE_LAYOUT,
+    ROUTE_OCR,
+    ROUTE_TEXT,
+    PageProfile,
+    Shard,
+    _shard_pages,
+)
+
+
+def profiles(routes):
+    return [PageProfile(index, 0, 0.0, 0.0, route) for index, route in enumerate(routes)]
+
+
+def test_alternating_pages_share_one_shard_per_route():
+    routes = [ROUTE_TEXT, ROUTE_LAYOUT] * 10
+
+    groups = _shard_pages(profiles(routes), pages_per_shard=20)
+
+    assert groups == [(ROUTE_LAYOUT, tuple(range(1, 20, 2)))]
+
+
+def test_routes_are_kept_apart_and_split_by_size():
+    routes = [ROUTE_LAYOUT, ROUTE_OCR, ROUTE_TEXT, ROUTE_LAYOUT, ROUTE_OCR, ROUTE_LAYOUT]
+
+    groups = _shard_pages(profiles(routes), pages_per_shard=2)
+
+    assert groups == [
+        (ROUTE_LAYOUT, (0, 3)),
+        (ROUTE_OCR, (1, 4)),
+        (ROUTE_LAYOUT, (5,)),
+    ]
+
+
+def test_resolved_pages_are_skipped():
+    routes = [ROUTE_LAYOUT, ROUTE_LAYOUT, ROUTE_LAYOUT]
+
+    assert _shard_pages(profiles(routes), pages_per_shard=20, resolved={1}) == [(ROUTE_LAYOUT, (0, 2))]
+
+
+def test_shard_label_and_page_map():
+    shard = Shard(1, 2, 10, ROUTE_LAYOUT, b"", page_indices=(2, 3, 4, 7, 9))
+
+    assert shard.label == "p.3-5,8,10"
+    assert shard.page_map() == "[2, 3, 4, 7, 9]"
+
+
+def test_whole_file_shard_has_no_page_map():
+    shard = Shard(1, 0, 0, ROUTE_LAYOUT, b"")
+
+    assert shard.label == "全ページ"
+    assert shard.page_map() is None
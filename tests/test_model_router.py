@@ -0,0 +1,79 @@
+# =========================================================
+# モデルルーティング（判定・答え直し）の確認
+# =========================================================
+
+from common.completion_executor import CompletionResult
+from common.model_router import (
+    FAST_MODEL,
+    ROUTE_ESCALATED,
+    ROUTE_FAST,
+    ROUTE_LARGE,
+    ModelRouter,
+    classify,
+    needs_escalation,
+)
+
+LARGE_MODEL = "claude-4-sonnet"
+ROWS = [{"chunk": "GPIFの2023年度の運用資産額は245兆円で、ESG指数に連動する運用資産額は17兆円でした。"}]
+
+
+def test_short_lookup_with_matching_evidence_goes_to_the_fast_model():
+    decision = classify("GPIFの2023年度の運用資産額はいくら？", ROWS, LARGE_MODEL)
+
+    assert decision.route == ROUTE_FAST
+    assert decision.model == FAST_MODEL
+    assert decision.reasons == ["事実確認の質問"]
+
+
+def test_long_form_requests_go_to_the_large_model():
+    decision = classify("GPIFの運用資産額の推移を要約して", ROWS, LARGE_MODEL)
+
+    assert decision.route == ROUTE_LARGE
+    assert decision.model == LARGE_MODEL
+    assert "長文の回答が必要な依頼" in decision.reasons
+
+
+def test_low_confidence_and_follow_ups_go_to_the_large_model():
+    unrelated = [{"chunk": "CalPERS climate transition plan"}]
+
+    assert classify("GPIFの運用資産額はいくら？", unrelated, LARGE_MODEL).route == ROUTE_LARGE
+    assert classify("その金額はいくら？", ROWS, LARGE_MODEL).route == ROUTE_LARGE
+    assert classify("GPIFの運用資産額はいくら？", [], LARGE_MODEL).route == ROUTE_LARGE
+
+
+def test_translated_query_can_raise_the_confidence():
+    rows = [{"chunk": "CalPERS reported total plan assets of 502 billion dollars."}]
+
+    assert classify("CalPERSの資産総額はいくら？", rows, LARGE_MODEL).route == ROUTE_LARGE
+    decision = classify(
+        "CalPERSの資産総額はいくら？", rows, LARGE_MODEL, translated_query="CalPERS total plan assets",
+    )
+    assert decision.route == ROUTE_FAST
+
+
+def test_needs_escalation_only_for_refusals():
+    assert needs_escalation("")
+    assert needs_escalation("資料からは確認できませんでした。")
+    assert needs_escalation("該当する記載が見つかりません。" + "関連しそうな資料は次のとおりです。" * 10)
+    assert not needs_escalation("運用資産額は245兆円です。")
+    # 一部の項目だけが「記載がありません」の長い回答は答え直さない
+    assert not needs_escalation("運用資産額は245兆円です。" * 10 + "なお、2030年の目標は記載がありません。")
+
+
+def test_router_escalates_and_records_the_answering_model():
+    calls = []
+
+    def complete(model, prompt):
+        calls.append(model)
+        if model == FAST_MODEL:
+            return "資料からは確認できませんでした。"
+        return CompletionResult("245兆円です。", "llama4-maverick", 10.0, fell_back=True)
+
+    router = ModelRouter(complete)
+    answer = router.answer("GPIFの2023年度の運用資産額はいくら？", "prompt", ROWS, LARGE_MODEL)
+
+    assert calls == [FAST_MODEL, LARGE_MODEL]
+    assert answer.route == ROUTE_ESCALATED
+    assert answer.model == "llama4-maverick"
+    assert answer.answer == "245兆円です。"
+    assert [row["calls"] for row in router.stats_rows()] == [1]
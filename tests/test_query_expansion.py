@@ -0,0 +1,120 @@
+# =========================================================
+# 言語をまたぐ検索（英訳のキャッシュ・RRF）の確認
+# =========================================================
+
+import threading
+
+from common.completion_executor import CompletionExecutor, FlowPolicy, thread_starter
+from common.query_expansion import (
+    LANGUAGE_EN,
+    LANGUAGE_JA,
+    LANGUAGE_OTHER,
+    TRANSLATION_FLOW,
+    QueryTranslator,
+    detect_language,
+    fuse_results,
+)
+
+
+class FakeQueryLayer:
+    """翻訳キャッシュのテーブルの代わり（MERGE された訳を lookup で返す）"""
+
+    def __init__(self):
+        self.table = {}
+        self.calls = []
+
+    def collect(self, name, params=None):
+        self.calls.append(name)
+        if name == "translation_cache_merge":
+            self.table[params[0]] = params[4]
+        return []
+
+    def scalar(self, name, params=None, default=None):
+        self.calls.append(name)
+        if name == "translation_cache_lookup":
+            return self.table.get(params[0], default)
+        raise AssertionError(f"unexpected statement: {name}")
+
+
+def translator(complete_fn, timeout_sec=5.0):
+    executor = CompletionExecutor(
+        thread_starter(complete_fn),
+        {TRANSLATION_FLOW: FlowPolicy(timeout_sec=timeout_sec, hedge=False)},
+        sleep=lambda _: threading.Event().wait(0.01),
+    )
+    return QueryTranslator(FakeQueryLayer(), executor=executor)
+
+
+def test_detect_language():
+    assert detect_language("気候変動へのエンゲージメント方針") == LANGUAGE_JA
+    assert detect_language("気候変動 policy") == LANGUAGE_JA
+    assert detect_language("climate engagement policy") == LANGUAGE_EN
+    assert detect_language("2023") == LANGUAGE_OTHER
+
+
+def test_translation_is_cached_in_memory_and_table():
+    prompts = []
+
+    def complete(model, prompt):
+        prompts.append(prompt)
+        return "English query: climate engagement policy\n"
+
+    t = translator(complete)
+
+    assert t.translate("気候変動のエンゲージメント方針") == "climate engagement policy"
+    assert t.translate("  気候変動のエンゲージメント方針\n") == "climate engagement policy"
+    assert len(prompts) == 1
+    assert t.stats["completions"] == 1 and t.stats["memory_hits"] == 1
+
+    # 別のプロセス（メモリが空）でもテーブルから引ける
+    other = translator(complete)
+    other.query_layer = t.query_layer
+    assert other.translate("気候変動のエンゲージメント方針") == "climate engagement policy"
+    assert other.stats["table_hits"] == 1
+    assert len(prompts) == 1
+
+
+def test_translation_timeout_falls_back_to_the_original_query():
+    release = threading.Event()
+
+    def complete(model, prompt):
+        release.wait(5)
+        return "late translation"
+
+    t = translator(complete, timeout_sec=0.1)
+    try:
+        assert t.translate("議決権行使の方針") is None
+    finally:
+        release.set()
+    assert t.stats["timeouts"] == 1
+    assert "translation_cache_merge" not in t.query_layer.calls
+    assert t.cached("議決権行使の方針") is None
+
+
+def test_failed_translation_returns_none():
+    def complete(model, prompt):
+        raise RuntimeError("throttled")
+
+    t = translator(complete)
+
+    assert t.translate("議決権行使の方針") is None
+    assert t.stats["failures"] == 1
+
+
+def test_fuse_results_ranks_by_reciprocal_rank():
+    original = [{"chunk_id": "a"}, {"chunk_id": "b"}, {"chunk_id": "c"}]
+    translated = [{"chunk_id": "c"}, {"chunk_id": "d"}, {"chunk_id": "a"}]
+
+    fused = fuse_results([original, translated], num_results=3)
+
+    assert [row["chunk_id"] for row in fused] == ["a", "c", "b"]
+    assert [row["idx"] for row in fused] == [1, 2, 3]
+
+
+def test_fuse_results_ties_keep_the_original_order():
+    original = [{"chunk_id": "a"}]
+    translated = [{"chunk_id": "b"}]
+
+    fused = fuse_results([original, translated], num_results=5)
+
+    assert [row["chunk_id"] for row in fused] == ["a", "b"]